@@ -0,0 +1,53 @@
+"""catalogue_version
+
+Revision ID: 7d5456cde187
+Revises: 8256d13214af
+Create Date: 2026-10-19 14:02:47.118203
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7d5456cde187'
+down_revision: Union[str, Sequence[str], None] = '8256d13214af'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('catalogue_version',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.String(length=32), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.execute("INSERT INTO catalogue_version (id, version) VALUES (1, md5(random()::text || clock_timestamp()::text))")
+    # Any statement that changes products gets a new random version, committed
+    # (or rolled back) together with the change
+    op.execute("""
+        CREATE FUNCTION bump_catalogue_version() RETURNS trigger AS $$
+        BEGIN
+            UPDATE catalogue_version
+            SET version = md5(random()::text || clock_timestamp()::text), updated_at = now()
+            WHERE id = 1;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER products_catalogue_version
+        AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON products
+        FOR EACH STATEMENT EXECUTE FUNCTION bump_catalogue_version()
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER IF EXISTS products_catalogue_version ON products")
+    op.execute("DROP FUNCTION IF EXISTS bump_catalogue_version()")
+    op.drop_table('catalogue_version')
@@ -3,7 +3,7 @@ from typing import List
 from ..config.config import settings
 import requests
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..crud import (
@@ -11,6 +11,7 @@ from ..crud import (
     get_recommendations,
     handle_feedback,
     get_products_by_role,
+    get_recommender_metrics,
 )
 from ..database import get_session
 from ..schemas import RecommendationRead, FeedbackCreate, FeedbackRead, ProductRead
@@ -25,19 +26,25 @@ router = APIRouter()
 )
 async def get_recommendations_view(
     product_id: int,
+    response: Response,
     db: AsyncSession = Depends(get_session),
 ) -> List[RecommendationRead]:
     """
     Возвращает 20 самых похожих товаров для заданного product_id,
     отсортированных по similarity_score.
+
+    Если ранжирование не уложилось в бюджет времени, применённые
+    деградации перечисляются в заголовке X-Ranking-Degraded.
     """
     product = await get_product(db, product_id)
     if product is None:
         raise HTTPException(status_code=404, detail="Product not found")
 
-    recommendations: List[RecommendationRead] = await get_recommendations(
+    recommendations, degradations = await get_recommendations(
         db, product_id=product_id, limit=20
     )
+    if degradations:
+        response.headers["X-Ranking-Degraded"] = ",".join(degradations)
 
     return recommendations
 
@@ -82,6 +89,19 @@ async def get_main_products_view(
     return [ProductRead.model_validate(product) for product in products]
 
 
+@router.get(
+    "/metrics",
+    summary="Метрики рекомендателя",
+)
+async def get_metrics_view():
+    """
+    Возвращает счётчики рекомендателя: сколько раз кандидаты были
+    посчитаны и сколько одновременных запросов к тому же товару
+    получили уже идущий расчёт (ranking_coalesced).
+    """
+    return get_recommender_metrics()
+
+
 @router.get(
     "/check-ollama",
     summary="Проверить модели ollama"
@@ -34,6 +34,48 @@ class Settings(BaseSettings):
     MMR_LAMBDA: float = Field(0.7, env="MMR_LAMBDA")                  # Relevance weight (1-λ = diversity weight)
     MMR_MIN_SCORE: float = Field(0.2, env="MMR_MIN_SCORE")            # Minimum relevance threshold
     
+    # Top-K scoring (branch-and-bound: skip candidates whose score bound cannot reach the result)
+    TOP_K_PRUNING: bool = Field(True, env="TOP_K_PRUNING")             # Score only candidates that can make the list
+    TOP_K_BLOCK_SIZE: int = Field(64, env="TOP_K_BLOCK_SIZE")          # First scoring block (later blocks double)
+    
+    # Latency budget for one ranking (degrades instead of waiting on slow stages)
+    RANKING_DEADLINE_MS: int = Field(1000, env="RANKING_DEADLINE_MS")  # Per-request budget, 0 = unlimited
+    RECALL_BUDGET_SHARE: float = Field(0.7, env="RECALL_BUDGET_SHARE") # Share of the budget a source query may use
+    RECALL_CACHE_SIZE: int = Field(5000, env="RECALL_CACHE_SIZE")      # Last pgvector results kept for fallback
+    
+    # Candidate sources (recall), run in parallel and merged by reciprocal rank fusion
+    CANDIDATE_SOURCES: str = Field("vector", env="CANDIDATE_SOURCES")  # Comma-separated: vector, expert, dual, llm, feedback, lexical
+    RRF_K: float = Field(60.0, env="RRF_K")                            # Fusion constant: 1 / (RRF_K + rank)
+    CANDIDATE_SOURCE_WORKERS: int = Field(8, env="CANDIDATE_SOURCE_WORKERS")  # Threads shared by source queries
+    DUAL_EMBEDDING_WEIGHT: float = Field(0.5, env="DUAL_EMBEDDING_WEIGHT")  # dual: weight of embedding cosine
+    DUAL_EXPERT_WEIGHT: float = Field(0.5, env="DUAL_EXPERT_WEIGHT")        # dual: weight of expert_embedding cosine
+    
+    # Category complements (vector, expert and dual recall restricted to learned complementary categories)
+    COMPLEMENT_TOP_CATEGORIES: int = Field(10, env="COMPLEMENT_TOP_CATEGORIES")   # Categories searched per main category, 0 = off
+    COMPLEMENT_MIN_EVIDENCE: float = Field(5.0, env="COMPLEMENT_MIN_EVIDENCE")   # Feedback + LLM pairs needed to restrict a category
+    
+    # Circuit breaker per candidate source (pgvector: in-memory search while open)
+    SOURCE_CIRCUIT_FAILURES: int = Field(5, env="SOURCE_CIRCUIT_FAILURES")      # Consecutive failures to open
+    SOURCE_CIRCUIT_RESET_S: float = Field(30.0, env="SOURCE_CIRCUIT_RESET_S")   # Seconds open before a probe
+    
+    # Product snapshot (fast cold start, written by recsys.auto_preprocess)
+    SNAPSHOT_ENABLED: bool = Field(True, env="SNAPSHOT_ENABLED")       # Load products from snapshot if version matches
+    
+    # Feature engineering (recsys.feature_engineering)
+    FEATURE_WORKERS: int = Field(1, env="FEATURE_WORKERS")             # Processes building features, 1 = in-process, 0 = all cores
+    
+    # Embedding generation (recsys.embedding_generation, Ollama embed)
+    EMBEDDING_BATCH_SIZE: int = Field(32, env="EMBEDDING_BATCH_SIZE")   # Prompts per embed request
+    EMBEDDING_CONCURRENCY: int = Field(4, env="EMBEDDING_CONCURRENCY")  # Requests in flight (sliding window)
+    EMBEDDING_CACHE_ENABLED: bool = Field(True, env="EMBEDDING_CACHE_ENABLED")  # Reuse vectors from recsys/temp/embedding_cache_*
+    
+    # LLM recommendation generation (recsys.llm_generation, OpenAI-compatible chat API)
+    LLM_API_URL: str = Field("", env="LLM_API_URL")                    # Base URL, /chat/completions is appended; required
+    LLM_API_KEY: str = Field("", env="LLM_API_KEY")                    # Bearer token, empty = no auth header
+    LLM_MODEL: str = Field("gpt-4o-mini", env="LLM_MODEL")             # Part of the response cache key
+    LLM_CONCURRENCY: int = Field(8, env="LLM_CONCURRENCY")             # Requests in flight
+    LLM_TIMEOUT_S: float = Field(120.0, env="LLM_TIMEOUT_S")           # Per-request timeout
+    
     @property
     def ts_update_strength(self) -> float:
         """Get update strength based on DEMO_MODE"""
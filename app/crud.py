@@ -1,4 +1,5 @@
-from typing import Iterable, List, Optional
+import asyncio
+from typing import Dict, Iterable, List, Optional, Tuple
 
 from sqlalchemy import select, String, cast, text
 from sqlalchemy.orm import selectinload
@@ -32,15 +33,21 @@ async def get_recommendations(
     db: AsyncSession,    
     product_id: int,
     limit: int = 20,
-) -> List[RecommendationRead]:
+) -> Tuple[List[RecommendationRead], List[str]]:
     """
     Вернуть top-N рекомендованных товаров по product_id.
 
     Рекомендации загружаются вместе с recommended_product,
     чтобы избежать ленивых запросов внутри async-контекста.
+
+    Вторым элементом возвращается список применённых деградаций
+    (например, "cached_recall", "mmr_skipped"), если ранжирование
+    не уложилось в RANKING_DEADLINE_MS.
     """
     recommender = get_recommender()  # Use singleton
-    recommendations = recommender.get_ranking(product_id=product_id)
+    # В отдельном потоке: не блокирует event loop, и одновременные запросы
+    # одного product_id объединяются внутри рекомендателя (single flight)
+    recommendations, degradations = await asyncio.to_thread(recommender.rank, product_id)
 
 
     return [
@@ -51,7 +58,11 @@ async def get_recommendations(
             recommended_product=ProductRead.model_validate(r["recommended_product"]),
         )
         for r in recommendations
-    ]
+    ], degradations
+
+def get_recommender_metrics() -> Dict:
+    """Счётчики рекомендателя (в т.ч. число объединённых запросов)."""
+    return get_recommender().get_metrics()
 
 async def handle_feedback(
     db: AsyncSession,
@@ -46,6 +46,9 @@ class Product(Base):
     embedding: Mapped[Optional[NDArray[Shape["1024"], np.float32]]] = mapped_column(Vector(1024), nullable=True)
     expert_embedding: Mapped[Optional[NDArray[Shape["1024"], np.float32]]] = mapped_column(Vector(1024), nullable=True) 
     expert_reason: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    # sha256 of the embedding prompt and the model that embedded it (stale if either changes)
+    embedding_prompt_hash: Mapped[Optional[str]] = mapped_column(String(64), nullable=True)
+    embedding_model: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
 
 
 class Recommendation(Base):
@@ -160,4 +163,22 @@ class ArmStats(Base):
         __table_args__ = (
             Index("idx_llm_rec_main", "main_product_id"),
             Index("idx_llm_rec_matched", "matched_product_id"),
-        )
\ No newline at end of file
+        )
+
+class CatalogueVersion(Base):
+    """
+    Версия каталога (одна строка, id = 1).
+
+    Триггер на products (миграция 7d5456cde187) ставит новую случайную
+    версию при любом изменении товаров; по ней проверяется снапшот.
+    """
+
+    __tablename__ = "catalogue_version"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    version: Mapped[str] = mapped_column(String(32), nullable=False)
+    updated_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        nullable=False,
+    )
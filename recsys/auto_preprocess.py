@@ -3,6 +3,8 @@ Embedding Generation Pipeline (Docker Entry Point)
 
 This script is the entry point for Docker container.
 It orchestrates: model check/download → feature engineering → embedding generation
+(streamed chunk by chunk, no CSV) → LLM recommendations ingestion/resolution
+→ product snapshot
 
 """
 
@@ -118,27 +120,45 @@ async def main():
         print("FAILED: Could not get model")
         return False
     
-    # Step 3: Run feature engineering
+    # Step 3: Feature engineering + embedding generation, streamed chunk by chunk
     print("\n" + "-" * 80)
-    print("[Step 3] Feature Engineering")
+    print("[Step 3] Feature Engineering -> Embedding Generation (streaming)")
     print("-" * 80)
     
-    from recsys import feature_engineering
-    result = feature_engineering.main()
-    if result is None:
-        print("FAILED: Feature engineering failed")
+    from recsys import embedding_generation
+    success = await embedding_generation.main_streaming(ollama_url=settings.ollama_url)
+    if not success:
+        print("FAILED: Embedding generation failed")
         return False
     
-    # Step 4: Run embedding generation
+    # Step 4: Ingest precomputed LLM recommendations (temp/recommendations_output.json)
     print("\n" + "-" * 80)
-    print("[Step 4] Embedding Generation")
+    print("[Step 4] LLM Recommendations")
     print("-" * 80)
     
-    from recsys import embedding_generation
-    success = await embedding_generation.main(ollama_url=settings.ollama_url)
-    if not success:
-        print("FAILED: Embedding generation failed")
-        return False
+    from recsys import llm_recommendations, llm_resolver
+    try:
+        if not llm_recommendations.main():
+            print("WARNING: LLM recommendations were not ingested")
+        # Match new recommendation texts to accessories (cached texts are not re-embedded)
+        if not await llm_resolver.main(ollama_url=settings.ollama_url):
+            print("WARNING: Some LLM recommendations were not resolved")
+    except Exception as e:
+        # Not fatal: the llm candidate source just stays empty
+        print(f"WARNING: Could not ingest LLM recommendations - {e}")
+    
+    # Step 5: Write product snapshot for fast API startup
+    print("\n" + "-" * 80)
+    print("[Step 5] Product Snapshot")
+    print("-" * 80)
+    
+    from recsys.db_repository import export_snapshot
+    try:
+        snapshot_path = export_snapshot()
+        print(f"  Saved: {snapshot_path} ({snapshot_path.stat().st_size / 1024 / 1024:.1f} MB)")
+    except Exception as e:
+        # Not fatal: the API falls back to loading from the database
+        print(f"WARNING: Could not write product snapshot - {e}")
     
     return True
 
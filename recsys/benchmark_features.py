@@ -0,0 +1,144 @@
+"""
+Feature Engineering Benchmark: row-wise apply vs vectorized build_features
+(vs build_features_parallel with --workers)
+
+Builds a synthetic catalogue (names with packaging suffixes, messy
+whitespace, missing categories, key_params dicts, dimensions, long
+descriptions), then times the former row-wise path (DataFrame.apply over
+the per-row functions) against build_features and checks that both give
+byte-identical CSV output. No database needed.
+
+Usage: python recsys/benchmark_features.py [--rows N] [--runs N] [--workers N]
+"""
+import os
+import sys
+import time
+import argparse
+
+# Force set environment variables (before importing other modules!)
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5433")
+os.environ.setdefault("DB_USER", "postgres")
+os.environ.setdefault("DB_PASSWORD", "postgres")
+os.environ.setdefault("DB_DB", "recsys")
+os.environ.setdefault("OLLAMA_HOST", "localhost")
+os.environ.setdefault("OLLAMA_PORT", "11434")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import numpy as np
+import pandas as pd
+
+from recsys import feature_engineering as fe
+
+KEYS = ["Материал", "Цвет", "Длина", "Покрытие", "Форма", "Класс прочности",
+        "Тип головки", "Артикул", "Вес", "Бренд"]
+VALUES = ["сталь", "оцинкованная", "белый", "3000", "25 мм", "8.8", "потайная", 3.5, None]
+NAMES = ["Саморез по металлу 3.5x25, 1000 шт", "  Профиль  ПП\t60х27,  3м  ", "Гипсокартон Knauf 12.5 мм",
+         "Дюбель-гвоздь 6x40,", "Шпаклёвка\nфинишная, 25 кг", None, ""]
+CATEGORIES = ["Крепёж", "  Профили ", "Листовые материалы", "Сухие смеси", None, ""]
+PARENTS = ["Стройматериалы", " Инструменты ", None, ""]
+DESCRIPTIONS = ["  Предназначен для   крепления\nлистов  ", "Прочный, " * 40, "", None, "a\tb  c"]
+
+
+def make_catalogue(rows: int, seed: int = 0) -> pd.DataFrame:
+    """Synthetic products with the columns of load_data_from_db()"""
+    rng = np.random.default_rng(seed)
+
+    def pick(options, p_missing=0.0):
+        values = np.array(options, dtype=object)[rng.integers(0, len(options), rows)]
+        values[rng.random(rows) < p_missing] = None
+        return values
+
+    def dimension(options, p_missing):
+        values = np.array(options, dtype=np.float64)[rng.integers(0, len(options), rows)]
+        values[rng.random(rows) < p_missing] = np.nan
+        return values
+
+    key_param_pool = [
+        {key: VALUES[(i + j) % len(VALUES)] for j, key in enumerate(KEYS[i % 4:i % 4 + 1 + i % 6])}
+        for i in range(64)
+    ]
+    key_params = [key_param_pool[i] for i in rng.integers(0, len(key_param_pool), rows)]
+    names = pick(NAMES)
+    generated = rng.random(rows) < 0.8
+    names[generated] = [f"Товар {n}, вариант {n % 7}" for n in rng.integers(0, 10**6, int(generated.sum()))]
+
+    return pd.DataFrame({
+        'id': np.arange(1, rows + 1),
+        'name': names,
+        'category_name': pick(CATEGORIES),
+        'category_id': rng.integers(1, 500, rows).astype(str),
+        'price': dimension([10.5, 99.9, 1250, 0, 2.5], 0.05),
+        'parent_name': pick(PARENTS),
+        'weight_kg': dimension([0.5, 1.5, 25, 0.0], 0.5),
+        'volume_l': dimension([2.0, 10, 0.75], 0.6),
+        'length_mm': dimension([3000, 2500, 12.5], 0.6),
+        'key_params': key_params,
+        'description': pick(DESCRIPTIONS),
+        'product_role': pick(["сопутка", "основной товар"]),
+    })
+
+
+def build_features_rowwise(df: pd.DataFrame, whitelist) -> pd.DataFrame:
+    """Reference: the former per-row apply implementation of build_features"""
+    df = df.copy()
+    df['key_params_clean'] = df['key_params'].apply(lambda x: fe.clean_key_params(x, whitelist))
+    df['name_clean'] = df['name'].apply(fe.clean_name)
+    df['category_breadcrumb'] = df.apply(lambda row: fe.create_breadcrumb(row['parent_name'], row['category_name']), axis=1)
+    df['price_val'] = pd.to_numeric(df['price'], errors='coerce')
+    df['description'] = df['description'].apply(lambda x: fe.re.sub(r'\s+', ' ', str(x).strip()) if pd.notna(x) else "")
+    df['embedding_prompt'] = df.apply(fe.create_embedding_prompt, axis=1)
+    output_df = df[['id', 'name_clean', 'category_breadcrumb', 'product_role',
+                    'price_val', 'key_params_clean', 'embedding_prompt']].copy()
+    return output_df.rename(columns={'name_clean': 'name', 'key_params_clean': 'key_params'})
+
+
+def time_best(function, runs: int):
+    """(best wall time over runs, last result)"""
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=1_000_000, help="synthetic catalogue size")
+    parser.add_argument("--runs", type=int, default=1, help="runs per path (best is reported)")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="also time build_features_parallel with N processes (0 = one per core)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Feature Engineering Benchmark: row-wise vs vectorized")
+    print("=" * 60)
+
+    start = time.perf_counter()
+    df = make_catalogue(args.rows)
+    whitelist, _ = fe.generate_whitelist_from_data(df)
+    print(f"📦 {len(df)} synthetic products, {len(whitelist)} whitelisted keys "
+          f"({time.perf_counter() - start:.1f}s)")
+
+    print(f"\n⏱️ Feature build (best of {args.runs}):")
+    rowwise_time, expected = time_best(lambda: build_features_rowwise(df, whitelist), args.runs)
+    print(f"   {'row-wise':<12} {rowwise_time:8.2f} s")
+    vectorized_time, actual = time_best(lambda: fe.build_features(df, whitelist), args.runs)
+    print(f"   {'vectorized':<12} {vectorized_time:8.2f} s")
+
+    identical = expected.to_csv(index=False) == actual.to_csv(index=False)
+    if args.workers is not None:
+        parallel_time, parallel = time_best(
+            lambda: fe.build_features_parallel(df, whitelist, workers=args.workers), args.runs)
+        print(f"   {'parallel':<12} {parallel_time:8.2f} s  (workers={fe.feature_workers(args.workers)})")
+        identical = identical and expected.to_csv(index=False) == parallel.to_csv(index=False)
+    print(f"\n{'✅' if identical else '❌'} CSV output {'byte-identical' if identical else 'DIFFERS'}")
+    print(f"📈 Speedup: {rowwise_time / vectorized_time:.1f}x")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Memory Benchmark: per-product dicts vs ProductTable
+
+Builds a synthetic catalogue in both layouts and reports the memory held
+per product (tracemalloc). No database required.
+
+Usage: python recsys/benchmark_memory.py [--products 100000] [--dim 1024]
+"""
+import os
+import sys
+import gc
+import random
+import argparse
+import tracemalloc
+
+import numpy as np
+
+# Settings are required to import the recsys package (no connection is made)
+for _key, _value in {
+    "DB_HOST": "localhost", "DB_PORT": "5433", "DB_USER": "postgres",
+    "DB_PASSWORD": "postgres", "DB_DB": "recsys",
+    "OLLAMA_HOST": "localhost", "OLLAMA_PORT": "11434",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from recsys.product_table import ProductTable
+
+N_CATEGORIES = 300
+N_VENDORS = 500
+N_TYPES = 40
+
+
+def _fresh(value: str) -> str:
+    """New string object with the same content (like a fresh ORM row)"""
+    return (value + ".")[:-1]
+
+
+def make_rows(n: int, dim: int, seed: int = 42):
+    """Generate product dicts in the format ProductRepository used to store"""
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    categories = [f"Категория {i}" for i in range(N_CATEGORIES)]
+    vendors = [f"Производитель {i}" for i in range(N_VENDORS)]
+    types = [f"Тип работ {i}" for i in range(N_TYPES)]
+
+    for i in range(n):
+        category = rng.randrange(N_CATEGORIES)
+        yield {
+            "id": i + 1,
+            "name": f"Товар {i} {rng.random():.6f}, 10 шт",
+            "price": round(rng.uniform(10, 10000), 2),
+            "product_role": _fresh("сопутка" if rng.random() < 0.9 else "основной товар"),
+            "category_id": _fresh(str(category)),
+            "category_name": _fresh(categories[category]),
+            "type": _fresh(rng.choice(types)),
+            "parent_id": _fresh(str(category // 10)),
+            "parent_name": _fresh(categories[category // 10]),
+            "vendor": _fresh(rng.choice(vendors)),
+            "picture_url": f"https://example.com/img/{i}.jpg",
+            "url": f"https://example.com/product/{i}",
+            "description": f"Описание товара {i} " + "x" * rng.randrange(50, 300),
+            "weight_kg": rng.uniform(0.1, 50) if rng.random() < 0.5 else None,
+            "shipping_weight_kg": rng.uniform(0.1, 50),
+            "volume_l": None,
+            "length_mm": rng.uniform(10, 3000) if rng.random() < 0.3 else None,
+            "key_params": {_fresh("Материал"): _fresh("сталь"), _fresh("Цвет"): f"цвет {i % 20}"},
+            "embedding": np_rng.random(dim, dtype=np.float32) if dim else None,
+        }
+
+
+def measure(label: str, build, n: int):
+    """Measure memory retained by build() after it returns"""
+    gc.collect()
+    tracemalloc.start()
+    obj = build()
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"   {label:<28} {current / n:10.0f} B/product   "
+          f"total {current / 1024 / 1024:8.1f} MB   peak {peak / 1024 / 1024:8.1f} MB")
+    del obj
+    gc.collect()
+    return current
+
+
+def build_dicts(n: int, dim: int):
+    products = list(make_rows(n, dim))
+    product_map = {p["id"]: p for p in products}
+    return products, product_map
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--products", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=1024, help="embedding dimension (0 = no embeddings)")
+    args = parser.parse_args()
+    n, dim = args.products, args.dim
+
+    print("=" * 60)
+    print(f"Memory Benchmark: {n} products, embedding dim {dim}")
+    print("=" * 60)
+
+    before = measure("dict per product (+map)", lambda: build_dicts(n, dim), n)
+    after = measure("ProductTable (SoA)", lambda: ProductTable.from_rows(make_rows(n, dim), dim=dim), n)
+
+    print(f"\n📉 Per-product memory: {before / n:.0f} B -> {after / n:.0f} B "
+          f"({(1 - after / before) * 100:.1f}% less)")
+    if dim:
+        print(f"   (embedding payload: {dim * 4} B/product in both layouts)")
+
+
+if __name__ == "__main__":
+    main()
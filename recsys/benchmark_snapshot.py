@@ -0,0 +1,81 @@
+"""
+Cold Start Benchmark: ORM load vs product snapshot
+
+Measures ProductRepository startup time with SNAPSHOT_ENABLED off (ORM)
+and on (snapshot file). Writes the snapshot first if it is missing or stale.
+
+Usage: python recsys/benchmark_snapshot.py [--runs N]
+"""
+import os
+import sys
+import time
+import argparse
+
+# Force set environment variables (before importing other modules!)
+os.environ["DB_HOST"] = "localhost"
+os.environ["DB_PORT"] = "5433"
+os.environ["DB_USER"] = "postgres"
+os.environ["DB_PASSWORD"] = "postgres"
+os.environ["DB_DB"] = "recsys"
+os.environ.setdefault("OLLAMA_HOST", "localhost")
+os.environ.setdefault("OLLAMA_PORT", "11434")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine
+
+from app.config.config import settings
+from recsys import snapshot
+from recsys.db_repository import ProductRepository, export_snapshot
+
+
+def time_repository_load(use_snapshot: bool, runs: int) -> float:
+    """Best-of-N wall time to construct a ProductRepository"""
+    settings.SNAPSHOT_ENABLED = use_snapshot
+    best = float('inf')
+    for _ in range(runs):
+        start = time.perf_counter()
+        repo = ProductRepository()
+        best = min(best, time.perf_counter() - start)
+        count = len(repo.get_all_products())
+        repo.engine.dispose()
+    print(f"   {'snapshot' if use_snapshot else 'ORM':<10} {best * 1000:10.1f} ms  ({count} products)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="runs per mode (best is reported)")
+    args = parser.parse_args()
+
+    print("=" * 60)
+    print("Cold Start Benchmark: ORM vs snapshot")
+    print("=" * 60)
+
+    # Make sure an up-to-date snapshot exists
+    engine = create_engine(settings.database_url_sync, echo=False)
+    version = snapshot.get_catalogue_version(engine)
+    try:
+        snapshot.read_snapshot(snapshot.SNAPSHOT_FILE, expected_version=version)
+        print(f"📦 Using existing snapshot: {snapshot.SNAPSHOT_FILE}")
+    except (FileNotFoundError, snapshot.SnapshotVersionMismatch, ValueError):
+        start = time.perf_counter()
+        export_snapshot(engine)
+        print(f"📦 Snapshot written in {(time.perf_counter() - start) * 1000:.1f} ms")
+    print(f"   Size: {snapshot.SNAPSHOT_FILE.stat().st_size / 1024 / 1024:.1f} MB")
+
+    start = time.perf_counter()
+    snapshot.get_catalogue_version(engine)
+    version_ms = (time.perf_counter() - start) * 1000
+    engine.dispose()
+
+    print(f"\n⏱️ Repository load (best of {args.runs}):")
+    orm_time = time_repository_load(False, args.runs)
+    snapshot_time = time_repository_load(True, args.runs)
+
+    print(f"\n📈 Speedup: {orm_time / snapshot_time:.1f}x")
+    print(f"   (catalogue version check: {version_ms:.1f} ms of the snapshot time)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Candidate Batch - Struct-of-arrays candidates for one ranking request
+
+Recall fills rows/ids/similarity, _fill_candidates appends filler rows,
+_prepare_candidates adds the deterministic base-scoring columns. That
+batch is shared read-only by coalesced requests; each request's
+_calculate_scores returns a new batch with its own Thompson columns
+(block by block when the top-K scorer prunes the batch). Products are only
+materialized (ProductRecord -> dict) for the final selection.
+"""
+from dataclasses import dataclass, field, fields, replace
+from typing import List, Optional
+
+import numpy as np
+
+
+def _empty(dtype) -> np.ndarray:
+    return np.empty(0, dtype=dtype)
+
+
+@dataclass
+class CandidateBatch:
+    # Recall
+    rows: np.ndarray                                  # ProductTable rows
+    ids: np.ndarray                                   # Product ids
+    similarity: np.ndarray                            # Recall similarity, NaN if none
+    is_fill: np.ndarray                               # Added by _fill_candidates
+    search_method: str = "none"
+
+    # Base scoring (filled by RecommendationEngine._prepare_candidates)
+    price: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+    base_score: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+    init_similarity: np.ndarray = field(default_factory=lambda: _empty(np.float64))  # TS prior for new arms
+    price_factor: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+
+    # Thompson scoring (filled by RecommendationEngine._calculate_scores)
+    alpha: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+    beta: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+    thompson_weight: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+    score: np.ndarray = field(default_factory=lambda: _empty(np.float64))
+
+    @classmethod
+    def from_rows(cls, rows: np.ndarray, ids: np.ndarray,
+                  similarity: Optional[np.ndarray] = None,
+                  is_fill: bool = False, search_method: str = "none") -> "CandidateBatch":
+        rows = np.asarray(rows, dtype=np.int64)
+        n = len(rows)
+        if similarity is None:
+            similarity = np.full(n, np.nan)
+        return cls(
+            rows=rows,
+            ids=np.asarray(ids, dtype=np.int64),
+            similarity=np.asarray(similarity, dtype=np.float64),
+            is_fill=np.full(n, is_fill, dtype=np.bool_),
+            search_method=search_method,
+        )
+
+    @classmethod
+    def empty(cls, search_method: str = "none") -> "CandidateBatch":
+        return cls.from_rows(_empty(np.int64), _empty(np.int64), search_method=search_method)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def append(self, other: "CandidateBatch") -> "CandidateBatch":
+        """Recall columns of self followed by other (scoring columns are not carried)"""
+        return CandidateBatch(
+            rows=np.concatenate([self.rows, other.rows]),
+            ids=np.concatenate([self.ids, other.ids]),
+            similarity=np.concatenate([self.similarity, other.similarity]),
+            is_fill=np.concatenate([self.is_fill, other.is_fill]),
+            search_method=self.search_method,
+        )
+
+    def _array_fields(self) -> List[str]:
+        """Array columns that are populated (scoring columns are empty until scored)"""
+        return [f.name for f in fields(self)
+                if isinstance(getattr(self, f.name), np.ndarray) and len(getattr(self, f.name)) == len(self)]
+
+    def take(self, index) -> "CandidateBatch":
+        """Sub-batch by positions or slice (populated columns are carried)"""
+        return replace(self, **{name: getattr(self, name)[index] for name in self._array_fields()})
+
+    @classmethod
+    def concat(cls, batches: List["CandidateBatch"]) -> "CandidateBatch":
+        """Concatenate scored blocks of one batch"""
+        names = set.intersection(*(set(b._array_fields()) for b in batches))
+        return replace(batches[0], **{
+            name: np.concatenate([getattr(b, name) for b in batches]) for name in names
+        })
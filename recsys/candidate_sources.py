@@ -0,0 +1,337 @@
+"""
+Candidate Sources - Pluggable recall for RecommendationEngine
+
+Each source returns accessory rows for a main product in its own rank
+order. The engine runs the configured sources (CANDIDATE_SOURCES)
+concurrently under the request deadline and merges their lists with
+reciprocal rank fusion (reciprocal_rank_fusion) before scoring.
+
+Sources:
+- vector:   pgvector search over embedding (cached / in-memory fallback)
+- expert:   pgvector search from the main product's expert_embedding
+- dual:     in-memory search from embedding + expert_embedding (one matmul)
+- llm:      resolved llm_recommendations of the main product (in-memory index)
+- feedback: accessories liked together with those liked for the product (in-memory graph)
+- lexical:  BM25 over name / category / key_params (in-memory inverted index)
+
+Database sources (vector, expert) run under a share of the remaining budget
+(statement_timeout) and behind their own circuit breaker.
+"""
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .db_repository import ProductRepository
+from .deadline import Deadline
+from .product_table import ProductRecord
+
+logger = logging.getLogger(__name__)
+
+# Degradations reported by the vector source
+VECTOR_RECALL_TIMEOUT = "vector_recall_timeout"  # pgvector exceeded its share of the budget
+VECTOR_RECALL_ERROR = "vector_recall_error"      # pgvector failed
+VECTOR_CIRCUIT_OPEN = "vector_circuit_open"      # pgvector not called, circuit breaker open
+CACHED_RECALL = "cached_recall"                  # served the last pgvector result for the product
+MEMORY_RECALL = "memory_recall"                  # exact search over the in-memory embeddings
+
+# Degradations reported by the other sources / the engine ("<kind>:<source name>")
+SOURCE_TIMEOUT = "source_timeout"                # no result before the deadline
+SOURCE_ERROR = "source_error"                    # query failed
+SOURCE_CIRCUIT_OPEN = "source_circuit_open"      # query not sent, circuit breaker open
+
+# Postgres SQLSTATE query_canceled (statement_timeout)
+_PG_QUERY_CANCELED = "57014"
+
+
+def is_timeout(error: Exception) -> bool:
+    """Whether an exception is a budget / statement_timeout cancellation"""
+    return isinstance(error, TimeoutError) or \
+        getattr(getattr(error, 'orig', None), 'pgcode', None) == _PG_QUERY_CANCELED
+
+
+@dataclass
+class SourceResult:
+    rows: np.ndarray                                  # ProductTable rows, best first
+    similarity: Optional[np.ndarray] = None           # Embedding similarity (vector source only)
+    degradations: List[str] = field(default_factory=list)
+
+    @classmethod
+    def empty(cls, degradations: Optional[List[str]] = None) -> "SourceResult":
+        return cls(rows=np.empty(0, dtype=np.int64), degradations=degradations or [])
+
+
+class CandidateSource:
+    """Base class: recall(main_product, limit, deadline) -> SourceResult"""
+
+    name = "source"
+
+    def __init__(self, repo: ProductRepository):
+        self.repo = repo
+        self.breaker: Optional[CircuitBreaker] = None
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        raise NotImplementedError
+
+    def reset(self):
+        """Drop per-catalogue state (called on reload)"""
+
+
+class DatabaseSource(CandidateSource):
+    """Source backed by one ranked query, limited by the deadline and a circuit breaker"""
+
+    def __init__(self, repo: ProductRepository, budget_share: float = 0.7,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0):
+        super().__init__(repo)
+        self.budget_share = budget_share
+        self.breaker = CircuitBreaker(self.name, failure_threshold, reset_timeout)
+
+    def _query(self, product_id: int, limit: int, timeout_ms: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        raise NotImplementedError
+
+    def _timeout_ms(self, deadline: Deadline) -> Optional[int]:
+        """statement_timeout for the query (None = unlimited)"""
+        if deadline.unlimited:
+            return None
+        timeout_ms = int(deadline.remaining_ms() * self.budget_share)
+        if timeout_ms < 1:
+            raise TimeoutError(f"no time left for {self.name}")
+        return timeout_ms
+
+    def _call(self, product_id: int, limit: int, deadline: Deadline) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Query through the circuit breaker.
+
+        Running out of budget before the query starts is not a failure of the
+        database, so it is raised before the breaker is involved.
+        """
+        timeout_ms = self._timeout_ms(deadline)
+        return self.breaker.call(lambda: self._query(product_id, limit, timeout_ms))
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        try:
+            rows, _ = self._call(main_product['id'], limit, deadline)
+        except CircuitOpenError:
+            return SourceResult.empty([f"{SOURCE_CIRCUIT_OPEN}:{self.name}"])
+        except Exception as e:
+            timed_out = is_timeout(e)
+            logger.error(f"Candidate source {self.name} {'timed out' if timed_out else 'failed'}: {e}")
+            return SourceResult.empty([f"{SOURCE_TIMEOUT if timed_out else SOURCE_ERROR}:{self.name}"])
+        return SourceResult(rows=rows)
+
+
+class VectorSource(DatabaseSource):
+    """
+    pgvector search over embedding.
+
+    If the query times out, fails or the circuit is open, the last pgvector
+    result for the product is reused, else the in-memory embeddings are
+    searched; each step taken is reported as a degradation.
+    """
+
+    name = "vector"
+
+    def __init__(self, repo: ProductRepository, budget_share: float = 0.7,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, cache_size: int = 5000):
+        super().__init__(repo, budget_share, failure_threshold, reset_timeout)
+        # Last pgvector recall per (product_id, limit)
+        self._cache: "OrderedDict[tuple, Tuple[np.ndarray, np.ndarray]]" = OrderedDict()
+        self._cache_size = cache_size
+        self._lock = threading.Lock()
+
+    def _query(self, product_id: int, limit: int, timeout_ms: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.repo.search_similar_rows(product_id, limit=limit, timeout_ms=timeout_ms,
+                                             categories=self.repo.complement_categories(product_id))
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        table = self.repo.table
+        product_id = main_product['id']
+        cache_key = (product_id, limit)
+        degradations = []
+        try:
+            rows, similarity = self._call(product_id, limit, deadline)
+            if len(rows):
+                self._cache_put(cache_key, table.ids[rows], similarity)
+                logger.debug(f"Vector search returned {len(rows)} candidates")
+            return SourceResult(rows, similarity)
+        except CircuitOpenError:
+            # pgvector keeps failing: serve from memory instead of queueing on it
+            degradations.append(VECTOR_CIRCUIT_OPEN)
+        except Exception as e:
+            timed_out = is_timeout(e)
+            degradations.append(VECTOR_RECALL_TIMEOUT if timed_out else VECTOR_RECALL_ERROR)
+            logger.error(f"Vector search {'timed out' if timed_out else 'failed'}: {e}")
+
+        # Same candidates as the last successful pgvector search
+        cached = self._cache_get(cache_key)
+        if cached is not None:
+            degradations.append(CACHED_RECALL)
+            return SourceResult(*cached, degradations=degradations)
+
+        # Exact search over the embeddings already in memory
+        rows, similarity = self.repo.search_similar_rows_in_memory(
+            product_id, limit=limit, categories=self.repo.complement_categories(product_id))
+        if len(rows):
+            degradations.append(MEMORY_RECALL)
+        return SourceResult(rows, similarity, degradations)
+
+    def _cache_put(self, key: tuple, ids: np.ndarray, similarity: np.ndarray):
+        if self._cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = (ids, similarity)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+
+    def _cache_get(self, key: tuple) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Cached (rows, similarity) for key; ids are mapped to current table rows"""
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is None or len(cached[0]) == 0:
+            return None
+        ids, similarity = cached
+        rows = self.repo.table.rows_of(ids)
+        found = rows >= 0
+        return rows[found], similarity[found]
+
+    def reset(self):
+        with self._lock:
+            self._cache.clear()
+
+
+class ExpertVectorSource(DatabaseSource):
+    """pgvector search from the main product's expert_embedding to accessory embeddings"""
+
+    name = "expert"
+
+    def _query(self, product_id: int, limit: int, timeout_ms: Optional[int]) -> Tuple[np.ndarray, np.ndarray]:
+        return self.repo.search_expert_rows(product_id, limit=limit, timeout_ms=timeout_ms,
+                                            categories=self.repo.complement_categories(product_id))
+
+
+class LLMRecommendationSource(CandidateSource):
+    """
+    Resolved llm_recommendations of the main product, in resolved_rank order.
+
+    Served from the repository's in-memory index (loaded with the
+    products), so no query, breaker or timeout.
+    """
+
+    name = "llm"
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        rows, _ = self.repo.get_llm_recommendation_rows(main_product['id'], limit=limit)
+        return SourceResult(rows)
+
+
+class FeedbackCooccurrenceSource(CandidateSource):
+    """
+    Accessories liked together with the accessories liked for the main product.
+
+    Served from the repository's in-memory feedback graph (bulk-built at
+    load, updated on every positive feedback), so no query, breaker or timeout.
+    """
+
+    name = "feedback"
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        rows, _ = self.repo.get_feedback_cooccurrence_rows(main_product['id'], limit=limit)
+        return SourceResult(rows)
+
+
+class DualVectorSource(CandidateSource):
+    """
+    In-memory search from the main product's embedding and expert_embedding.
+
+    Both cosines come from one matmul and are fused with weights
+    (embedding, expert); no database query, so no breaker or timeout.
+    """
+
+    name = "dual"
+
+    def __init__(self, repo: ProductRepository, weights: Tuple[float, float] = (0.5, 0.5)):
+        super().__init__(repo)
+        self.weights = weights
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        product_id = main_product['id']
+        rows, similarity = self.repo.search_dual_rows_in_memory(
+            product_id, limit=limit, weights=self.weights,
+            categories=self.repo.complement_categories(product_id))
+        return SourceResult(rows, similarity)
+
+
+class LexicalSource(CandidateSource):
+    """
+    BM25 recall from the main product's text (ProductRepository.search_lexical_rows).
+
+    Works for products without embeddings. BM25 scores are not on the
+    similarity scale, so candidates are ranked for fusion only.
+    """
+
+    name = "lexical"
+
+    def recall(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> SourceResult:
+        rows, _ = self.repo.search_lexical_rows(main_product['id'], limit=limit)
+        return SourceResult(rows)
+
+
+SOURCE_TYPES: Dict[str, Callable[..., CandidateSource]] = {
+    VectorSource.name: VectorSource,
+    ExpertVectorSource.name: ExpertVectorSource,
+    DualVectorSource.name: DualVectorSource,
+    LLMRecommendationSource.name: LLMRecommendationSource,
+    FeedbackCooccurrenceSource.name: FeedbackCooccurrenceSource,
+    LexicalSource.name: LexicalSource,
+}
+
+
+def parse_source_names(value: str) -> List[str]:
+    """'vector, llm' -> ['vector', 'llm'] (validated, order kept)"""
+    names = [name.strip() for name in value.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SOURCE_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown candidate sources {unknown} (available: {list(SOURCE_TYPES)})")
+    return names
+
+
+# ============================================================================
+# Fusion
+# ============================================================================
+
+def reciprocal_rank_fusion(
+    ranked_rows: Sequence[np.ndarray],
+    k: float = 60.0,
+    weights: Optional[Sequence[float]] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge ranked row lists: score(row) = sum_s w_s / (k + rank_s(row)), rank from 1.
+
+    Ties keep the earliest appearance (earlier source first), so a single
+    list comes back in its own order.
+
+    Returns: (rows, fused score) ordered by fused score (descending)
+    """
+    if weights is None:
+        weights = [1.0] * len(ranked_rows)
+    ranked_rows = [np.asarray(rows, dtype=np.int64) for rows in ranked_rows]
+    if not ranked_rows or sum(len(rows) for rows in ranked_rows) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+
+    all_rows = np.concatenate(ranked_rows)
+    contributions = np.concatenate([
+        weight / (k + np.arange(1, len(rows) + 1)) for rows, weight in zip(ranked_rows, weights)
+    ])
+
+    unique_rows, inverse = np.unique(all_rows, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions, minlength=len(unique_rows))
+    first_seen = np.full(len(unique_rows), len(all_rows), dtype=np.int64)
+    np.minimum.at(first_seen, inverse, np.arange(len(all_rows)))
+
+    order = np.lexsort((first_seen, -fused))
+    return unique_rows[order], fused[order]
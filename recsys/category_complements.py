@@ -0,0 +1,93 @@
+"""
+Category Complements - Which accessory categories go with a main category
+
+A dense (C x C) matrix over the category_id codes of a ProductTable:
+score[main category, accessory category] sums the evidence that accessories
+of the second category complement products of the first
+(гипсокартон -> профили, саморезы, шпаклёвка):
+- positive feedback edges (feedback graph), FEEDBACK_WEIGHT per feedback row
+- resolved LLM recommendations (llm index), LLM_WEIGHT per recommendation
+
+Vector recall of a main product is restricted to the top categories of its
+category row, which shrinks the searched set and drops same-category
+look-alikes (another sheet of plasterboard is similar, not an accessory).
+Categories with too little evidence are not restricted.
+"""
+import logging
+import threading
+from typing import Optional
+
+import numpy as np
+
+from .feedback_graph import FeedbackGraph
+from .llm_recommendations import LLMRecommendationIndex
+from .product_table import ProductTable
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+FEEDBACK_WEIGHT = 1.0    # Per positive feedback row
+LLM_WEIGHT = 1.0         # Per resolved LLM recommendation
+
+CATEGORY_COLUMN = "category_id"
+
+
+class CategoryComplements:
+    """Thread-safe category x category complement scores (codes of table.interned['category_id'])"""
+
+    def __init__(self, table: ProductTable, matrix: Optional[np.ndarray] = None):
+        self._codes = table.interned[CATEGORY_COLUMN].codes
+        self.categories = table.interned[CATEGORY_COLUMN].values
+        n = len(self.categories)
+        self.matrix = np.zeros((n, n), dtype=np.float32) if matrix is None else matrix
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        table: ProductTable,
+        feedback_graph: Optional[FeedbackGraph] = None,
+        llm_index: Optional[LLMRecommendationIndex] = None,
+    ) -> "CategoryComplements":
+        """Complement scores from the feedback graph and the LLM index (no query)"""
+        complements = cls(table)
+        if feedback_graph is not None:
+            main_rows, accessory_rows, counts = feedback_graph.edges()
+            complements._add_edges(main_rows, accessory_rows, counts * FEEDBACK_WEIGHT)
+        if llm_index is not None and len(llm_index):
+            main_ids, matched_ids = llm_index.pairs()
+            main_rows, matched_rows = table.rows_of(main_ids), table.rows_of(matched_ids)
+            known = (main_rows >= 0) & (matched_rows >= 0)
+            complements._add_edges(main_rows[known], matched_rows[known],
+                                   np.full(int(known.sum()), LLM_WEIGHT))
+        return complements
+
+    def _add_edges(self, main_rows: np.ndarray, accessory_rows: np.ndarray, weights: np.ndarray):
+        with self._lock:
+            np.add.at(self.matrix, (self._codes[main_rows], self._codes[accessory_rows]), weights)
+
+    def add(self, main_row: int, accessory_row: int, weight: float = FEEDBACK_WEIGHT):
+        """One more piece of evidence (a positive feedback)"""
+        with self._lock:
+            self.matrix[self._codes[main_row], self._codes[accessory_row]] += weight
+
+    def top_categories(self, row: int, k: int, min_evidence: float = 0.0) -> Optional[np.ndarray]:
+        """
+        Category codes with the k highest complement scores for a product's
+        category (scores > 0 only).
+
+        Returns: None if the category has less than min_evidence in total
+            (recall should not be restricted)
+        """
+        if k <= 0:
+            return None
+        scores = self.matrix[self._codes[row]]
+        if scores.sum() < max(min_evidence, np.finfo(np.float32).tiny):
+            return None
+        codes = np.flatnonzero(scores > 0)
+        if len(codes) > k:
+            codes = codes[np.argsort(-scores[codes], kind='stable')[:k]]
+        return np.sort(codes)
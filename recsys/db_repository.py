@@ -5,7 +5,9 @@ Database Access Layer - Handles all database operations
 import logging
 import os
 import sys
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+import numpy as np
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
@@ -14,172 +16,531 @@ from sqlalchemy.orm import Session
 from app.config.config import settings
 from app.models import Product
 
+from . import snapshot
+from .category_complements import CategoryComplements
+from .feedback_graph import FeedbackGraph, load_graph as load_feedback_graph
+from .lexical_index import LexicalIndex, product_text
+from .llm_recommendations import LLMRecommendationIndex, load_index as load_llm_index
+from .product_table import ProductTable, ProductRecord
+
 # Configure logging
 logger = logging.getLogger(__name__)
 
+MAIN_ROLE = 'основной товар'
+ACCESSORY_ROLE = 'сопутка'
+
+
+def _product_to_dict(p: Product) -> Dict:
+    """Convert an ORM Product into the in-memory dict format"""
+    return {
+        # Core fields
+        "id": p.id,
+        "name": p.name,
+        "price": p.price,
+        "product_role": p.product_role,
+        
+        # Category fields
+        "category_id": p.category_id,
+        "category_name": getattr(p, 'category_name', ''),
+        
+        # Type/Classification fields
+        "type": getattr(p, 'type', ''),  # Replaces white_box_type
+        "parent_id": getattr(p, 'parent_id', ''),
+        "parent_name": getattr(p, 'parent_name', ''),
+        
+        # Product details
+        "vendor": getattr(p, 'vendor', ''),
+        "picture_url": getattr(p, 'picture_url', ''),
+        "url": getattr(p, 'url', ''),
+        "description": getattr(p, 'description', ''),
+        
+        # Physical attributes
+        "weight_kg": getattr(p, 'weight_kg', None),
+        "shipping_weight_kg": getattr(p, 'shipping_weight_kg', None),
+        "volume_l": getattr(p, 'volume_l', None),
+        "length_mm": getattr(p, 'length_mm', None),
+        
+        # Additional params
+        "key_params": getattr(p, 'key_params', {}) or {},
+        
+        # Embedding vector (for similarity search)
+        "embedding": getattr(p, 'embedding', None),
+        "expert_embedding": getattr(p, 'expert_embedding', None),
+    }
+
 
 class ProductRepository:
     
     def __init__(self):
         """Initialize the database connection and load products"""
         self.engine = create_engine(settings.database_url_sync, echo=False)
-        self._products: List[Dict] = []
-        self._product_map: Dict = {}
+        self._table: ProductTable = ProductTable.from_rows([])
+        self._llm_index = LLMRecommendationIndex.empty()
+        self._lexical_index = LexicalIndex.empty()
+        self._feedback_graph = FeedbackGraph.empty()
+        self._complements = CategoryComplements(self._table)
         self._load_products()
     
     def _load_products(self):
-        """Load all products from the database to memory"""
+        """
+        Load all products to memory.
+        
+        Uses the on-disk snapshot when it matches the current catalogue
+        version, otherwise falls back to the ORM.
+        """
+        table = None
+        source = "database"
+        if settings.SNAPSHOT_ENABLED:
+            table = self._load_table_from_snapshot()
+            if table is not None:
+                source = "snapshot"
+        
+        if table is None:
+            table = self._load_table_from_orm()
+        
+        self._table = table
+        
+        logger.info(f"Loaded {len(self._table)} products from {source}")
+        
+        self._lexical_index = LexicalIndex.build(table, self.get_accessory_rows())
+        self._load_llm_index()
+        self._load_feedback_graph()
+        self._complements = CategoryComplements.build(table, self._feedback_graph, self._llm_index)
+    
+    def _load_llm_index(self):
+        """Resolved LLM recommendations to memory (empty if the table is unavailable)"""
+        try:
+            self._llm_index = load_llm_index(self.engine)
+        except Exception as e:
+            logger.warning(f"Could not load LLM recommendations: {e}")
+            self._llm_index = LLMRecommendationIndex.empty()
+            return
+        logger.info(f"Loaded {len(self._llm_index)} LLM recommendations "
+                    f"for {self._llm_index.product_count} products")
+    
+    def _load_feedback_graph(self):
+        """Positive feedback to memory as a graph over table rows (empty if unavailable)"""
+        try:
+            self._feedback_graph = load_feedback_graph(self.engine, self._table)
+        except Exception as e:
+            logger.warning(f"Could not load feedback graph: {e}")
+            self._feedback_graph = FeedbackGraph.empty(len(self._table))
+            return
+        logger.info(f"Loaded feedback graph: {self._feedback_graph.edge_count} edges")
+    
+    def _load_table_from_orm(self) -> ProductTable:
+        """Load all products through the ORM"""
         with Session(self.engine) as session:
             products = session.execute(select(Product)).scalars().all()
-            
-            self._products = []
-            self._product_map = {}
-            
-            for p in products:
-                product_dict = {
-                    # Core fields
-                    "id": p.id,
-                    "name": p.name,
-                    "price": p.price,
-                    "product_role": p.product_role,
-                    
-                    # Category fields
-                    "category_id": p.category_id,
-                    "category_name": getattr(p, 'category_name', ''),
-                    
-                    # Type/Classification fields
-                    "type": getattr(p, 'type', ''),  # Replaces white_box_type
-                    "parent_id": getattr(p, 'parent_id', ''),
-                    "parent_name": getattr(p, 'parent_name', ''),
-                    
-                    # Product details
-                    "vendor": getattr(p, 'vendor', ''),
-                    "picture_url": getattr(p, 'picture_url', ''),
-                    "url": getattr(p, 'url', ''),
-                    "description": getattr(p, 'description', ''),
-                    
-                    # Physical attributes
-                    "weight_kg": getattr(p, 'weight_kg', None),
-                    "shipping_weight_kg": getattr(p, 'shipping_weight_kg', None),
-                    "volume_l": getattr(p, 'volume_l', None),
-                    "length_mm": getattr(p, 'length_mm', None),
-                    
-                    # Additional params
-                    "key_params": getattr(p, 'key_params', {}) or {},
-                    
-                    # Embedding vector (for similarity search)
-                    "embedding": getattr(p, 'embedding', None),
-                }
-                
-                self._products.append(product_dict)
-                self._product_map[p.id] = product_dict
-        
-        logger.info(f"Loaded {len(self._products)} products from database")
+            return ProductTable.from_rows(_product_to_dict(p) for p in products)
+    
+    def _load_table_from_snapshot(self) -> Optional[ProductTable]:
+        """Load products from the snapshot file, None if missing or stale"""
+        path = snapshot.SNAPSHOT_FILE
+        if not path.exists():
+            logger.info(f"No product snapshot at {path}, loading from database")
+            return None
+        
+        try:
+            version = snapshot.get_catalogue_version(self.engine)
+            return snapshot.read_snapshot(path, expected_version=version)
+        except snapshot.SnapshotVersionMismatch as e:
+            logger.warning(f"Product snapshot is stale: {e}")
+        except Exception as e:
+            logger.warning(f"Could not read product snapshot: {e}")
+        return None
     
     def reload(self):
         self._load_products()
     
-    def get_all_products(self) -> List[Dict]:
-        return self._products
+    @property
+    def table(self) -> ProductTable:
+        return self._table
+    
+    @property
+    def llm_index(self) -> LLMRecommendationIndex:
+        return self._llm_index
+    
+    @property
+    def lexical_index(self) -> LexicalIndex:
+        return self._lexical_index
+    
+    @property
+    def feedback_graph(self) -> FeedbackGraph:
+        return self._feedback_graph
     
-    def get_product_by_id(self, product_id: int) -> Optional[Dict]:
-        return self._product_map.get(product_id)
+    @property
+    def complements(self) -> CategoryComplements:
+        return self._complements
     
-    def get_main_products(self) -> List[Dict]:
+    def get_all_products(self) -> List[ProductRecord]:
+        return self._table.records(range(len(self._table)))
+    
+    def get_product_by_id(self, product_id: int) -> Optional[ProductRecord]:
+        row = self._table.row_of(product_id)
+        return None if row is None else self._table.record(row)
+    
+    def get_main_products(self) -> List[ProductRecord]:
         #Get all main products (product_role='основной товар')
-        return [p for p in self._products if p.get('product_role') == 'основной товар']
+        return self._table.records(self._table.rows_where(product_role=MAIN_ROLE))
     
-    def get_accessory_products(self) -> List[Dict]:
+    def get_accessory_products(self) -> List[ProductRecord]:
         #Get all accessory products (product_role='сопутка')
-        return [p for p in self._products if p.get('product_role') == 'сопутка']
+        return self._table.records(self._table.rows_where(product_role=ACCESSORY_ROLE))
+    
+    def get_accessory_rows(self) -> np.ndarray:
+        #Table rows of all accessory products, ascending by id (precomputed, read-only)
+        return self._table.rows_where(product_role=ACCESSORY_ROLE)
     
-    def get_products_by_type(self, product_type: str, role: str = None) -> List[Dict]:
+    def is_accessory(self, rows: np.ndarray) -> np.ndarray:
+        #Boolean mask: which table rows are accessories (compares interned role codes, O(len(rows)))
+        role = self._table.interned['product_role']
+        code = role.code_of(ACCESSORY_ROLE)
+        if code is None:
+            return np.zeros(len(rows), dtype=np.bool_)
+        return role.codes[rows] == code
+    
+    def get_products_by_type(self, product_type: str, role: str = None) -> List[ProductRecord]:
         #Get products by type 
-        result = []
-        for p in self._products:
-            if p.get('type') == product_type:
-                if role is None or p.get('product_role') == role:
-                    result.append(p)
-        return result
-    
-    def get_products_by_category(self, category_name: str = None, category_id: str = None) -> List[Dict]:
+        if role is None:
+            rows = self._table.rows_where(type=product_type)
+        else:
+            rows = self._table.rows_where(product_role=role, type=product_type)
+        return self._table.records(rows)
+    
+    def get_products_by_category(self, category_name: str = None, category_id: str = None) -> List[ProductRecord]:
         #Get products by category name or ID
-        result = []
-        for p in self._products:
-            if category_name and p.get('category_name') == category_name:
-                result.append(p)
-            elif category_id and p.get('category_id') == category_id:
-                result.append(p)
-        return result
-    
-    def get_candidates(self, product_type: str = None, exclude_id: int = None) -> List[Dict]:
+        by_name = self._table.rows_where(category_name=category_name) if category_name else None
+        by_id = self._table.rows_where(category_id=category_id) if category_id else None
+        
+        if by_name is not None and by_id is not None:
+            rows = np.union1d(by_name, by_id)
+        else:
+            rows = by_name if by_name is not None else by_id
+        
+        return self._table.records(rows if rows is not None else [])
+    
+    def get_candidates(self, product_type: str = None, exclude_id: int = None) -> List[ProductRecord]:
         #Get candidate accessory products
-        candidates = []
-        for p in self._products:
-            # Must be accessory product
-            if p.get('product_role') != 'сопутка':
-                continue
-            
-            # Exclude specified product
-            if p.get('id') == exclude_id:
-                continue
-            
-            # Filter by type if specified
-            if product_type is not None and p.get('type') != product_type:
-                continue
-            
-            candidates.append(p)
-        
-        return candidates
-    
-    def get_products_with_embeddings(self) -> List[Dict]:
+        if product_type is None:
+            rows = self._table.rows_where(product_role=ACCESSORY_ROLE)
+        else:
+            rows = self._table.rows_where(product_role=ACCESSORY_ROLE, type=product_type)
+        
+        # Exclude specified product
+        if exclude_id is not None:
+            rows = rows[self._table.ids[rows] != exclude_id]
+        
+        return self._table.records(rows)
+    
+    def get_products_with_embeddings(self) -> List[ProductRecord]:
         # Get all products that have embeddings
-        return [p for p in self._products if p.get('embedding') is not None]
+        return self._table.records(np.flatnonzero(self._table.has_embedding))
+    
+    def get_similar_products_by_vector(self, product_id: int, limit: int = 20) -> List[Tuple[ProductRecord, float]]:
+        """
+        pgvector similarity search.
+        
+        Returns: [(product, similarity)] ordered by similarity (descending).
+        """
+        rows, similarity = self.search_similar_rows(product_id, limit)
+        return list(zip(self._table.records(rows), similarity.tolist()))
     
-    def get_similar_products_by_vector(self, product_id: int, limit: int = 20) -> List[Dict]:
+    def _fetch_ranked_rows(
+        self, 
+        query, 
+        params: Dict, 
+        timeout_ms: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Run a query returning (id, score) rows and map ids to table rows.
         
-        results = []
+        Args:
+            timeout_ms: statement_timeout for this query (Postgres cancels it
+                and the call raises OperationalError with pgcode 57014)
         
+        Returns: (rows, score) arrays in query order.
+        Only ids and scores are fetched; product data comes from memory.
+        """
         with Session(self.engine) as session:
-            # Use pgvector cosine distance (<=> operator)
-            # Cosine distance range: 0 (identical) ~ 2 (opposite)
-            # Convert to similarity: 1 - distance/2, so range becomes 0~1
-            query = text("""
-                SELECT p2.id, p2.name, p2.product_role, p2.price, 
-                       p2.category_name, p2.vendor, p2.picture_url,
-                       p2.type, p2.description, p2.url,
-                       (1.0 - (p1.embedding <=> p2.embedding) / 2.0) as similarity
-                FROM products p1, products p2
-                WHERE p1.id = :product_id
-                  AND p2.id != :product_id
-                  AND p1.embedding IS NOT NULL
-                  AND p2.embedding IS NOT NULL
-                  AND p2.product_role = 'сопутка'
-                ORDER BY p1.embedding <=> p2.embedding
-                LIMIT :limit
-            """)
-            
-            result = session.execute(query, {
-                "product_id": product_id,
-                "limit": limit
-            })
-            
-            for row in result:
-                results.append({
-                    "id": row.id,
-                    "name": row.name,
-                    "product_role": row.product_role,
-                    "price": row.price,
-                    "category_name": row.category_name,
-                    "vendor": row.vendor,
-                    "picture_url": row.picture_url,
-                    "type": row.type,
-                    "description": row.description,
-                    "url": row.url,
-                    "similarity": float(row.similarity) if row.similarity else 0.0
-                })
-        
-        return results
+            if timeout_ms is not None:
+                # Transaction-local, the pooled connection keeps its default
+                session.execute(text("SELECT set_config('statement_timeout', :ms, true)"),
+                                {"ms": str(max(1, int(timeout_ms)))})
+            result = session.execute(query, params).all()
+        
+        ids = np.array([row[0] for row in result], dtype=np.int64)
+        score = np.array([float(row[1]) if row[1] else 0.0 for row in result], dtype=np.float64)
+        
+        # Products added after the last load are skipped until reload()
+        rows = self._table.rows_of(ids)
+        found = rows >= 0
+        return rows[found], score[found]
+    
+    def _category_filter(self, categories: Optional[np.ndarray]) -> Tuple[str, Dict]:
+        """
+        SQL condition and params restricting p2 to category codes (none if
+        None or empty). A NULL category_id among the codes matches accessories
+        without a category, as in _accessory_rows_in().
+        """
+        if categories is None or len(categories) == 0:
+            return "", {}
+        values = [self._complements.categories[code] for code in categories.tolist()]
+        category_ids = [value for value in values if value is not None]
+        conditions = ["p2.category_id = ANY(:category_ids)"] if category_ids else []
+        if len(category_ids) < len(values):
+            conditions.append("p2.category_id IS NULL")
+        params = {"category_ids": category_ids} if category_ids else {}
+        return f"AND ({' OR '.join(conditions)})", params
+    
+    def search_similar_rows(
+        self, 
+        product_id: int, 
+        limit: int = 20, 
+        timeout_ms: Optional[int] = None,
+        categories: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        pgvector similarity search returning table rows.
+        
+        Args:
+            categories: category_id codes the accessories must be in
+                (complement_categories()), None = all accessories
+        
+        Returns: (rows, similarity) arrays ordered by similarity (descending).
+        """
+        category_filter, params = self._category_filter(categories)
+        # Use pgvector cosine distance (<=> operator)
+        # Cosine distance range: 0 (identical) ~ 2 (opposite)
+        # Convert to similarity: 1 - distance/2, so range becomes 0~1
+        query = text(f"""
+            SELECT p2.id,
+                   (1.0 - (p1.embedding <=> p2.embedding) / 2.0) as similarity
+            FROM products p1, products p2
+            WHERE p1.id = :product_id
+              AND p2.id != :product_id
+              AND p1.embedding IS NOT NULL
+              AND p2.embedding IS NOT NULL
+              AND p2.product_role = 'сопутка'
+              {category_filter}
+            ORDER BY p1.embedding <=> p2.embedding
+            LIMIT :limit
+        """)
+        return self._fetch_ranked_rows(query, {"product_id": product_id, "limit": limit, **params}, timeout_ms)
+    
+    def search_expert_rows(
+        self, 
+        product_id: int, 
+        limit: int = 20, 
+        timeout_ms: Optional[int] = None,
+        categories: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        pgvector search from the main product's expert_embedding to accessory embeddings.
+        
+        Args:
+            categories: as in search_similar_rows()
+        
+        Returns: (rows, similarity) arrays ordered by similarity (descending)
+        """
+        category_filter, params = self._category_filter(categories)
+        query = text(f"""
+            SELECT p2.id,
+                   (1.0 - (p1.expert_embedding <=> p2.embedding) / 2.0) as similarity
+            FROM products p1, products p2
+            WHERE p1.id = :product_id
+              AND p2.id != :product_id
+              AND p1.expert_embedding IS NOT NULL
+              AND p2.embedding IS NOT NULL
+              AND p2.product_role = 'сопутка'
+              {category_filter}
+            ORDER BY p1.expert_embedding <=> p2.embedding
+            LIMIT :limit
+        """)
+        return self._fetch_ranked_rows(query, {"product_id": product_id, "limit": limit, **params}, timeout_ms)
+    
+    def get_llm_recommendation_rows(self, product_id: int, limit: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Resolved LLM recommendations of a main product, from the in-memory index.
+        
+        Returns: (rows, match_score) arrays in resolved_rank order; products
+        missing from the table are skipped
+        """
+        ids, scores = self._llm_index.lookup(product_id)
+        rows = self._table.rows_of(ids)
+        found = rows >= 0
+        return rows[found][:limit], scores[found][:limit]
+    
+    def search_lexical_rows(self, product_id: int, limit: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 search of the accessories from the product's name, category_name
+        and key_params (in-memory inverted index, works without embeddings).
+        
+        Returns: (rows, BM25 score) arrays ordered by score (descending)
+        """
+        row = self._table.row_of(product_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return self._lexical_index.search(product_text(self._table, row), limit=limit, exclude_row=row)
+    
+    def get_feedback_cooccurrence_rows(self, product_id: int, limit: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Accessories liked together with the accessories liked for this product.
+        
+        For every accessory with positive feedback under product_id, count the
+        positive feedback of accessories rated positively under the same main
+        products (the liked accessories themselves included), from the
+        in-memory feedback graph.
+        
+        Returns: (rows, co-occurrence count) arrays, most frequent first
+        """
+        row = self._table.row_of(product_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        return self._feedback_graph.recall(row, limit=limit)
+    
+    def add_feedback(self, product_id: int, recommended_product_id: int):
+        """Add a positive feedback edge to the in-memory feedback graph and category complements"""
+        row = self._table.row_of(product_id)
+        recommended_row = self._table.row_of(recommended_product_id)
+        if row is not None and recommended_row is not None:
+            self._feedback_graph.add(row, recommended_row)
+            self._complements.add(row, recommended_row)
+    
+    def complement_categories(self, product_id: int) -> Optional[np.ndarray]:
+        """
+        category_id codes vector recall of a main product is restricted to:
+        the COMPLEMENT_TOP_CATEGORIES categories with the highest complement
+        scores for its category.
+        
+        Returns: None if recall should not be restricted (disabled, unknown
+            product, or less than COMPLEMENT_MIN_EVIDENCE for the category)
+        """
+        row = self._table.row_of(product_id)
+        if row is None:
+            return None
+        return self._complements.top_categories(row, settings.COMPLEMENT_TOP_CATEGORIES,
+                                                settings.COMPLEMENT_MIN_EVIDENCE)
+    
+    def _accessory_rows_in(self, categories: Optional[np.ndarray]) -> np.ndarray:
+        """Accessory rows (ascending) in the given category codes, all accessories if None or empty"""
+        if categories is None or len(categories) == 0:
+            return self.get_accessory_rows()
+        values = self._complements.categories
+        parts = [self._table.rows_where(category_id=values[code], product_role=ACCESSORY_ROLE)
+                 for code in categories.tolist()]
+        return np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+    
+    def similarity_to(self, product_id: int, rows: np.ndarray) -> np.ndarray:
+        """
+        In-memory similarity (1 - cosine_distance/2) between a product and table rows.
+        
+        NaN where either side has no embedding.
+        """
+        table = self._table
+        similarity = np.full(len(rows), np.nan)
+        row = table.row_of(product_id)
+        if row is None or not table.has_embedding[row] or table.norms[row] == 0:
+            return similarity
+        
+        present = table.has_embedding[rows] & (table.norms[rows] > 0)
+        rows = rows[present]
+        cosine = (table.embeddings[rows] @ table.embeddings[row]) / (table.norms[rows] * table.norms[row])
+        similarity[present] = 1.0 - (1.0 - cosine.astype(np.float64)) / 2.0
+        return similarity
+    
+    def search_similar_rows_in_memory(
+        self, 
+        product_id: int, 
+        limit: int = 20, 
+        categories: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Exact cosine search over the in-memory embedding matrix.
+        
+        Same candidates and similarity scale as search_similar_rows()
+        (accessories with embeddings, 1 - cosine_distance/2, optionally in
+        categories), no database.
+        
+        Returns: (rows, similarity) arrays ordered by similarity (descending)
+        """
+        table = self._table
+        row = table.row_of(product_id)
+        if row is None or not table.has_embedding[row] or table.norms[row] == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        
+        rows = self._accessory_rows_in(categories)
+        rows = rows[table.has_embedding[rows] & (rows != row)]
+        norms = table.norms[rows] * table.norms[row]
+        cosine = (table.embeddings[rows] @ table.embeddings[row]) / np.where(norms > 0, norms, 1.0)
+        similarity = 1.0 - (1.0 - cosine.astype(np.float64)) / 2.0
+        
+        if len(rows) > limit:
+            top = np.argpartition(-similarity, max(limit - 1, 0))[:limit]
+            rows, similarity = rows[top], similarity[top]
+        order = np.argsort(-similarity, kind='stable')
+        return rows[order], similarity[order]
+
+    
+    def search_dual_rows_in_memory(
+        self, 
+        product_id: int, 
+        limit: int = 20, 
+        weights: Tuple[float, float] = (0.5, 0.5),
+        categories: Optional[np.ndarray] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Accessory search from both vectors of a product in one matmul.
+        
+        The product's [embedding, expert_embedding] (ProductTable.stacked_vectors)
+        are scored against the accessory embeddings as a (2, dim) x (dim, M)
+        product; the two cosine rows are fused with weights, renormalized over
+        the vectors the product has (a product without expert_embedding
+        ranks exactly like search_similar_rows_in_memory). categories
+        restricts the accessories as in search_similar_rows().
+        
+        Returns: (rows, fused similarity 1 - cosine_distance/2) ordered by
+            similarity (descending)
+        """
+        table = self._table
+        row = table.row_of(product_id)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        
+        vectors, present = table.stacked_vectors(row)
+        weights = np.asarray(weights, dtype=np.float64) * present
+        if weights.sum() <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        weights /= weights.sum()
+        
+        rows = self._accessory_rows_in(categories)
+        rows = rows[table.has_embedding[rows] & (rows != row)]
+        norms = table.norms[rows]
+        cosine = (vectors @ table.embeddings[rows].T) / np.where(norms > 0, norms, 1.0)
+        similarity = 1.0 - (1.0 - weights @ cosine.astype(np.float64)) / 2.0
+        
+        if len(rows) > limit:
+            top = np.argpartition(-similarity, max(limit - 1, 0))[:limit]
+            rows, similarity = rows[top], similarity[top]
+        order = np.argsort(-similarity, kind='stable')
+        return rows[order], similarity[order]
+
+
+def export_snapshot(engine=None, path=None):
+    """
+    Write the current catalogue to a snapshot file.
+    
+    Rows and the catalogue version are read in one REPEATABLE READ
+    transaction (one database snapshot), so the two always agree.
+    """
+    engine = engine or create_engine(settings.database_url_sync, echo=False)
+    path = path or snapshot.SNAPSHOT_FILE
+    with Session(engine.execution_options(isolation_level="REPEATABLE READ")) as session:
+        version = session.execute(snapshot.CATALOGUE_VERSION_SQL).scalar()
+        products = session.execute(select(Product).order_by(Product.id)).scalars().all()
+        table = ProductTable.from_rows(_product_to_dict(p) for p in products)
+    
+    return snapshot.write_snapshot(path, table, version)
 
 
 # Global singleton to avoid duplicate connections
@@ -0,0 +1,36 @@
+"""
+Deadline - Per-request latency budget
+
+A Deadline is created when a request starts and handed to the stages that
+can degrade (vector recall, MMR) so they can check what is left.
+"""
+import time
+from typing import Optional
+
+
+class Deadline:
+    """Monotonic-clock deadline; budget_ms=None or <= 0 means no limit"""
+
+    __slots__ = ("_expires_at",)
+
+    def __init__(self, budget_ms: Optional[float]):
+        if budget_ms is None or budget_ms <= 0:
+            self._expires_at = None
+        else:
+            self._expires_at = time.monotonic() + budget_ms / 1000.0
+
+    @property
+    def unlimited(self) -> bool:
+        return self._expires_at is None
+
+    def remaining(self) -> float:
+        """Seconds left (inf if unlimited, may be negative)"""
+        if self._expires_at is None:
+            return float("inf")
+        return self._expires_at - time.monotonic()
+
+    def remaining_ms(self) -> float:
+        return self.remaining() * 1000.0
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
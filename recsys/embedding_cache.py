@@ -0,0 +1,149 @@
+"""
+Embedding Cache - Content-addressed embeddings on local disk
+
+One cache per embedding model, two append-only files in temp/:
+- embedding_cache_<model>.f32    header (magic, version, dim) + float32 vectors
+- embedding_cache_<model>.index  32-byte keys, the i-th key is the i-th vector
+
+The key is the prompt's sha256 (embedding_prompt_hash), so a vector is
+reused for any product whose prompt is byte-identical, in any database.
+Vectors are read through a read-only memory map; new vectors are
+appended to the data file before their keys, so an interrupted write
+leaves at most some unindexed or partly written vectors (or a partial key),
+which are cut off on open.
+"""
+import re
+import struct
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TEMP_DIR = Path(__file__).parent / "temp"
+
+MAGIC = b"EMBCACHE"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sII")   # magic, format version, dim
+KEY_SIZE = 32                      # sha256 digest
+
+
+def cache_paths(model: str, directory: Path = TEMP_DIR) -> Tuple[Path, Path]:
+    """(data file, index file) of a model's cache"""
+    name = re.sub(r"[^\w.-]", "_", model)
+    return directory / f"embedding_cache_{name}.f32", directory / f"embedding_cache_{name}.index"
+
+
+class EmbeddingCache:
+    """
+    Append-only prompt hash -> float32 vector store (thread-safe).
+
+    Keys are sha256 hex digests (embedding_generation.prompt_hash).
+    """
+
+    def __init__(self, model: str, directory: Path = TEMP_DIR):
+        self.model = model
+        self.data_path, self.index_path = cache_paths(model, Path(directory))
+        self.dim: Optional[int] = None
+        self._slots: Dict[bytes, int] = {}
+        self._vectors: Optional[np.ndarray] = None   # memmap of the first _mapped vectors
+        self._mapped = 0
+        self._lock = threading.Lock()
+        self._open()
+
+    def _open(self):
+        """Read the header and index; cut off vectors or keys written without their pair"""
+        if not self.data_path.exists():
+            return
+        with open(self.data_path, "rb") as f:
+            header = f.read(_HEADER.size)
+        if len(header) < _HEADER.size:
+            # Interrupted while creating the cache: nothing stored yet
+            self.data_path.unlink()
+            self.index_path.unlink(missing_ok=True)
+            return
+        magic, version, dim = _HEADER.unpack(header)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Not an embedding cache (format {FORMAT_VERSION}): {self.data_path}")
+        self.dim = dim
+
+        keys = self.index_path.read_bytes() if self.index_path.exists() else b""
+        stored = (self.data_path.stat().st_size - _HEADER.size) // (4 * dim)
+        count = min(len(keys) // KEY_SIZE, stored)
+        # Also cuts a partly written last vector or key, so appends stay aligned
+        if (self.data_path.stat().st_size != _HEADER.size + count * 4 * dim
+                or len(keys) != count * KEY_SIZE):
+            self._truncate(count)
+        self._slots = {keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]: i for i in range(count)}
+
+    def _truncate(self, count: int):
+        with open(self.data_path, "r+b") as f:
+            f.truncate(_HEADER.size + count * 4 * self.dim)
+        with open(self.index_path, "ab") as f:
+            f.truncate(count * KEY_SIZE)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def _map(self) -> Optional[np.ndarray]:
+        """Read-only map of all stored vectors, re-mapped after appends (caller holds the lock)"""
+        count = len(self._slots)   # slots are 0 .. count - 1
+        if count and count != self._mapped:
+            self._vectors = np.memmap(self.data_path, dtype=np.float32, mode="r",
+                                      offset=_HEADER.size, shape=(count, self.dim))
+            self._mapped = count
+        return self._vectors if count else None
+
+    def get_many(self, prompt_hashes: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Cached vectors of the given prompt hashes.
+
+        Returns: (found mask, vectors of the found hashes in input order)
+        """
+        with self._lock:
+            slots = [self._slots.get(bytes.fromhex(h), -1) for h in prompt_hashes]
+            found = np.array(slots, dtype=np.int64) >= 0
+            vectors = self._map()
+        if vectors is None or not found.any():
+            return found, np.empty((0, self.dim or 0), dtype=np.float32)
+        return found, np.asarray(vectors[np.array(slots)[found]])
+
+    def put_many(self, prompt_hashes: Sequence[str], vectors: np.ndarray) -> int:
+        """
+        Append vectors of hashes not cached yet.
+
+        Returns: number of vectors appended (0 if their dimension does not
+            match the cache)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            return 0
+        with self._lock:
+            if self.dim is None:
+                self.data_path.parent.mkdir(parents=True, exist_ok=True)
+                with open(self.data_path, "wb") as f:
+                    f.write(_HEADER.pack(MAGIC, FORMAT_VERSION, vectors.shape[1]))
+                self.dim = vectors.shape[1]
+            if vectors.shape[1] != self.dim:
+                return 0
+
+            keys: Dict[bytes, int] = {}   # new key -> position in vectors
+            for i, h in enumerate(prompt_hashes):
+                key = bytes.fromhex(h)
+                if key not in self._slots:
+                    keys.setdefault(key, i)
+            if not keys:
+                return 0
+
+            # Vectors first: keys never point past the data
+            with open(self.data_path, "ab") as f:
+                f.write(np.ascontiguousarray(vectors[list(keys.values())]).tobytes())
+            with open(self.index_path, "ab") as f:
+                f.write(b"".join(keys))
+            start = len(self._slots)
+            self._slots.update((key, start + i) for i, key in enumerate(keys))
+        return len(keys)
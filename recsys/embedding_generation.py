@@ -1,10 +1,16 @@
 """
 Embedding Generation Pipeline 
 
-Input: temp/product_features_cleaned.csv
-Output: Database embedding column 
+Input: temp/product_features_cleaned.csv (main), or products streamed from
+       the database in chunks (main_streaming, --stream)
+Output: Database embedding column (+ embedding_prompt_hash, embedding_model)
+
+Only products whose embedding is missing, or was generated from another
+prompt or model, are embedded again.
 """
 
+import hashlib
+import io
 import os
 import sys
 import asyncio
@@ -12,7 +18,7 @@ import pandas as pd
 import numpy as np
 from pathlib import Path
 import time
-from typing import List, Optional, Tuple
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
 from tqdm import tqdm
 
 # Add project root to path
@@ -22,6 +28,9 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import Session
 from app.config.config import settings
 
+from recsys import feature_engineering
+from recsys.embedding_cache import EmbeddingCache
+
 # ============================================================================
 # Configuration
 # ============================================================================
@@ -30,9 +39,15 @@ MODEL_NAME = "bge-m3"
 TEMP_DIR = Path(__file__).parent / "temp"
 INPUT_FILE = TEMP_DIR / "product_features_cleaned.csv"
 
-# Concurrency settings
-BATCH_SIZE = 10  # Number of concurrent requests
+# Binary COPY framing (PostgreSQL COPY ... WITH (FORMAT binary))
+COPY_HEADER = b"PGCOPY\n\xff\r\n\x00" + (0).to_bytes(4, "big") + (0).to_bytes(4, "big")
+COPY_TRAILER = (-1).to_bytes(2, "big", signed=True)
+PROMPT_HASH_LENGTH = 64  # sha256 hex digest
+
+# Concurrency settings (defaults: EMBEDDING_BATCH_SIZE / EMBEDDING_CONCURRENCY in .env)
 MAX_RETRIES = 3  # Retry failed requests
+CACHED_WRITE_BATCH = 1000  # Cached embeddings per bulk write
+QUEUE_BATCHES_PER_WORKER = 2  # Streaming: batches queued per embed worker (bounds memory)
 
 # Import ollama
 try:
@@ -66,167 +81,415 @@ def check_ollama() -> bool:
         return False
 
 
-async def generate_embedding_async(client: AsyncClient, text: str, product_id: int) -> Tuple[int, Optional[List[float]]]:
-    """Generate embedding for a single text asynchronously"""
+async def embed_batch_async(
+    client: AsyncClient, 
+    batch: List[Tuple[int, str]]
+) -> List[Tuple[int, Optional[List[float]]]]:
+    """
+    Embeddings for a batch of (product_id, text) in one Ollama embed call.
+    
+    Returns: (product_id, embedding) per item, embedding None for every
+    item if the call failed after MAX_RETRIES attempts
+    """
+    product_ids = [product_id for product_id, _ in batch]
     for attempt in range(MAX_RETRIES):
         try:
-            response = await client.embeddings(model=MODEL_NAME, prompt=text)
-            embedding = response.get('embedding', None)
-            return (product_id, embedding)
+            response = await client.embed(model=MODEL_NAME, input=[text for _, text in batch])
+            return list(zip(product_ids, response['embeddings']))
         except Exception as e:
             if attempt < MAX_RETRIES - 1:
                 await asyncio.sleep(0.5 * (attempt + 1))  # Exponential backoff
             else:
-                print(f"  Failed product {product_id} after {MAX_RETRIES} attempts: {e}")
-                return (product_id, None)
-    return (product_id, None)
+                print(f"  Failed products {product_ids[0]}..{product_ids[-1]} after {MAX_RETRIES} attempts: {e}")
+    return [(product_id, None) for product_id in product_ids]
 
 
-async def generate_embeddings_batch_async(
-    texts_with_ids: List[Tuple[int, str]], 
-    ollama_url: Optional[str] = None
-) -> List[Tuple[int, Optional[List[float]]]]:
-    """Generate embeddings for a batch of texts concurrently"""
-    # Use provided URL or default (localhost)
-    client = AsyncClient(host=ollama_url) if ollama_url else AsyncClient()
-    tasks = [
-        generate_embedding_async(client, text, product_id)
-        for product_id, text in texts_with_ids
-    ]
-    results = await asyncio.gather(*tasks)
-    return results
+async def run_sliding_window(
+    batches: Iterable[List[Tuple[int, str]]],
+    client: AsyncClient,
+    on_result: Callable[[List[Tuple[int, Optional[List[float]]]]], Awaitable[None]],
+    concurrency: int
+):
+    """
+    Embed batches with up to `concurrency` batches in flight.
+    
+    A new batch starts as soon as any batch (embed call + on_result)
+    finishes, so the server never waits for the slowest batch of a group.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    
+    async def run(batch):
+        try:
+            await on_result(await embed_batch_async(client, batch))
+        finally:
+            semaphore.release()
+    
+    tasks = set()
+    for batch in batches:
+        await semaphore.acquire()
+        task = asyncio.create_task(run(batch))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
 
 
 # ============================================================================
 # Database Functions
 # ============================================================================
 
-def save_embedding_to_db(engine, product_id: int, embedding: List[float]) -> bool:
-    """Save a single embedding to database"""
-    try:
-        # Convert embedding to pgvector format: '[0.1, 0.2, ...]'
-        embedding_str = '[' + ','.join(map(str, embedding)) + ']'
-        
-        with Session(engine) as session:
-            # Update the embedding column
-            session.execute(
-                text("UPDATE products SET embedding = :embedding WHERE id = :id"),
-                {"embedding": embedding_str, "id": product_id}
-            )
-            session.commit()
-        return True
-    except Exception as e:
-        print(f"  DB Error for product {product_id}: {e}")
-        return False
+def pack_copy_binary(product_ids: np.ndarray, vectors: np.ndarray, prompt_hashes: List[str]) -> bytes:
+    """
+    (id bigint, embedding vector, prompt_hash text) rows in PostgreSQL
+    binary COPY format.
+    
+    Each tuple is a fixed-size record (field count, id, pgvector's binary
+    vector: dim, unused, big-endian float4 values, 64-char hex hash), so the
+    whole batch is packed by one structured numpy array instead of
+    per-value formatting.
+    """
+    n, dim = vectors.shape
+    record = np.dtype([
+        ('fields', '>i2'),
+        ('id_length', '>i4'), ('id', '>i8'),
+        ('vector_length', '>i4'), ('dim', '>u2'), ('unused', '>u2'), ('vector', '>f4', (dim,)),
+        ('hash_length', '>i4'), ('hash', f'S{PROMPT_HASH_LENGTH}'),
+    ])
+    rows = np.empty(n, dtype=record)
+    rows['fields'] = 3
+    rows['id_length'] = 8
+    rows['id'] = product_ids
+    rows['vector_length'] = 4 + 4 * dim
+    rows['dim'] = dim
+    rows['unused'] = 0
+    rows['vector'] = vectors
+    rows['hash_length'] = PROMPT_HASH_LENGTH
+    rows['hash'] = prompt_hashes
+    return COPY_HEADER + rows.tobytes() + COPY_TRAILER
 
 
-def save_embeddings_batch_to_db(engine, results: List[Tuple[int, Optional[List[float]]]]) -> Tuple[int, int]:
-    """Save a batch of embeddings to database"""
-    success_count = 0
-    fail_count = 0
+def write_embeddings_copy(
+    engine, 
+    product_ids: np.ndarray, 
+    vectors: np.ndarray, 
+    prompt_hashes: List[str], 
+    model: str = MODEL_NAME
+) -> int:
+    """
+    Write embeddings with their prompt hash and model in one transaction:
+    binary COPY into a temp table, then a single UPDATE ... FROM.
     
+    Returns: number of products updated
+    """
+    payload = io.BytesIO(pack_copy_binary(product_ids, vectors, prompt_hashes))
     with Session(engine) as session:
-        for product_id, embedding in results:
-            if embedding is None:
-                fail_count += 1
-                continue
-            
-            try:
-                # Convert embedding to pgvector format
-                embedding_str = '[' + ','.join(map(str, embedding)) + ']'
-                
-                session.execute(
-                    text("UPDATE products SET embedding = :embedding WHERE id = :id"),
-                    {"embedding": embedding_str, "id": product_id}
-                )
-                # Commit each successful update to avoid losing progress
-                session.commit()
-                success_count += 1
-            except Exception as e:
-                # Rollback to reset session state, allowing subsequent updates to work
-                session.rollback()
-                print(f"  DB Error for product {product_id}: {e}")
-                fail_count += 1
-    
-    return success_count, fail_count
+        session.execute(text(
+            "CREATE TEMP TABLE embedding_staging (id bigint, embedding vector, prompt_hash text) ON COMMIT DROP"
+        ))
+        # COPY needs the DBAPI (psycopg2) cursor of the session's connection
+        cursor = session.connection().connection.cursor()
+        try:
+            cursor.copy_expert(
+                "COPY embedding_staging (id, embedding, prompt_hash) FROM STDIN WITH (FORMAT binary)", payload
+            )
+        finally:
+            cursor.close()
+        result = session.execute(text("""
+            UPDATE products AS p
+            SET embedding = s.embedding,
+                embedding_prompt_hash = s.prompt_hash,
+                embedding_model = :model
+            FROM embedding_staging AS s
+            WHERE p.id = s.id
+        """), {"model": model})
+        session.commit()
+    return result.rowcount
+
+
+def save_embeddings_batch_to_db(
+    engine, 
+    results: List[Tuple[int, Optional[List[float]]]], 
+    prompt_hashes: Dict[int, str]
+) -> Tuple[int, int]:
+    """
+    Save a batch of embeddings to database (write_embeddings_copy), with
+    the hash of the prompt each one was generated from.
+    
+    The whole batch is retried up to MAX_RETRIES times; if it still fails,
+    all its embeddings count as failed.
+    
+    Returns: (saved, failed)
+    """
+    done = [(product_id, embedding) for product_id, embedding in results if embedding is not None]
+    fail_count = len(results) - len(done)
+    if not done:
+        return 0, fail_count
+    
+    product_ids = np.array([product_id for product_id, _ in done], dtype=np.int64)
+    vectors = np.asarray([embedding for _, embedding in done], dtype=np.float32)
+    for attempt in range(MAX_RETRIES):
+        try:
+            write_embeddings_copy(engine, product_ids, vectors,
+                                  [prompt_hashes[product_id] for product_id in product_ids.tolist()])
+            return len(done), fail_count
+        except Exception as e:
+            if attempt < MAX_RETRIES - 1:
+                time.sleep(0.5 * (attempt + 1))
+            else:
+                print(f"  DB Error for products {product_ids[0]}..{product_ids[-1]} "
+                      f"after {MAX_RETRIES} attempts: {e}")
+    return 0, len(results)
 
 
 # ============================================================================
 # Main Pipeline
 # ============================================================================
 
-def get_products_without_embedding(engine, product_ids: List[int]) -> List[int]:
-    """Get list of product IDs that don't have embeddings yet"""
+def store_embeddings(
+    engine, 
+    results: List[Tuple[int, Optional[List[float]]]], 
+    prompt_hashes: Dict[int, str], 
+    cache: Optional[EmbeddingCache] = None
+) -> Tuple[int, int]:
+    """
+    Add new embeddings to the cache, then save them (save_embeddings_batch_to_db).
+    
+    Cached first, so a batch whose DB write fails is not embedded again.
+    """
+    if cache is not None:
+        done = [(product_id, embedding) for product_id, embedding in results if embedding is not None]
+        if done:
+            cache.put_many([prompt_hashes[product_id] for product_id, _ in done],
+                           [embedding for _, embedding in done])
+    return save_embeddings_batch_to_db(engine, results, prompt_hashes)
+
+
+def split_cached(
+    cache: EmbeddingCache, 
+    texts_with_ids: List[Tuple[int, str]], 
+    prompt_hashes: Dict[int, str]
+) -> Tuple[List[Tuple[int, np.ndarray]], List[Tuple[int, str]]]:
+    """([(product_id, cached embedding)], [(product_id, prompt) not in the cache])"""
+    found, vectors = cache.get_many([prompt_hashes[product_id] for product_id, _ in texts_with_ids])
+    cached = list(zip([product_id for (product_id, _), hit in zip(texts_with_ids, found) if hit], vectors))
+    return cached, [item for item, hit in zip(texts_with_ids, found) if not hit]
+
+
+def prompt_hash(prompt: str) -> str:
+    """sha256 hex digest of an embedding prompt (products.embedding_prompt_hash)"""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def get_products_to_embed(engine, prompt_hashes: Dict[int, str], model: str = MODEL_NAME) -> List[int]:
+    """
+    Product IDs whose embedding is missing or stale: generated from
+    another prompt (hash differs) or by another model. Embeddings written
+    before hashes were stored have no hash and count as stale once.
+    """
+    product_ids = list(prompt_hashes)
     with Session(engine) as session:
         result = session.execute(
-            text("SELECT id FROM products WHERE embedding IS NOT NULL AND id = ANY(:ids)"),
-            {"ids": product_ids}
+            text("""
+                SELECT id, embedding_prompt_hash
+                FROM products
+                WHERE id = ANY(:ids)
+                  AND embedding IS NOT NULL
+                  AND embedding_model = :model
+            """),
+            {"ids": product_ids, "model": model}
         )
-        existing_ids = {row[0] for row in result.fetchall()}
+        current = {row[0]: row[1] for row in result.fetchall()}
     
-    return [pid for pid in product_ids if pid not in existing_ids]
+    return [pid for pid in product_ids if current.get(pid) != prompt_hashes[pid]]
 
 
 async def process_embeddings_async(
     df: pd.DataFrame, 
     engine, 
-    ollama_url: Optional[str] = None
+    ollama_url: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    use_cache: Optional[bool] = None
 ) -> Tuple[int, int, float]:
-    """Process all embeddings asynchronously"""
+    """
+    Process all embeddings asynchronously.
+    
+    Prompts found in the on-disk embedding cache are written without
+    calling the model. The rest use one client for the whole run;
+    batch_size prompts per embed call and up to concurrency calls in flight
+    (sliding window), each batch cached and saved as soon as it is embedded.
+    """
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    concurrency = max(1, concurrency or settings.EMBEDDING_CONCURRENCY)
+    use_cache = settings.EMBEDDING_CACHE_ENABLED if use_cache is None else use_cache
     total_success = 0
     total_fail = 0
     start_time = time.time()
     
-    # Check which products already have embeddings
+    # Check which products have an embedding of their current prompt
     all_ids = df['id'].tolist()
-    ids_to_process = get_products_without_embedding(engine, all_ids)
+    prompt_hashes = dict(zip(all_ids, map(prompt_hash, df['embedding_prompt'].astype(str))))
+    ids_to_process = get_products_to_embed(engine, prompt_hashes)
     
     if len(ids_to_process) == 0:
-        print("All products already have embeddings. Skipping generation.")
+        print("All embeddings are up to date. Skipping generation.")
         return len(all_ids), 0, 0.0
     
     skipped = len(all_ids) - len(ids_to_process)
     if skipped > 0:
-        print(f"Skipping {skipped} products that already have embeddings.")
+        print(f"Skipping {skipped} products whose embedding is up to date.")
     
-    # Filter dataframe to only include products without embeddings
+    # Filter dataframe to only include missing or stale embeddings
     df_to_process = df[df['id'].isin(ids_to_process)]
     
     # Prepare data: (product_id, embedding_prompt)
-    texts_with_ids = list(zip(df_to_process['id'].tolist(), df_to_process['embedding_prompt'].tolist()))
+    texts_with_ids = list(zip(df_to_process['id'].tolist(), df_to_process['embedding_prompt'].astype(str).tolist()))
     total = len(texts_with_ids)
     
-    print(f"Processing {total} products with batch size {BATCH_SIZE}...")
-    
     # Progress bar
     pbar = tqdm(total=total, desc="Generating embeddings", unit="item")
+    cache = EmbeddingCache(MODEL_NAME) if use_cache else None
     
-    # Process in batches
-    for batch_start in range(0, total, BATCH_SIZE):
-        batch_end = min(batch_start + BATCH_SIZE, total)
-        batch = texts_with_ids[batch_start:batch_end]
-        
-        # Generate embeddings concurrently
-        results = await generate_embeddings_batch_async(batch, ollama_url)
-        
-        # Save to database
-        success, fail = save_embeddings_batch_to_db(engine, results)
+    async def save(results: List[Tuple[int, Optional[List[float]]]]):
+        nonlocal total_success, total_fail
+        # Off the event loop, so other batches keep embedding meanwhile
+        success, fail = await asyncio.to_thread(store_embeddings, engine, results, prompt_hashes, cache)
         total_success += success
         total_fail += fail
         
         # Update progress bar
-        pbar.update(len(batch))
+        pbar.update(len(results))
         pbar.set_postfix({
             'success': total_success,
             'failed': total_fail,
             'rate': f"{pbar.n / (time.time() - start_time):.1f}/s"
         })
     
+    # Embeddings of identical prompts from earlier runs (any database)
+    if cache is not None and len(cache):
+        cached, texts_with_ids = split_cached(cache, texts_with_ids, prompt_hashes)
+        print(f"Embedding cache: {len(cached)} of {total} prompts cached, {len(texts_with_ids)} to embed")
+        for start in range(0, len(cached), CACHED_WRITE_BATCH):
+            await save(cached[start:start + CACHED_WRITE_BATCH])
+        total = len(texts_with_ids)
+    
+    print(f"Processing {total} products: {batch_size} per request, {concurrency} requests in flight...")
+    client = AsyncClient(host=ollama_url) if ollama_url else AsyncClient()
+    
+    batches = (texts_with_ids[start:start + batch_size] for start in range(0, total, batch_size))
+    await run_sliding_window(batches, client, save, concurrency)
+    
     pbar.close()
     elapsed_total = time.time() - start_time
     return total_success, total_fail, elapsed_total
 
 
+async def stream_embeddings_async(
+    engine, 
+    ollama_url: Optional[str] = None,
+    chunk_size: int = feature_engineering.CHUNK_SIZE,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    use_cache: Optional[bool] = None
+) -> Dict[str, int]:
+    """
+    Features -> embeddings -> database without the CSV intermediate.
+    
+    Three stages connected by bounded asyncio queues:
+        reader     product chunks from the database, features and prompt
+                   hashes per chunk (in a thread), stale rows only; cached
+                   vectors go straight to the writer
+        embedders  `concurrency` workers, batch_size prompts per embed call
+        writer     cache + bulk write per batch (in a thread)
+    A full queue blocks the stage before it, so memory stays at a few
+    chunks and batches, and embedding starts with the first chunk.
+    
+    The whitelist needs all key_params, so it is computed first in a
+    separate pass reading only that column.
+    
+    Returns: counts {"products", "up_to_date", "cached", "saved", "failed"}
+    """
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    concurrency = max(1, concurrency or settings.EMBEDDING_CONCURRENCY)
+    use_cache = settings.EMBEDDING_CACHE_ENABLED if use_cache is None else use_cache
+    cache = EmbeddingCache(MODEL_NAME) if use_cache else None
+    client = AsyncClient(host=ollama_url) if ollama_url else AsyncClient()
+    counts = dict(products=0, up_to_date=0, cached=0, saved=0, failed=0)
+    start_time = time.time()
+    
+    whitelist, _ = await asyncio.to_thread(feature_engineering.generate_whitelist_streaming, engine, chunk_size)
+    print(f"Whitelist attributes: {len(whitelist)}")
+    
+    # Items: (batch, prompt hashes of the batch); None ends a consumer
+    embed_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * QUEUE_BATCHES_PER_WORKER)
+    write_queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * QUEUE_BATCHES_PER_WORKER)
+    pbar = tqdm(desc="Streaming embeddings", unit="item")
+    
+    def read_chunk(frames) -> Optional[Tuple[List[Tuple[int, str]], Dict[int, str], int]]:
+        """Next chunk: (stale (id, prompt) pairs, their hashes, products in chunk)"""
+        df = next(frames, None)
+        if df is None:
+            return None
+        ids = df['id'].tolist()
+        prompts = df['embedding_prompt'].astype(str).tolist()
+        hashes = dict(zip(ids, map(prompt_hash, prompts)))
+        stale = set(get_products_to_embed(engine, hashes))
+        items = [(product_id, prompt) for product_id, prompt in zip(ids, prompts) if product_id in stale]
+        return items, {product_id: hashes[product_id] for product_id, _ in items}, len(ids)
+    
+    async def read():
+        frames = feature_engineering.iter_feature_frames(engine, whitelist, chunk_size)
+        while True:
+            chunk = await asyncio.to_thread(read_chunk, frames)
+            if chunk is None:
+                break
+            items, hashes, n_products = chunk
+            counts['products'] += n_products
+            counts['up_to_date'] += n_products - len(items)
+            pbar.update(n_products - len(items))
+            
+            if cache is not None and len(cache):
+                cached, items = split_cached(cache, items, hashes)
+                counts['cached'] += len(cached)
+                for start in range(0, len(cached), CACHED_WRITE_BATCH):
+                    await write_queue.put((cached[start:start + CACHED_WRITE_BATCH], hashes))
+            for start in range(0, len(items), batch_size):
+                await embed_queue.put((items[start:start + batch_size], hashes))
+        for _ in range(concurrency):
+            await embed_queue.put(None)
+    
+    async def embed():
+        while (item := await embed_queue.get()) is not None:
+            batch, hashes = item
+            await write_queue.put((await embed_batch_async(client, batch), hashes))
+    
+    async def write():
+        while (item := await write_queue.get()) is not None:
+            results, hashes = item
+            success, fail = await asyncio.to_thread(store_embeddings, engine, results, hashes, cache)
+            counts['saved'] += success
+            counts['failed'] += fail
+            pbar.update(len(results))
+            pbar.set_postfix({
+                'saved': counts['saved'],
+                'failed': counts['failed'],
+                'rate': f"{pbar.n / (time.time() - start_time):.1f}/s"
+            })
+    
+    writer = asyncio.create_task(write())
+    producers = [asyncio.create_task(read())] + [asyncio.create_task(embed()) for _ in range(concurrency)]
+    try:
+        await asyncio.gather(*producers)
+        await write_queue.put(None)
+        await writer
+    finally:
+        # A failed stage stops the others instead of leaving them blocked on a queue
+        for task in producers + [writer]:
+            task.cancel()
+        pbar.close()
+    return counts
+
+
 async def main(ollama_url: Optional[str] = None):
     """
     ollama_url: Optional Ollama server URL. If None, uses localhost.
@@ -307,11 +570,67 @@ async def main(ollama_url: Optional[str] = None):
     print(f"  Total time: {elapsed:.1f} seconds")
     if elapsed > 0:
         print(f"  Speed: {len(df)/elapsed:.1f} items/sec")
-    print(f"  Concurrency: {BATCH_SIZE} parallel requests")
+    print(f"  Batching: {settings.EMBEDDING_BATCH_SIZE} prompts per request, "
+          f"{settings.EMBEDDING_CONCURRENCY} requests in flight")
     
     print(f"\nDatabase:")
     print(f"  Products with embeddings: {with_embedding}")
-    print(f"  Embedding format: pgvector compatible ([x1,x2,...])")
+    print(f"  Write path: binary COPY + UPDATE ... FROM per batch")
+    
+    return True
+
+
+async def main_streaming(ollama_url: Optional[str] = None) -> bool:
+    """
+    Streaming variant of feature_engineering.main() + main(): products are
+    read, turned into prompts, embedded and written chunk by chunk
+    (stream_embeddings_async), no CSV.
+    """
+    print("\n" + "=" * 80)
+    print("Streaming Embedding Pipeline (features -> embeddings -> database)")
+    print("=" * 80)
+    
+    # Step 1: Check Ollama
+    print("\n[Step 1] Check Ollama Service")
+    print("-" * 80)
+    if not check_ollama():
+        print("\nFailed: Please start Ollama and pull the model")
+        return False
+    
+    # Step 2: Connect to database
+    print("\n[Step 2] Connect to database")
+    print("-" * 80)
+    try:
+        engine = create_engine(settings.database_url_sync, echo=False)
+        with Session(engine) as session:
+            count = session.execute(text("SELECT COUNT(*) FROM products")).scalar()
+            print(f"Connected. Products in DB: {count}")
+    except Exception as e:
+        print(f"ERROR: Database connection failed - {e}")
+        return False
+    
+    if count == 0:
+        print("ERROR: No products in database!")
+        return False
+    
+    # Step 3: Stream
+    print("\n[Step 3] Stream features -> embeddings -> database")
+    print("-" * 80)
+    print(f"Feature workers: {feature_engineering.feature_workers()}")
+    start_time = time.time()
+    counts = await stream_embeddings_async(engine, ollama_url)
+    elapsed = time.time() - start_time
+    
+    # Summary
+    print("\n" + "=" * 80)
+    print("Summary")
+    print("=" * 80)
+    print(f"  Products: {counts['products']}")
+    print(f"  Up to date (skipped): {counts['up_to_date']}")
+    print(f"  From embedding cache: {counts['cached']}")
+    print(f"  Saved: {counts['saved']}")
+    print(f"  Failed: {counts['failed']}")
+    print(f"  Total time: {elapsed:.1f} seconds")
     
     return True
 
@@ -324,7 +643,9 @@ if __name__ == "__main__":
     os.environ["DB_PASSWORD"] = "postgres"
     os.environ["DB_DB"] = "recsys"
     
-    success = asyncio.run(main())  # Use default localhost for Ollama
+    # --stream: read products from the database instead of the CSV
+    stream = "--stream" in sys.argv[1:]
+    success = asyncio.run(main_streaming() if stream else main())  # Use default localhost for Ollama
     if success:
         print("\n Pipeline completed successfully!")
     else:
@@ -1,6 +1,9 @@
 """
 Feature Cleaning and Construction Pipeline
 Output: temp/product_features_cleaned.csv
+
+The same features can be streamed in chunks (iter_feature_frames) for the
+streaming embedding pipeline, without the CSV.
 """
 
 import os
@@ -8,7 +11,10 @@ import sys
 import re
 import pandas as pd
 from pathlib import Path
-from collections import defaultdict
+import multiprocessing
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Set
 
 # Add project root to path
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -18,6 +24,7 @@ from sqlalchemy import create_engine, select
 from sqlalchemy.orm import Session
 from app.config.config import settings
 from app.models import Product
+from recsys.product_table import BLACKLIST_KEYS
 
 # ============================================================================
 # Configuration
@@ -26,82 +33,142 @@ from app.models import Product
 TEMP_DIR = Path(__file__).parent / "temp"
 OUTPUT_FILE = TEMP_DIR / "product_features_cleaned.csv"
 
-# Blacklist and Whitelist for key_params cleaning
-BLACKLIST_KEYS = {
-    "Артикул", "Код товара", "Модель",
-    "Количество в упаковке", "Количество предметов", "Вес", "Вес брутто",
-    "Объем", "В упаковке", "Тип упаковки",
-    "Дополнительно", "Описание", "Комплектация", "Гарантия",
-    "Страна", "Страна производства", "Бренд", "Серия",
-}
-
+# Whitelist for key_params cleaning (BLACKLIST_KEYS: product_table)
 KEYWORD_WHITELIST = [
     "Материал", "Цвет", "Размер", "Длина", "Ширина", "Высота",
     "Толщина", "Диаметр", "Тип", "Вид", "Шлиц", "Назначение",
 ]
 
+# Product columns the features are built from (no embedding vectors)
+FEATURE_COLUMNS = [
+    "id", "name", "category_name", "category_id", "vendor", "price", "type",
+    "parent_id", "parent_name", "weight_kg", "shipping_weight_kg", "volume_l",
+    "length_mm", "key_params", "picture_url", "url", "description", "product_role",
+]
+CHUNK_SIZE = 5000  # Products per chunk when streaming
+PARALLEL_CHUNKS_PER_WORKER = 2  # Chunks in flight per feature worker process
+
+WHITESPACE = re.compile(r'\s+')
+DESCRIPTION_PROMPT_CHARS = 200  # Description characters in the embedding prompt
+
 
 # ============================================================================
 # Database Functions
 # ============================================================================
 
-def load_data_from_db():
-    """Load data from database"""
+def _product_frame(rows, columns: List[str]) -> pd.DataFrame:
+    """DataFrame of product rows; key_params NULL becomes {}"""
+    df = pd.DataFrame(rows, columns=columns)
+    if 'key_params' in df:
+        df['key_params'] = [params or {} for params in df['key_params']]
+    return df
+
+
+def load_data_from_db(
+    engine=None, 
+    columns: List[str] = FEATURE_COLUMNS, 
+    chunk_size: int = CHUNK_SIZE
+) -> pd.DataFrame:
+    """
+    Load products from database (given columns only, id order).
+    
+    Streams through a server-side cursor (stream_results / yield_per) and
+    builds the frame from chunk_size-row partitions, so neither the
+    embedding vectors nor a full list of ORM objects are ever held.
+    """
     print("Loading data from database...")
     
-    engine = create_engine(settings.database_url_sync, echo=False)
+    engine = engine or create_engine(settings.database_url_sync, echo=False)
+    query = (
+        select(*[getattr(Product, column) for column in columns])
+        .order_by(Product.id)
+        .execution_options(stream_results=True, yield_per=chunk_size)
+    )
     
     with Session(engine) as session:
-        products = session.execute(select(Product)).scalars().all()
-        
-        data = []
-        for p in products:
-            data.append({
-                "id": p.id,
-                "name": p.name,
-                "category_name": getattr(p, 'category_name', ''),
-                "category_id": p.category_id,
-                "vendor": getattr(p, 'vendor', ''),
-                "price": p.price,
-                "type": getattr(p, 'type', ''),
-                "parent_id": getattr(p, 'parent_id', ''),
-                "parent_name": getattr(p, 'parent_name', ''),
-                "weight_kg": getattr(p, 'weight_kg', None),
-                "shipping_weight_kg": getattr(p, 'shipping_weight_kg', None),
-                "volume_l": getattr(p, 'volume_l', None),
-                "length_mm": getattr(p, 'length_mm', None),
-                "key_params": getattr(p, 'key_params', {}) or {},
-                "picture_url": getattr(p, 'picture_url', ''),
-                "url": getattr(p, 'url', ''),
-                "description": getattr(p, 'description', ''),
-                "product_role": p.product_role,
-            })
-    
-    df = pd.DataFrame(data)
+        frames = [
+            _product_frame(rows, columns)
+            for rows in session.execute(query).partitions()
+        ]
+    
+    df = pd.concat(frames, ignore_index=True) if frames else _product_frame([], columns)
     print(f"Successfully loaded {len(df)} records from database")
     return df
 
 
+def iter_product_frames(
+    engine, 
+    columns: List[str] = FEATURE_COLUMNS, 
+    chunk_size: int = CHUNK_SIZE
+) -> Iterator[pd.DataFrame]:
+    """
+    Products in id order as DataFrames of up to chunk_size rows.
+    
+    Keyset pagination (id > last id), one short query per chunk, so the
+    consumer may take as long as it needs between chunks. Only the given
+    columns are read; key_params NULL becomes {} as in load_data_from_db().
+    """
+    fields = [getattr(Product, column) for column in columns]
+    last_id = None
+    while True:
+        query = select(*fields).order_by(Product.id).limit(chunk_size)
+        if last_id is not None:
+            query = query.where(Product.id > last_id)
+        with Session(engine) as session:
+            rows = session.execute(query).all()
+        if not rows:
+            return
+        
+        df = _product_frame(rows, columns)
+        yield df
+        last_id = int(df['id'].iloc[-1])
+
+
 """
 Feature Engineering Functions
 """
 
-def generate_whitelist_from_data(df):
-    """Generate attribute whitelist using quality assessment algorithm"""
-    all_keys = set()
-    key_frequency = defaultdict(int)
-    key_unique_values = defaultdict(set)
-    
-    for params in df['key_params']:
+def update_key_param_stats(
+    key_params_column, 
+    key_frequency: Dict[str, int], 
+    key_unique_values: Dict[str, Set[str]]
+):
+    """Add the key_params dicts of a column (or chunk) to the per-key statistics"""
+    for params in key_params_column:
         if isinstance(params, dict):
-            all_keys.update(params.keys())
             for k, v in params.items():
                 key_frequency[k] += 1
                 key_unique_values[k].add(str(v).lower())
-    
+
+
+def generate_whitelist_from_data(df):
+    """Generate attribute whitelist using quality assessment algorithm"""
+    key_frequency = defaultdict(int)
+    key_unique_values = defaultdict(set)
+    update_key_param_stats(df['key_params'], key_frequency, key_unique_values)
+    return whitelist_from_stats(key_frequency, key_unique_values, len(df))
+
+
+def generate_whitelist_streaming(engine, chunk_size: int = CHUNK_SIZE):
+    """generate_whitelist_from_data() over all products, reading only key_params in chunks"""
+    key_frequency = defaultdict(int)
+    key_unique_values = defaultdict(set)
+    total = 0
+    for df in iter_product_frames(engine, ["id", "key_params"], chunk_size):
+        update_key_param_stats(df['key_params'], key_frequency, key_unique_values)
+        total += len(df)
+    return whitelist_from_stats(key_frequency, key_unique_values, total)
+
+
+def whitelist_from_stats(
+    key_frequency: Dict[str, int], 
+    key_unique_values: Dict[str, Set[str]], 
+    total: int
+):
+    """Whitelist and per-attribute quality table from key_params statistics of total products"""
     attr_analysis = []
     for key, freq in sorted(key_frequency.items(), key=lambda x: x[1], reverse=True):
-        freq_pct = freq / len(df) * 100
+        freq_pct = freq / total * 100
         unique_count = len(key_unique_values[key])
         unique_rate = unique_count / freq if freq > 0 else 0
         
@@ -128,7 +195,7 @@ def generate_whitelist_from_data(df):
             return 'blacklist'
         if any(keyword in attr_name for keyword in KEYWORD_WHITELIST):
             return 'whitelist'
-        if unique_count >= len(df) * 0.7 or unique_rate > 0.9:
+        if unique_count >= total * 0.7 or unique_rate > 0.9:
             return 'noise_id'
         if unique_count == 1:
             return 'noise_variance'
@@ -167,7 +234,7 @@ def clean_name(name):
     else:
         clean = name.strip()
     
-    clean = re.sub(r'\s+', ' ', clean)
+    clean = WHITESPACE.sub(' ', clean)
     return clean
 
 
@@ -235,13 +302,210 @@ def create_embedding_prompt(row):
         parts.append(physical)
     
     if row.get('description'):
-        desc = re.sub(r'\s+', ' ', str(row['description']).strip())
+        desc = WHITESPACE.sub(' ', str(row['description']).strip())
         if desc:
-            parts.append(desc[:200])
+            parts.append(desc[:DESCRIPTION_PROMPT_CHARS])
     
     return ". ".join(parts)
 
 
+"""
+Vectorized Feature Functions (column versions of the functions above,
+same output string for string)
+"""
+
+def clean_key_params_column(key_params: pd.Series, whitelist) -> pd.Series:
+    """clean_key_params() of every value, with a set lookup for the whitelist"""
+    allowed = set(whitelist)
+    return pd.Series([
+        "; ".join(f"{k}: {v}" for k, v in params.items() if k in allowed)
+        if isinstance(params, dict) else ""
+        for params in key_params
+    ], index=key_params.index, dtype=object)
+
+
+def clean_name_column(names: pd.Series) -> pd.Series:
+    """clean_name() of every value"""
+    is_str = names.map(type).eq(str)
+    text = names[is_str].str.rsplit(',', n=1).str[0].str.strip().str.replace(WHITESPACE, ' ', regex=True)
+    other = names[~is_str].map(lambda name: str(name) if name else "")
+    return pd.concat([text, other]).reindex(names.index).astype(object)
+
+
+def _text_or_empty(values: pd.Series) -> pd.Series:
+    """str(value).strip(), "" where missing"""
+    present = values.notna()
+    return values.where(present, "").astype(str).str.strip().where(present, "")
+
+
+def create_breadcrumb_column(parent_names: pd.Series, category_names: pd.Series) -> pd.Series:
+    """create_breadcrumb() of every (parent, category) pair"""
+    parent = _text_or_empty(parent_names)
+    category = _text_or_empty(category_names)
+    both = (parent != "") & (category != "")
+    breadcrumb = category.where(category != "", parent)
+    return breadcrumb.where(~both, parent + " > " + category)
+
+
+def clean_description_column(descriptions: pd.Series) -> pd.Series:
+    """Whitespace-collapsed description, "" where missing"""
+    return _text_or_empty(descriptions).str.replace(WHITESPACE, ' ', regex=True)
+
+
+def physical_dimension_column(df: pd.DataFrame) -> pd.Series:
+    """get_physical_dimension() of every row"""
+    result = pd.Series("", index=df.index, dtype=object)
+    # Lowest priority first, so weight overwrites volume overwrites length
+    for column, label, unit in (('length_mm', 'Length', 'mm'), ('volume_l', 'Volume', 'L'), ('weight_kg', 'Weight', 'kg')):
+        present = df[column].notna()
+        result[present] = label + ": " + df.loc[present, column].astype(str) + " " + unit
+    return result
+
+
+def _join_parts(parts: List[pd.Series], separator: str = ". ") -> pd.Series:
+    """Row-wise separator.join of the non-empty parts"""
+    joined = [separator.join(filter(None, row)) for row in zip(*parts)]
+    return pd.Series(joined, index=parts[0].index, dtype=object)
+
+
+def create_embedding_prompt_column(df: pd.DataFrame) -> pd.Series:
+    """
+    create_embedding_prompt() of every row; expects category_breadcrumb,
+    name_clean, key_params_clean and a cleaned description (already
+    whitespace-collapsed, so not collapsed again)
+    """
+    breadcrumb = df['category_breadcrumb']
+    name = df['name_clean']
+    description = df['description']
+    return _join_parts([
+        ("Категория: " + breadcrumb).where(breadcrumb != "", ""),
+        ("Имя: " + name).where(name != "", ""),
+        df['key_params_clean'],
+        physical_dimension_column(df),
+        description.str[:DESCRIPTION_PROMPT_CHARS],
+    ])
+
+
+def build_features(df: pd.DataFrame, whitelist_attributes: List[str]) -> pd.DataFrame:
+    """
+    Output features of loaded products (steps 3-9 of main()).
+    
+    Column-wise (vectorized string operations, precompiled patterns), with
+    the same output as applying the per-row functions above. Every step
+    is per row once the whitelist is known, so chunks of a catalogue give
+    the same rows as the whole catalogue.
+    """
+    df = df.copy()
+    df['key_params_clean'] = clean_key_params_column(df['key_params'], whitelist_attributes)
+    df['name_clean'] = clean_name_column(df['name'])
+    df['category_breadcrumb'] = create_breadcrumb_column(df['parent_name'], df['category_name'])
+    df['price_val'] = pd.to_numeric(df['price'], errors='coerce')
+    df['description'] = clean_description_column(df['description'])
+    df['embedding_prompt'] = create_embedding_prompt_column(df)
+    
+    output_df = df[[
+        'id', 'name_clean', 'category_breadcrumb', 'product_role',
+        'price_val', 'key_params_clean', 'embedding_prompt'
+    ]].copy()
+    
+    return output_df.rename(columns={
+        'name_clean': 'name',
+        'key_params_clean': 'key_params',
+    })
+
+
+_worker_whitelist: List[str] = []
+
+
+def _init_feature_worker(whitelist_attributes: List[str]):
+    """Process pool initializer: the whitelist is sent once per worker, not per chunk"""
+    global _worker_whitelist
+    _worker_whitelist = whitelist_attributes
+
+
+def _build_features_chunk(df: pd.DataFrame) -> pd.DataFrame:
+    return build_features(df, _worker_whitelist)
+
+
+def feature_workers(workers: Optional[int] = None) -> int:
+    """Process count: workers, default settings.FEATURE_WORKERS; 0 = one per core"""
+    workers = settings.FEATURE_WORKERS if workers is None else workers
+    return workers if workers > 0 else (os.cpu_count() or 1)
+
+
+def build_features_ordered(
+    frames: Iterable[pd.DataFrame], 
+    whitelist_attributes: List[str], 
+    workers: int
+) -> Iterator[pd.DataFrame]:
+    """
+    build_features() of every frame, yielded in input order.
+    
+    With workers > 1 the frames are built on a process pool (spawned
+    workers, whitelist set once per worker by the initializer). At most
+    workers * PARALLEL_CHUNKS_PER_WORKER frames are in flight, so a
+    streamed input is read only that far ahead of the consumer.
+    """
+    if workers <= 1:
+        for df in frames:
+            yield build_features(df, whitelist_attributes)
+        return
+    
+    with ProcessPoolExecutor(
+        max_workers=workers, 
+        mp_context=multiprocessing.get_context("spawn"), 
+        initializer=_init_feature_worker, 
+        initargs=(whitelist_attributes,)
+    ) as executor:
+        pending = deque()
+        try:
+            for df in frames:
+                pending.append(executor.submit(_build_features_chunk, df))
+                if len(pending) >= workers * PARALLEL_CHUNKS_PER_WORKER:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Consumer stopped early or a chunk failed: drop queued chunks
+            for future in pending:
+                future.cancel()
+
+
+def build_features_parallel(
+    df: pd.DataFrame, 
+    whitelist_attributes: List[str], 
+    workers: Optional[int] = None, 
+    chunk_size: int = CHUNK_SIZE
+) -> pd.DataFrame:
+    """
+    build_features() on a process pool: the products are split into
+    chunk_size-row chunks, built by up to workers processes and merged
+    in input order (same output as build_features).
+    
+    Args:
+        workers: processes (default settings.FEATURE_WORKERS, 0 = one per
+            core); 1 or a single chunk runs in-process
+    """
+    chunks = [df.iloc[start:start + chunk_size] for start in range(0, len(df), max(1, chunk_size))]
+    workers = min(feature_workers(workers), len(chunks))
+    if workers <= 1:
+        return build_features(df, whitelist_attributes)
+    return pd.concat(build_features_ordered(chunks, whitelist_attributes, workers))
+
+
+def iter_feature_frames(
+    engine, 
+    whitelist_attributes: List[str], 
+    chunk_size: int = CHUNK_SIZE, 
+    workers: Optional[int] = None
+) -> Iterator[pd.DataFrame]:
+    """
+    build_features() of every product chunk, in id order; chunks are built
+    on feature_workers(workers) processes (build_features_ordered)
+    """
+    frames = iter_product_frames(engine, FEATURE_COLUMNS, chunk_size)
+    yield from build_features_ordered(frames, whitelist_attributes, feature_workers(workers))
+
 
 def main():
     print("\n" + "=" * 80)
@@ -266,68 +530,17 @@ def main():
     whitelist_attributes, quality_df = generate_whitelist_from_data(df)
     print(f"  Whitelist attributes: {len(whitelist_attributes)}")
     
-    # Step 3: Process key_params
-    print("\n[Step 3] Process key_params")
-    print("-" * 80)
-    df['key_params_clean'] = df['key_params'].apply(
-        lambda x: clean_key_params(x, whitelist_attributes)
-    )
-    print("  key_params cleaned")
-    
-    # Step 4: Clean name
-    print("\n[Step 4] Clean name field")
-    print("-" * 80)
-    df['name_clean'] = df['name'].apply(clean_name)
-    print("  Name cleaned")
-    
-    # Step 5: Create Category Breadcrumb
-    print("\n[Step 5] Create Category Breadcrumb")
-    print("-" * 80)
-    df['category_breadcrumb'] = df.apply(
-        lambda row: create_breadcrumb(row['parent_name'], row['category_name']),
-        axis=1
-    )
-    print("  Breadcrumb created")
-    
-    # Step 6: Process Price
-    print("\n[Step 6] Process Price field")
-    print("-" * 80)
-    df['price_val'] = pd.to_numeric(df['price'], errors='coerce')
-    df['price_formatted'] = df['price'].apply(format_price)
-    print("  Price processed")
-    
-    # Step 7: Clean description
-    print("\n[Step 7] Clean description")
-    print("-" * 80)
-    df['description'] = df['description'].apply(
-        lambda x: re.sub(r'\s+', ' ', str(x).strip()) if pd.notna(x) else ""
-    )
-    
-    # Step 8: Generate embedding_prompt
-    print("\n[Step 8] Generate embedding_prompt")
-    print("-" * 80)
-    df['embedding_prompt'] = df.apply(create_embedding_prompt, axis=1)
-    print(f"  Avg length: {df['embedding_prompt'].str.len().mean():.0f} chars")
-    
-    # Step 9: Build output dataframe
-    print("\n[Step 9] Build final output")
+    # Step 3: Build features (key_params, name, breadcrumb, price, description, prompt)
+    print("\n[Step 3] Build features")
     print("-" * 80)
-    
-    output_df = df[[
-        'id', 'name_clean', 'category_breadcrumb', 'product_role',
-        'price_val', 'key_params_clean', 'embedding_prompt'
-    ]].copy()
-    
-    output_df = output_df.rename(columns={
-        'name_clean': 'name',
-        'key_params_clean': 'key_params',
-    })
-    
+    print(f"  Workers: {feature_workers()}")
+    output_df = build_features_parallel(df, whitelist_attributes)
+    print(f"  Avg prompt length: {output_df['embedding_prompt'].str.len().mean():.0f} chars")
     print(f"  Records: {len(output_df)}")
     print(f"  Columns: {list(output_df.columns)}")
     
-    # Step 10: Save to CSV in temp directory
-    print("\n[Step 10] Save to CSV")
+    # Step 4: Save to CSV in temp directory
+    print("\n[Step 4] Save to CSV")
     print("-" * 80)
     
     output_df.to_csv(OUTPUT_FILE, index=False, encoding='utf-8')
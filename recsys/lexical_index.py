@@ -0,0 +1,273 @@
+"""
+Lexical Index - BM25 recall over product text, no embeddings needed
+
+Documents are the accessories of a ProductTable: name, category_name and
+key_params values (blacklisted keys dropped, as in feature engineering).
+Each document is analyzed into two term kinds:
+- tokens:         casefolded words (\\w+), "профиль", "60х27", "мм"
+- char trigrams:  of every word padded with "#" ("#пр", "про", ..., "ль#"),
+                  so "саморез" still meets "саморезы" and "шуруп" meets "шурупы"
+
+Postings are stored CSR-style (one flat doc/weight array, term -> span) with
+the BM25 weight of every posting precomputed at build time. A query is a
+handful of span gathers and one bincount over the matched documents; terms
+are taken rarest first up to a postings budget, so a search costs about the
+same on any catalogue size.
+"""
+import logging
+import re
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from .product_table import BLACKLIST_KEYS, ProductTable
+from .sparse_ops import sum_by_node
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+TRIGRAM_WEIGHT = 0.3     # Trigram matches count less than whole-token matches
+MAX_DF_RATIO = 0.25      # Terms in more documents than this are not indexed (stop terms)
+MAX_QUERY_TERMS = 64     # Rarest query terms used per search
+MAX_QUERY_POSTINGS = 10_000  # Postings read per search (rarest terms first), bounds latency
+
+_WORD = re.compile(r"\w+")
+
+
+# ============================================================================
+# Analysis
+# ============================================================================
+
+def product_text(table: ProductTable, row: int) -> str:
+    """Indexed text of a product: name, category_name and key_params values"""
+    parts = [table.texts["name"][row] or "", table.interned["category_name"][row] or ""]
+    params = table.key_params[row]
+    if isinstance(params, dict):
+        parts.extend(str(value) for key, value in params.items()
+                     if key not in BLACKLIST_KEYS and value not in (None, ""))
+    return " ".join(parts)
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded words"""
+    return _WORD.findall(text.casefold())
+
+
+def trigrams(token: str) -> List[str]:
+    """Char trigrams of a "#"-padded token"""
+    padded = f"#{token}#"
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+def analyze(text: str) -> Tuple[List[str], List[str]]:
+    """(tokens, trigrams) of a text, with repetitions (term frequency)"""
+    tokens = tokenize(text)
+    grams = [gram for token in tokens for gram in trigrams(token)]
+    return tokens, grams
+
+
+# ============================================================================
+# Index
+# ============================================================================
+
+class _Postings:
+    """Postings of one term kind: term -> span of (doc, BM25 weight) arrays"""
+
+    __slots__ = ("spans", "docs", "weights", "idf")
+
+    def __init__(self, spans: Dict[str, Tuple[int, int]], docs: np.ndarray,
+                 weights: np.ndarray, idf: Dict[str, float]):
+        self.spans = spans
+        self.docs = docs
+        self.weights = weights
+        self.idf = idf
+
+    @classmethod
+    def empty(cls) -> "_Postings":
+        return cls({}, np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32), {})
+
+    @classmethod
+    def build(
+        cls,
+        terms: List[str],
+        term_column: np.ndarray,
+        doc_column: np.ndarray,
+        n_docs: int,
+        boost: float = 1.0,
+        max_df_ratio: float = MAX_DF_RATIO,
+    ) -> "_Postings":
+        """
+        BM25 postings from term occurrences.
+
+        Args:
+            terms: vocabulary (term id -> term)
+            term_column, doc_column: (term id, document) of every occurrence
+        """
+        if len(term_column) == 0:
+            return cls.empty()
+
+        doc_length = np.bincount(doc_column, minlength=n_docs).astype(np.float64)
+        avg_length = doc_length.mean()
+
+        # (term, doc) pairs with their frequency, grouped by term
+        pair, tf = np.unique(term_column * n_docs + doc_column, return_counts=True)
+        pair_term, pair_doc = pair // n_docs, pair % n_docs
+        df = np.bincount(pair_term, minlength=len(terms))
+        idf = np.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+
+        norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_length[pair_doc] / max(avg_length, 1e-9))
+        weights = boost * idf[pair_term] * tf * (BM25_K1 + 1.0) / (tf + norm)
+
+        # Stop terms: too common to discriminate, and the longest postings
+        keep = df[pair_term] <= max(1, max_df_ratio * n_docs)
+        pair_term, pair_doc, weights = pair_term[keep], pair_doc[keep], weights[keep]
+        starts = np.searchsorted(pair_term, np.arange(len(terms) + 1))
+
+        indexed = np.flatnonzero(starts[1:] > starts[:-1]).tolist()
+        return cls(
+            spans={terms[i]: (int(starts[i]), int(starts[i + 1])) for i in indexed},
+            docs=pair_doc.astype(np.int32),
+            weights=weights.astype(np.float32),
+            idf={terms[i]: float(idf[i]) for i in indexed},
+        )
+
+    def __len__(self) -> int:
+        return len(self.docs)
+
+
+def _token_columns(documents: List[List[str]]) -> Tuple[Dict[str, int], np.ndarray, np.ndarray]:
+    """(token -> id, token id and document of every token occurrence)"""
+    token_ids: Dict[str, int] = {}
+    token_column = np.fromiter(
+        (token_ids.setdefault(token, len(token_ids)) for tokens in documents for token in tokens),
+        dtype=np.int64,
+    )
+    doc_column = np.repeat(np.arange(len(documents)), [len(tokens) for tokens in documents])
+    return token_ids, token_column, doc_column
+
+
+def _trigram_columns(
+    token_ids: Dict[str, int],
+    token_column: np.ndarray,
+    doc_column: np.ndarray,
+) -> Tuple[List[str], np.ndarray, np.ndarray]:
+    """
+    (trigram vocabulary, trigram id and document of every trigram occurrence).
+
+    Trigrams are computed once per distinct token; occurrences are expanded
+    from the token occurrences with array ops.
+    """
+    gram_ids: Dict[str, int] = {}
+    token_grams = [[gram_ids.setdefault(gram, len(gram_ids)) for gram in trigrams(token)]
+                   for token in token_ids]
+    counts = np.fromiter((len(grams) for grams in token_grams), dtype=np.int64, count=len(token_grams))
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    flat = np.fromiter((gram for grams in token_grams for gram in grams), dtype=np.int64, count=int(starts[-1]))
+
+    # Occurrence i of a token with n trigrams -> flat[start(token) : start(token) + n]
+    lengths = counts[token_column]
+    offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    gram_column = flat[np.repeat(starts[token_column], lengths) + offsets]
+    return list(gram_ids), gram_column, np.repeat(doc_column, lengths)
+
+
+class LexicalIndex:
+    """
+    Inverted index over product text with BM25 search (read-only).
+
+    Documents are table rows (usually the accessories); search() returns
+    rows and BM25 scores.
+    """
+
+    def __init__(self, doc_rows: np.ndarray, tokens: _Postings, grams: _Postings):
+        self.doc_rows = doc_rows
+        self.tokens = tokens
+        self.grams = grams
+
+    @classmethod
+    def build(cls, table: ProductTable, rows: Iterable[int]) -> "LexicalIndex":
+        """Index the given table rows"""
+        start_time = time.perf_counter()
+        doc_rows = np.asarray(rows, dtype=np.int64)
+        n_docs = len(doc_rows)
+        documents = [tokenize(product_text(table, row)) for row in doc_rows.tolist()]
+
+        token_ids, token_column, doc_column = _token_columns(documents)
+        grams, gram_column, gram_doc_column = _trigram_columns(token_ids, token_column, doc_column)
+        index = cls(
+            doc_rows=doc_rows,
+            tokens=_Postings.build(list(token_ids), token_column, doc_column, n_docs),
+            grams=_Postings.build(grams, gram_column, gram_doc_column, n_docs, boost=TRIGRAM_WEIGHT),
+        )
+        logger.info(f"Lexical index: {n_docs} documents, {len(index.tokens.spans)} tokens, "
+                    f"{len(index.grams.spans)} trigrams, {len(index.tokens) + len(index.grams)} postings "
+                    f"({time.perf_counter() - start_time:.2f}s)")
+        return index
+
+    @classmethod
+    def empty(cls) -> "LexicalIndex":
+        return cls(np.empty(0, dtype=np.int64), _Postings.empty(), _Postings.empty())
+
+    def __len__(self) -> int:
+        """Number of documents"""
+        return len(self.doc_rows)
+
+    def _query_spans(self, text: str, max_terms: int, max_postings: int) -> List[Tuple[_Postings, int, int]]:
+        """
+        Postings spans of the distinct indexed query terms, rarest (highest
+        idf) first, until max_terms terms or max_postings postings are taken.
+        """
+        tokens, grams = analyze(text)
+        terms = [(postings.idf[term], postings, postings.spans[term])
+                 for postings, kind_terms in ((self.tokens, tokens), (self.grams, grams))
+                 for term in set(kind_terms) if term in postings.spans]
+        terms.sort(key=lambda term: -term[0])
+
+        spans = []
+        total = 0
+        for _, postings, (start, end) in terms[:max_terms]:
+            if spans and total + (end - start) > max_postings:
+                break
+            spans.append((postings, start, end))
+            total += end - start
+        return spans
+
+    def search(
+        self,
+        text: str,
+        limit: int = 20,
+        exclude_row: Optional[int] = None,
+        max_terms: int = MAX_QUERY_TERMS,
+        max_postings: int = MAX_QUERY_POSTINGS,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 search (each distinct query term counted once).
+
+        Returns: (table rows, score) of documents matching at least one term,
+            ordered by score (descending, ties by row)
+        """
+        spans = self._query_spans(text, max_terms, max_postings)
+        if not spans:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        docs = np.concatenate([postings.docs[start:end] for postings, start, end in spans])
+        weights = np.concatenate([postings.weights[start:end] for postings, start, end in spans])
+        # Summed per matched document: sort-based over the postings when they are
+        # short, a dense bincount only when they cover a good part of the documents
+        matched, scores = sum_by_node(docs, weights, len(self.doc_rows))
+
+        if exclude_row is not None:
+            keep = self.doc_rows[matched] != exclude_row
+            matched, scores = matched[keep], scores[keep]
+        if len(matched) > limit > 0:
+            # Documents down to the limit-th score, ties at the cut included
+            keep = scores >= np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            matched, scores = matched[keep], scores[keep]
+        order = np.lexsort((matched, -scores))[:limit]
+        return self.doc_rows[matched[order]], scores[order]
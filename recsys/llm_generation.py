@@ -0,0 +1,426 @@
+"""
+LLM Recommendation Generation Pipeline
+
+Asks an LLM (OpenAI-compatible chat completions API, LLM_API_URL) for
+accessory lists of main products and writes them into llm_recommendations.
+
+- Bounded concurrency: LLM_CONCURRENCY requests in flight, one HTTP client
+- Response cache: sha256(model + messages) -> content + usage
+  (temp/llm_response_cache.jsonl, append-only), so a repeated prompt costs nothing
+- Checkpoint: every finished product is appended to
+  temp/llm_generation_checkpoint.jsonl and written to the database in its own
+  transaction; an interrupted run resumes after the last finished product
+- Delta mode (default): products that already have llm_recommendations rows
+  are skipped, so catalogue growth only pays for new products
+- Token usage is summed per run (cached responses are counted separately)
+
+Output: temp/recommendations_output.json (same format as the ingestion input,
+merged with the previous file)
+
+Any OpenAI-compatible server works, including a local stub; LLM_API_URL has
+no default and the run stops if it is unset:
+    LLM_API_URL=http://localhost:8001/v1 python -m recsys.llm_generation
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+import httpx
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.config.config import settings
+
+from .llm_recommendations import RECOMMENDATIONS_FILE, ingest_recommendations
+from .product_table import ProductRecord
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TEMP_DIR = Path(__file__).parent / "temp"
+CACHE_FILE = TEMP_DIR / "llm_response_cache.jsonl"
+CHECKPOINT_FILE = TEMP_DIR / "llm_generation_checkpoint.jsonl"
+OUTPUT_FILE = RECOMMENDATIONS_FILE
+
+RECOMMENDATION_COUNT = 10
+MAX_RETRIES = 3      # Retry failed / rate-limited requests
+TEMPERATURE = 0.2
+
+SYSTEM_PROMPT = (
+    "Ты эксперт по строительным и отделочным материалам. "
+    "Для товара подбери сопутствующие товары, которые покупатель купит вместе с ним. "
+    f"Ответь JSON-массивом из {RECOMMENDATION_COUNT} строк - названий товаров, без пояснений."
+)
+
+
+# ============================================================================
+# Prompt and Response
+# ============================================================================
+
+def product_category(product: ProductRecord) -> str:
+    """'parent > category' breadcrumb of a product"""
+    parts = [product.get('parent_name'), product.get('category_name')]
+    return " > ".join(part for part in parts if part)
+
+
+def build_messages(product: ProductRecord) -> List[Dict]:
+    """Chat messages for one product"""
+    lines = [f"Товар: {product['name']}"]
+    category = product_category(product)
+    if category:
+        lines.append(f"Категория: {category}")
+    description = (product.get('description') or "").strip()
+    if description:
+        lines.append(f"Описание: {description[:1000]}")
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": "\n".join(lines)},
+    ]
+
+
+def prompt_key(model: str, messages: List[Dict]) -> str:
+    """Cache key: content hash of the model and the exact messages"""
+    payload = json.dumps({"model": model, "messages": messages}, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def parse_recommendations(content: str) -> List[str]:
+    """
+    Accessory names from a completion: a JSON array of strings, or one name
+    per line (list numbering / bullets stripped) if the model ignored the format.
+    """
+    content = content.strip()
+    fenced = re.search(r"```(?:json)?\s*(.*?)```", content, re.S)
+    if fenced:
+        content = fenced.group(1).strip()
+    try:
+        data = json.loads(content)
+        if isinstance(data, list):
+            return [str(item).strip() for item in data if str(item).strip()]
+    except ValueError:
+        pass
+    names = [re.sub(r"^\s*(?:\d+[.)]|[-*•])\s*", "", line).strip().strip('"') for line in content.splitlines()]
+    return [name for name in names if name]
+
+
+# ============================================================================
+# Response Cache and Checkpoint (append-only JSON lines)
+# ============================================================================
+
+def _read_jsonl(path: Path) -> List[Dict]:
+    """Records of a JSON lines file; a torn last line (crash mid-write) is skipped"""
+    if not path.exists():
+        return []
+    records = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+
+def _append_jsonl(path: Path, record: Dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+class ResponseCache:
+    """prompt_key -> {content, usage}, persisted as append-only JSON lines"""
+
+    def __init__(self, path: Path = CACHE_FILE):
+        self.path = Path(path)
+        self._entries = {record["key"]: record for record in _read_jsonl(self.path)}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict]:
+        return self._entries.get(key)
+
+    def put(self, key: str, content: str, usage: Dict):
+        record = {"key": key, "content": content, "usage": usage}
+        self._entries[key] = record
+        _append_jsonl(self.path, record)
+
+
+# ============================================================================
+# Token Usage
+# ============================================================================
+
+class TokenUsage:
+    """Token counters of a run (API calls vs cache hits)"""
+
+    FIELDS = ("prompt_tokens", "completion_tokens", "total_tokens")
+
+    def __init__(self):
+        self.spent = dict.fromkeys(self.FIELDS, 0)   # Paid for in this run
+        self.saved = dict.fromkeys(self.FIELDS, 0)   # Served from the cache
+        self.requests = 0
+        self.cache_hits = 0
+
+    def add(self, usage: Dict, cached: bool):
+        counters = self.saved if cached else self.spent
+        for field in self.FIELDS:
+            counters[field] += int(usage.get(field) or 0)
+        if cached:
+            self.cache_hits += 1
+        else:
+            self.requests += 1
+
+    def to_dict(self) -> Dict:
+        """Spent tokens in the output file's token_usage format"""
+        return {
+            "total_prompt_tokens": self.spent["prompt_tokens"],
+            "total_completion_tokens": self.spent["completion_tokens"],
+            "total_tokens": self.spent["total_tokens"],
+        }
+
+
+# ============================================================================
+# LLM Client
+# ============================================================================
+
+async def chat_completion(client: httpx.AsyncClient, model: str, messages: List[Dict]) -> Dict:
+    """
+    One chat completion with retries (exponential backoff on errors, 429 and 5xx).
+
+    Returns: {"content": str, "usage": {prompt_tokens, completion_tokens, total_tokens}}
+    """
+    payload = {"model": model, "messages": messages, "temperature": TEMPERATURE}
+    for attempt in range(MAX_RETRIES):
+        try:
+            response = await client.post("/chat/completions", json=payload)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise httpx.HTTPStatusError(f"HTTP {response.status_code}", request=response.request,
+                                            response=response)
+            response.raise_for_status()
+            data = response.json()
+            return {
+                "content": data["choices"][0]["message"]["content"] or "",
+                "usage": data.get("usage") or {},
+            }
+        except Exception:
+            if attempt == MAX_RETRIES - 1:
+                raise
+            await asyncio.sleep(2 ** attempt)
+
+
+async def generate_for_product(
+    client: httpx.AsyncClient,
+    semaphore: asyncio.Semaphore,
+    product: ProductRecord,
+    model: str,
+    cache: ResponseCache,
+    usage: TokenUsage,
+) -> Dict:
+    """Recommendations of one product (cache first), in the output file's result format"""
+    messages = build_messages(product)
+    key = prompt_key(model, messages)
+    result = {
+        "product_id": product['id'],
+        "product_name": product['name'],
+        "category": product_category(product),
+        "recommendations": [],
+        "success": False,
+        "tokens": {},
+        "prompt_key": key,
+    }
+
+    cached = cache.get(key)
+    if cached is None:
+        try:
+            async with semaphore:
+                response = await chat_completion(client, model, messages)
+        except Exception as e:
+            print(f"  Failed product {product['id']} after {MAX_RETRIES} attempts: {e}")
+            result["error"] = str(e)
+            return result
+        cache.put(key, response["content"], response["usage"])
+        usage.add(response["usage"], cached=False)
+    else:
+        response = cached
+        usage.add(response["usage"], cached=True)
+
+    result["recommendations"] = parse_recommendations(response["content"])[:RECOMMENDATION_COUNT]
+    result["success"] = bool(result["recommendations"])
+    result["tokens"] = response["usage"]
+    return result
+
+
+# ============================================================================
+# Main Pipeline
+# ============================================================================
+
+def get_products_with_recommendations(engine, product_ids: List[int]) -> Set[int]:
+    """Main products that already have llm_recommendations rows"""
+    with Session(engine) as session:
+        result = session.execute(
+            text("SELECT DISTINCT main_product_id FROM llm_recommendations WHERE main_product_id = ANY(:ids)"),
+            {"ids": product_ids}
+        )
+        return {row[0] for row in result.fetchall()}
+
+
+def write_output(results: List[Dict], mode: str, path: Path = OUTPUT_FILE):
+    """
+    Merge results into the output file (by product_id) and write it atomically.
+
+    token_usage is the sum over all results in the file.
+    """
+    path = Path(path)
+    previous = []
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            previous = json.load(f).get("results", [])
+    merged = {r["product_id"]: r for r in previous}
+    merged.update({r["product_id"]: {k: v for k, v in r.items() if k not in ("prompt_key", "error")}
+                   for r in results})
+    merged_results = [merged[product_id] for product_id in sorted(merged)]
+
+    totals = dict.fromkeys(TokenUsage.FIELDS, 0)
+    for r in merged_results:
+        for field in TokenUsage.FIELDS:
+            totals[field] += int((r.get("tokens") or {}).get(field) or 0)
+
+    output = {
+        "generated_at": datetime.now().isoformat(),
+        "mode": mode,
+        "total_products": len(merged_results),
+        "success_count": sum(1 for r in merged_results if r.get("success")),
+        "fail_count": sum(1 for r in merged_results if not r.get("success")),
+        "token_usage": {
+            "total_prompt_tokens": totals["prompt_tokens"],
+            "total_completion_tokens": totals["completion_tokens"],
+            "total_tokens": totals["total_tokens"],
+        },
+        "results": merged_results,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, ensure_ascii=False, indent=2)
+    tmp_path.replace(path)
+
+
+async def generate(
+    products: List[ProductRecord],
+    engine,
+    api_url: str,
+    model: str,
+    api_key: str = "",
+    concurrency: int = 8,
+    timeout_s: float = 120.0,
+    mode: str = "delta",
+    cache_path: Path = CACHE_FILE,
+    checkpoint_path: Path = CHECKPOINT_FILE,
+    output_path: Path = OUTPUT_FILE,
+) -> Dict:
+    """
+    Generate recommendations for products and write them to llm_recommendations.
+
+    mode: "delta" skips products that already have rows, "full" regenerates
+        (and replaces) all of them; cached prompts are not sent again either way.
+
+    Returns: counters (products, skipped, resumed, success, failed, requests,
+        cache_hits, token_usage)
+    
+    Raises: ValueError if api_url is empty
+    """
+    if not api_url:
+        raise ValueError("LLM API URL is not set (LLM_API_URL)")
+    checkpoint_path = Path(checkpoint_path)
+    done = {r["product_id"]: r for r in _read_jsonl(checkpoint_path)}
+
+    skip = set(done)
+    if mode == "delta":
+        skip |= get_products_with_recommendations(engine, [p['id'] for p in products])
+    todo = [p for p in products if p['id'] not in skip]
+
+    cache = ResponseCache(cache_path)
+    usage = TokenUsage()
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+    resumed = sum(1 for p in products if p['id'] in done)
+    stats = {"products": len(products), "skipped": len(products) - len(todo) - resumed,
+             "resumed": resumed, "success": 0, "failed": 0}
+
+    async with httpx.AsyncClient(base_url=api_url.rstrip("/"), headers=headers, timeout=timeout_s) as client:
+        tasks = [asyncio.create_task(generate_for_product(client, semaphore, p, model, cache, usage))
+                 for p in todo]
+        for task in asyncio.as_completed(tasks):
+            result = await task
+            if result["success"]:
+                # Database first: a checkpointed product is always in the table
+                await asyncio.to_thread(ingest_recommendations, engine, [result], mode == "full")
+                _append_jsonl(checkpoint_path, result)
+                done[result["product_id"]] = result
+                stats["success"] += 1
+            else:
+                stats["failed"] += 1
+
+    write_output(list(done.values()), mode, output_path)
+    if stats["failed"] == 0:
+        # Run complete: the next run starts fresh
+        checkpoint_path.unlink(missing_ok=True)
+
+    stats.update(requests=usage.requests, cache_hits=usage.cache_hits,
+                 token_usage=usage.to_dict(), tokens_saved=usage.saved["total_tokens"])
+    return stats
+
+
+async def main(mode: str = "delta") -> bool:
+    """Generate LLM recommendations for all main products"""
+    print("\n" + "=" * 80)
+    print("LLM Recommendation Generation")
+    print("=" * 80)
+    if not settings.LLM_API_URL:
+        print("ERROR: LLM_API_URL is not set (OpenAI-compatible base URL, e.g. https://api.openai.com/v1)")
+        return False
+    print(f"  API: {settings.LLM_API_URL}  Model: {settings.LLM_MODEL}  Mode: {mode}")
+
+    from .db_repository import ProductRepository
+    repo = ProductRepository()
+    products = repo.get_main_products()
+    print(f"Main products: {len(products)}")
+
+    engine = create_engine(settings.database_url_sync, echo=False)
+    start_time = time.time()
+    stats = await generate(
+        products, engine,
+        api_url=settings.LLM_API_URL,
+        model=settings.LLM_MODEL,
+        api_key=settings.LLM_API_KEY,
+        concurrency=settings.LLM_CONCURRENCY,
+        timeout_s=settings.LLM_TIMEOUT_S,
+        mode=mode,
+    )
+    elapsed = time.time() - start_time
+
+    print(f"Skipped: {stats['skipped']} (already generated), resumed: {stats['resumed']}")
+    print(f"Generated: {stats['success']}, failed: {stats['failed']}")
+    print(f"Requests: {stats['requests']}, cache hits: {stats['cache_hits']}")
+    print(f"Tokens: {stats['token_usage']} (saved by cache: {stats['tokens_saved']})")
+    print(f"Time: {elapsed:.1f} seconds")
+    return stats["failed"] == 0
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main(mode="full" if "--full" in sys.argv else "delta"))
+    if not success:
+        exit(1)
@@ -0,0 +1,233 @@
+"""
+LLM Recommendations - Precomputed accessory lists from the LLM
+
+temp/recommendations_output.json (LLM generation output) is ingested into
+llm_recommendations as unresolved rows (rec_text, rec_rank). Resolving a
+row sets matched_product_id / match_score / resolved_rank; resolved rows
+are loaded into an LLMRecommendationIndex that the "llm" candidate source
+reads without a query.
+"""
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.config.config import settings
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TEMP_DIR = Path(__file__).parent / "temp"
+RECOMMENDATIONS_FILE = TEMP_DIR / "recommendations_output.json"
+
+# Resolved rows, best first per main product
+RESOLVED_SQL = text("""
+    SELECT main_product_id, matched_product_id, match_score, resolved_rank
+    FROM llm_recommendations
+    WHERE matched_product_id IS NOT NULL
+      AND matched_product_id != main_product_id
+    ORDER BY main_product_id, resolved_rank, rec_rank, id
+""")
+
+
+# ============================================================================
+# In-memory Index
+# ============================================================================
+
+class LLMRecommendationIndex:
+    """
+    main_product_id -> resolved recommendations, read-only.
+
+    All recommendations live in flat arrays grouped by main product; a dict
+    maps each main product to its (start, end) span, so a lookup is one
+    dict access plus array slices (views, no copies).
+    """
+
+    def __init__(
+        self,
+        main_ids: np.ndarray,
+        matched_ids: np.ndarray,
+        scores: np.ndarray,
+        ranks: np.ndarray,
+    ):
+        """Arrays must be grouped by main_ids, best recommendation first within a group"""
+        self.matched_ids = matched_ids
+        self.scores = scores
+        self.ranks = ranks
+        self._spans: Dict[int, Tuple[int, int]] = {}
+        if len(main_ids):
+            starts = np.flatnonzero(np.r_[True, main_ids[1:] != main_ids[:-1]])
+            ends = np.r_[starts[1:], len(main_ids)]
+            self._spans = {int(main_ids[s]): (int(s), int(e)) for s, e in zip(starts, ends)}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Tuple[int, int, Optional[float], int]]) -> "LLMRecommendationIndex":
+        """
+        Build from (main_product_id, matched_product_id, match_score, resolved_rank)
+        rows, best first per main product (RESOLVED_SQL order).
+
+        A product matched by several recommendations keeps its first entry.
+        """
+        main_ids, matched_ids, scores, ranks = [], [], [], []
+        seen = set()
+        for main_id, matched_id, score, rank in rows:
+            if (main_id, matched_id) in seen:
+                continue
+            seen.add((main_id, matched_id))
+            main_ids.append(main_id)
+            matched_ids.append(matched_id)
+            scores.append(np.nan if score is None else score)
+            ranks.append(rank)
+        # Group by main product, keeping the order within each product
+        main_ids = np.array(main_ids, dtype=np.int64)
+        order = np.argsort(main_ids, kind='stable')
+        return cls(
+            main_ids=main_ids[order],
+            matched_ids=np.array(matched_ids, dtype=np.int64)[order],
+            scores=np.array(scores, dtype=np.float64)[order],
+            ranks=np.array(ranks, dtype=np.int32)[order],
+        )
+
+    @classmethod
+    def empty(cls) -> "LLMRecommendationIndex":
+        return cls.from_rows([])
+
+    def __len__(self) -> int:
+        """Number of recommendations"""
+        return len(self.matched_ids)
+
+    def __contains__(self, main_product_id: int) -> bool:
+        return main_product_id in self._spans
+
+    @property
+    def product_count(self) -> int:
+        return len(self._spans)
+
+    def pairs(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(main_ids, matched_ids) of all recommendations"""
+        main_ids = np.empty(len(self.matched_ids), dtype=np.int64)
+        for main_id, (start, end) in self._spans.items():
+            main_ids[start:end] = main_id
+        return main_ids, self.matched_ids
+
+    def lookup(self, main_product_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(matched_ids, match_scores) of a main product, best first; empty if none"""
+        start, end = self._spans.get(main_product_id, (0, 0))
+        return self.matched_ids[start:end], self.scores[start:end]
+
+    def get(self, main_product_id: int) -> List[Tuple[int, float, int]]:
+        """[(matched_product_id, match_score, resolved_rank)] of a main product"""
+        start, end = self._spans.get(main_product_id, (0, 0))
+        return list(zip(self.matched_ids[start:end].tolist(),
+                        self.scores[start:end].tolist(),
+                        self.ranks[start:end].tolist()))
+
+
+def load_index(engine) -> LLMRecommendationIndex:
+    """Resolved llm_recommendations as an in-memory index (one query)"""
+    with Session(engine) as session:
+        rows = session.execute(RESOLVED_SQL).all()
+    return LLMRecommendationIndex.from_rows(tuple(row) for row in rows)
+
+
+# ============================================================================
+# Ingestion
+# ============================================================================
+
+def read_recommendations_file(path: Path = RECOMMENDATIONS_FILE) -> List[Dict]:
+    """Successful results of an LLM generation run: [{product_id, recommendations, ...}]"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return [r for r in data.get("results", []) if r.get("success") and r.get("recommendations")]
+
+
+def ingest_recommendations(engine, results: List[Dict], replace: bool = False) -> Tuple[int, int]:
+    """
+    Insert LLM results into llm_recommendations as unresolved rows.
+
+    Products that already have rows are skipped (their resolved matches are
+    kept) unless replace is set, which deletes and re-inserts them. Results
+    for products missing from the catalogue are skipped.
+
+    Returns: (products ingested, rows inserted)
+    """
+    product_ids = [int(r["product_id"]) for r in results]
+    with Session(engine) as session:
+        known = {row[0] for row in session.execute(
+            text("SELECT id FROM products WHERE id = ANY(:ids)"), {"ids": product_ids}
+        )}
+        if replace:
+            session.execute(text("DELETE FROM llm_recommendations WHERE main_product_id = ANY(:ids)"),
+                            {"ids": product_ids})
+            existing = set()
+        else:
+            existing = {row[0] for row in session.execute(
+                text("SELECT DISTINCT main_product_id FROM llm_recommendations WHERE main_product_id = ANY(:ids)"),
+                {"ids": product_ids}
+            )}
+
+        params = []
+        ingested = 0
+        for result in results:
+            product_id = int(result["product_id"])
+            if product_id not in known or product_id in existing:
+                continue
+            ingested += 1
+            existing.add(product_id)
+            params.extend(
+                {"main_product_id": product_id, "rec_text": rec_text, "rec_rank": rank}
+                for rank, rec_text in enumerate(result["recommendations"], start=1)
+            )
+
+        if params:
+            session.execute(text("""
+                INSERT INTO llm_recommendations (main_product_id, rec_text, rec_rank, resolved_rank)
+                VALUES (:main_product_id, :rec_text, :rec_rank, :rec_rank)
+            """), params)
+        session.commit()
+    return ingested, len(params)
+
+
+def main(path: Optional[Path] = None, replace: bool = False) -> bool:
+    """Ingest the LLM output file into llm_recommendations"""
+    print("\n" + "=" * 80)
+    print("LLM Recommendations Ingestion")
+    print("=" * 80)
+
+    path = Path(path or RECOMMENDATIONS_FILE)
+    if not path.exists():
+        print(f"No LLM output at {path}, skipping")
+        return True
+
+    try:
+        results = read_recommendations_file(path)
+    except Exception as e:
+        print(f"ERROR: Failed to read {path} - {e}")
+        return False
+    print(f"Loaded: {len(results)} products with recommendations")
+
+    engine = create_engine(settings.database_url_sync, echo=False)
+    products, rows = ingest_recommendations(engine, results, replace=replace)
+    print(f"Ingested: {products} products, {rows} recommendations "
+          f"({len(results) - products} skipped: already present or unknown)")
+
+    index = load_index(engine)
+    print(f"Resolved: {len(index)} recommendations for {index.product_count} products")
+    return True
+
+
+if __name__ == "__main__":
+    success = main(replace="--replace" in sys.argv)
+    if not success:
+        exit(1)
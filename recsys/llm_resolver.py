@@ -0,0 +1,327 @@
+"""
+LLM Recommendation Resolver
+
+Maps llm_recommendations.rec_text ("Профиль потолочный ПП 60х27 мм 3м") to
+catalogue accessories:
+
+1. Load unresolved rows, deduplicate texts (whitespace/case normalized)
+2. Look up text -> match in the cache (content hash of model + text)
+3. Embed the remaining texts with bge-m3, batched and retried like the
+   product embedding job (embedding_generation.run_sliding_window)
+4. Nearest accessory by cosine over the in-memory embedding matrix
+   (one (texts x accessories) matmul per chunk)
+5. Bulk-write matched_product_id / match_score, then recompute
+   resolved_rank for the touched main products
+
+Re-runs only embed texts that are not cached yet.
+
+Cache: temp/llm_match_cache.json {"model", "matches": {hash: [product_id, score]}}
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# Add project root to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+from app.config.config import settings
+
+from .embedding_generation import MODEL_NAME, run_sliding_window
+from .product_table import ProductTable
+
+try:
+    from ollama import AsyncClient
+    OLLAMA_AVAILABLE = True
+except ImportError:
+    OLLAMA_AVAILABLE = False
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TEMP_DIR = Path(__file__).parent / "temp"
+CACHE_FILE = TEMP_DIR / "llm_match_cache.json"
+
+MATCH_CHUNK_SIZE = 1024     # Texts per similarity matmul
+MIN_MATCH_SCORE = 0.75      # Below this (1 - cosine_distance/2) the text stays unmatched
+
+
+# ============================================================================
+# Text Keys and Cache
+# ============================================================================
+
+def normalize_text(rec_text: str) -> str:
+    """Whitespace-collapsed, case-folded text (the unit of deduplication)"""
+    return " ".join(rec_text.split()).casefold()
+
+
+def text_key(normalized: str, model: str = MODEL_NAME) -> str:
+    """Content hash of a normalized text for a given embedding model"""
+    return hashlib.sha256(f"{model}\n{normalized}".encode("utf-8")).hexdigest()
+
+
+def load_cache(path: Path = CACHE_FILE, model: str = MODEL_NAME) -> Dict[str, Tuple[Optional[int], float]]:
+    """hash -> (product_id or None, score); empty if missing or built with another model"""
+    path = Path(path)
+    if not path.exists():
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except Exception as e:
+        print(f"WARNING: Ignoring unreadable match cache {path} - {e}")
+        return {}
+    if data.get("model") != model:
+        return {}
+    return {key: (product_id, score) for key, (product_id, score) in data.get("matches", {}).items()}
+
+
+def save_cache(cache: Dict[str, Tuple[Optional[int], float]], path: Path = CACHE_FILE, model: str = MODEL_NAME):
+    """Write the cache next to the target and rename it into place"""
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"model": model, "matches": {key: list(match) for key, match in cache.items()}}, f)
+    tmp_path.replace(path)
+
+
+# ============================================================================
+# Embedding and Matching
+# ============================================================================
+
+async def embed_texts(
+    texts: Sequence[str],
+    ollama_url: Optional[str] = None,
+    batch_size: Optional[int] = None,
+    concurrency: Optional[int] = None
+) -> List[Optional[np.ndarray]]:
+    """
+    bge-m3 embeddings, batched and retried like the product embedding job
+    (embed_batch_async in a run_sliding_window of concurrency requests).
+
+    Args:
+        batch_size: texts per request (default settings.EMBEDDING_BATCH_SIZE)
+        concurrency: requests in flight (default settings.EMBEDDING_CONCURRENCY)
+
+    Returns: one float32 vector per text, None where the batch failed
+    after MAX_RETRIES attempts
+    """
+    batch_size = max(1, batch_size or settings.EMBEDDING_BATCH_SIZE)
+    concurrency = max(1, concurrency or settings.EMBEDDING_CONCURRENCY)
+    client = AsyncClient(host=ollama_url) if ollama_url else AsyncClient()
+    embeddings: List[Optional[np.ndarray]] = [None] * len(texts)
+
+    async def store(results):
+        for i, vector in results:
+            if vector is not None:
+                embeddings[i] = np.asarray(vector, dtype=np.float32)
+
+    indexed = list(enumerate(texts))
+    batches = (indexed[start:start + batch_size] for start in range(0, len(indexed), batch_size))
+    await run_sliding_window(batches, client, store, concurrency)
+    return embeddings
+
+
+def match_embeddings(
+    table: ProductTable,
+    candidate_rows: np.ndarray,
+    queries: np.ndarray,
+    chunk_size: int = MATCH_CHUNK_SIZE
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Nearest candidate row per query by cosine similarity.
+
+    Args:
+        candidate_rows: table rows to match against (rows without embedding are skipped)
+        queries: (n, dim) query embeddings
+
+    Returns: (product_ids, similarity 1 - cosine_distance/2), product id -1
+        where there is no candidate or the query is a zero vector
+    """
+    rows = candidate_rows[table.has_embedding[candidate_rows] & (table.norms[candidate_rows] > 0)]
+    product_ids = np.full(len(queries), -1, dtype=np.int64)
+    similarity = np.zeros(len(queries))
+    if len(rows) == 0 or len(queries) == 0:
+        return product_ids, similarity
+
+    matrix = table.embeddings[rows] / table.norms[rows, None]
+    query_norms = np.linalg.norm(queries, axis=1)
+    valid = query_norms > 0
+    units = np.zeros_like(queries, dtype=np.float32)
+    units[valid] = queries[valid] / query_norms[valid, None]
+
+    for start in range(0, len(queries), chunk_size):
+        cosine = units[start:start + chunk_size] @ matrix.T
+        best = np.argmax(cosine, axis=1)
+        product_ids[start:start + len(best)] = table.ids[rows[best]]
+        similarity[start:start + len(best)] = 1.0 - (1.0 - cosine[np.arange(len(best)), best].astype(np.float64)) / 2.0
+    product_ids[~valid] = -1
+    similarity[~valid] = 0.0
+    return product_ids, similarity
+
+
+# ============================================================================
+# Database Functions
+# ============================================================================
+
+def get_unresolved_rows(engine, all_rows: bool = False) -> List[Tuple[int, int, str]]:
+    """(id, main_product_id, rec_text) of rows never resolved (or of every row)"""
+    where = "" if all_rows else "WHERE matched_product_id IS NULL AND match_score IS NULL"
+    with Session(engine) as session:
+        result = session.execute(text(
+            f"SELECT id, main_product_id, rec_text FROM llm_recommendations {where} ORDER BY id"
+        ))
+        return [tuple(row) for row in result.all()]
+
+
+def write_matches(engine, updates: List[Tuple[int, Optional[int], float]]) -> int:
+    """
+    Bulk-write (row id, matched_product_id, match_score) and recompute
+    resolved_rank of the touched main products, in one transaction.
+
+    resolved_rank numbers matched rows by rec_rank (1, 2, ...), unmatched
+    rows follow.
+    """
+    if not updates:
+        return 0
+    ids, product_ids, scores = (list(column) for column in zip(*updates))
+    with Session(engine) as session:
+        session.execute(text("""
+            UPDATE llm_recommendations AS r
+            SET matched_product_id = v.matched_product_id,
+                match_score = v.match_score
+            FROM unnest(CAST(:ids AS integer[]),
+                        CAST(:product_ids AS integer[]),
+                        CAST(:scores AS double precision[]))
+                 AS v(id, matched_product_id, match_score)
+            WHERE r.id = v.id
+        """), {"ids": ids, "product_ids": product_ids, "scores": scores})
+        session.execute(text("""
+            UPDATE llm_recommendations AS r
+            SET resolved_rank = ranked.rn
+            FROM (
+                SELECT id, ROW_NUMBER() OVER (
+                    PARTITION BY main_product_id
+                    ORDER BY matched_product_id IS NULL, rec_rank, id
+                ) AS rn
+                FROM llm_recommendations
+                WHERE main_product_id IN (
+                    SELECT main_product_id FROM llm_recommendations WHERE id = ANY(:ids)
+                )
+            ) AS ranked
+            WHERE r.id = ranked.id
+        """), {"ids": ids})
+        session.commit()
+    return len(updates)
+
+
+# ============================================================================
+# Main Pipeline
+# ============================================================================
+
+async def resolve(
+    engine,
+    table: ProductTable,
+    accessory_rows: np.ndarray,
+    ollama_url: Optional[str] = None,
+    cache_path: Path = CACHE_FILE,
+    all_rows: bool = False,
+    min_score: float = MIN_MATCH_SCORE,
+) -> Dict:
+    """
+    Resolve llm_recommendations rows against the accessories of a table.
+
+    Cached matches whose product is no longer an accessory with an
+    embedding are resolved again. Texts whose embedding failed stay
+    unresolved for the next run.
+
+    Returns: counters (rows, unique_texts, cached, embedded, failed, matched, written)
+    """
+    rows = get_unresolved_rows(engine, all_rows=all_rows)
+    stats = {"rows": len(rows), "unique_texts": 0, "cached": 0, "embedded": 0,
+             "failed": 0, "matched": 0, "written": 0}
+    if not rows:
+        return stats
+
+    # Deduplicate texts
+    keys = {}
+    for _, _, rec_text in rows:
+        normalized = normalize_text(rec_text)
+        keys.setdefault(text_key(normalized), normalized)
+    stats["unique_texts"] = len(keys)
+
+    # Cached matches still pointing at a current accessory
+    cache = load_cache(cache_path)
+    valid_ids = set(table.ids[accessory_rows[table.has_embedding[accessory_rows]]].tolist())
+    todo = [key for key in keys
+            if key not in cache or (cache[key][0] is not None and cache[key][0] not in valid_ids)]
+    stats["cached"] = len(keys) - len(todo)
+
+    # Embed and match the rest
+    if todo:
+        embeddings = await embed_texts([keys[key] for key in todo], ollama_url)
+        embedded = [i for i, vector in enumerate(embeddings) if vector is not None]
+        stats["embedded"] = len(embedded)
+        stats["failed"] = len(todo) - len(embedded)
+        if embedded:
+            queries = np.stack([embeddings[i] for i in embedded])
+            product_ids, similarity = match_embeddings(table, accessory_rows, queries)
+            for i, product_id, score in zip(embedded, product_ids.tolist(), similarity.tolist()):
+                cache[todo[i]] = (product_id if product_id >= 0 else None, round(score, 6))
+            save_cache(cache, cache_path)
+
+    # Row updates (texts without a cache entry failed to embed)
+    updates = []
+    for row_id, _, rec_text in rows:
+        match = cache.get(text_key(normalize_text(rec_text)))
+        if match is None:
+            continue
+        product_id, score = match
+        if product_id is not None and score < min_score:
+            product_id = None
+        stats["matched"] += product_id is not None
+        updates.append((row_id, product_id, score))
+    stats["written"] = write_matches(engine, updates)
+    return stats
+
+
+async def main(ollama_url: Optional[str] = None, all_rows: bool = False) -> bool:
+    """Resolve unresolved llm_recommendations rows (all rows with all_rows)"""
+    print("\n" + "=" * 80)
+    print("LLM Recommendation Resolver")
+    print("=" * 80)
+
+    if not OLLAMA_AVAILABLE:
+        print("ERROR: ollama library not installed")
+        return False
+
+    from .db_repository import ProductRepository
+    repo = ProductRepository()
+    print(f"Catalogue: {len(repo.table)} products, {len(repo.get_accessory_rows())} accessories")
+
+    engine = create_engine(settings.database_url_sync, echo=False)
+    start_time = time.time()
+    stats = await resolve(engine, repo.table, repo.get_accessory_rows(), ollama_url, all_rows=all_rows)
+    elapsed = time.time() - start_time
+
+    print(f"Rows: {stats['rows']} ({stats['unique_texts']} unique texts)")
+    print(f"Cached: {stats['cached']}, embedded: {stats['embedded']}, failed: {stats['failed']}")
+    print(f"Matched: {stats['matched']} of {stats['written']} written (min score {MIN_MATCH_SCORE})")
+    print(f"Time: {elapsed:.1f} seconds")
+    return stats["failed"] == 0
+
+
+if __name__ == "__main__":
+    success = asyncio.run(main(all_rows="--all" in sys.argv))
+    if not success:
+        exit(1)
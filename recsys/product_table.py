@@ -0,0 +1,334 @@
+"""
+Product Table - Struct-of-arrays product catalogue
+
+One array per column instead of one dict per product:
+- numeric columns: float64 arrays (NaN = NULL)
+- low-cardinality strings (role, category, vendor, ...): int32 codes + interned vocabulary
+- free text (name, url, description, ...): plain lists
+- embeddings: one (N, 1024) float32 matrix + presence mask
+- expert embeddings: (K, 1024) matrix for the K products that have one + row -> slot
+
+Rows are ordered by product id, so id -> row is a binary search.
+Row indexes for role/type/category are built with the table, so filtered
+lookups cost O(result) and a reload rebuilds them together with the data.
+ProductRecord is a read-only dict-like view of one row; dicts are only
+built at the API boundary (ProductRecord.to_dict()).
+"""
+import sys
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+EMBEDDING_DIM = 1024
+
+ID_COLUMN = "id"
+FLOAT_COLUMNS = ["price", "weight_kg", "shipping_weight_kg", "volume_l", "length_mm"]
+INTERNED_COLUMNS = ["product_role", "category_id", "category_name", "type", "parent_id", "parent_name", "vendor"]
+TEXT_COLUMNS = ["name", "picture_url", "url", "description"]
+KEY_PARAMS_COLUMN = "key_params"
+
+# key_params keys that carry no product meaning (dropped by feature
+# engineering and by the lexical index)
+BLACKLIST_KEYS = {
+    "Артикул", "Код товара", "Модель",
+    "Количество в упаковке", "Количество предметов", "Вес", "Вес брутто",
+    "Объем", "В упаковке", "Тип упаковки",
+    "Дополнительно", "Описание", "Комплектация", "Гарантия",
+    "Страна", "Страна производства", "Бренд", "Серия",
+}
+EMBEDDING_COLUMN = "embedding"
+EXPERT_EMBEDDING_COLUMN = "expert_embedding"
+
+# Same key order as the former per-product dicts
+COLUMNS = [
+    "id", "name", "price", "product_role",
+    "category_id", "category_name",
+    "type", "parent_id", "parent_name",
+    "vendor", "picture_url", "url", "description",
+    "weight_kg", "shipping_weight_kg", "volume_l", "length_mm",
+    "key_params", "embedding",
+]
+_COLUMN_SET = frozenset(COLUMNS)
+
+# Interned column combinations with a precomputed value -> rows index
+INDEXED_COLUMNS = [
+    ("product_role",),
+    ("type",),
+    ("category_id",),
+    ("category_name",),
+    ("product_role", "type"),
+    ("category_id", "product_role"),
+]
+
+
+class InternedColumn:
+    """String column stored as int32 codes into a vocabulary of interned strings"""
+
+    __slots__ = ("codes", "values", "_code_of")
+
+    def __init__(self, codes: np.ndarray, values: List[Optional[str]]):
+        self.codes = codes
+        self.values = values
+        self._code_of = {v: i for i, v in enumerate(values)}
+
+    @classmethod
+    def from_values(cls, values: Iterable[Optional[str]]) -> "InternedColumn":
+        vocab: List[Optional[str]] = []
+        code_of: Dict[Optional[str], int] = {}
+        codes = []
+        for value in values:
+            code = code_of.get(value)
+            if code is None:
+                code = len(vocab)
+                code_of[value] = code
+                vocab.append(sys.intern(value) if isinstance(value, str) else value)
+            codes.append(code)
+        return cls(np.asarray(codes, dtype=np.int32), vocab)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        return self.values[self.codes[row]]
+
+    def code_of(self, value: Optional[str]) -> Optional[int]:
+        """Code of a value, None if the value does not occur in the column"""
+        return self._code_of.get(value)
+
+
+class ColumnIndex:
+    """Value code -> ascending row array, for one or more interned columns"""
+
+    __slots__ = ("columns", "_radix", "_order", "_starts")
+
+    def __init__(self, columns: Tuple[str, ...], interned: Dict[str, InternedColumn]):
+        self.columns = columns
+        # Composite code: mixed-radix number over the per-column codes
+        self._radix = [len(interned[c].values) for c in columns]
+        codes = np.zeros(len(interned[columns[0]].codes), dtype=np.int64)
+        for column, radix in zip(columns, self._radix):
+            codes = codes * radix + interned[column].codes
+        n_codes = int(np.prod(self._radix)) if codes.size else 0
+
+        self._order = np.argsort(codes, kind="stable")
+        self._starts = np.zeros(n_codes + 1, dtype=np.int64)
+        np.cumsum(np.bincount(codes, minlength=n_codes), out=self._starts[1:])
+
+    def rows(self, codes: Tuple[int, ...]) -> np.ndarray:
+        code = 0
+        for value_code, radix in zip(codes, self._radix):
+            code = code * radix + value_code
+        return self._order[self._starts[code]:self._starts[code + 1]]
+
+
+class ProductTable:
+    """Columnar product catalogue (rows sorted by id)"""
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        floats: Dict[str, np.ndarray],
+        interned: Dict[str, InternedColumn],
+        texts: Dict[str, List[Optional[str]]],
+        key_params: List[dict],
+        embeddings: np.ndarray,
+        has_embedding: np.ndarray,
+        expert_embeddings: Optional[np.ndarray] = None,
+        expert_slot: Optional[np.ndarray] = None,
+    ):
+        self.ids = ids
+        self.floats = floats
+        self.interned = interned
+        self.texts = texts
+        self.key_params = key_params
+        self.embeddings = embeddings
+        self.has_embedding = has_embedding
+        # Expert embeddings are sparse (main products), stored compactly:
+        # expert_embeddings[expert_slot[row]], slot -1 = none
+        if expert_embeddings is None:
+            expert_embeddings = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+        if expert_slot is None:
+            expert_slot = np.full(len(ids), -1, dtype=np.int32)
+        self.expert_embeddings = expert_embeddings
+        self.expert_slot = expert_slot
+        self._norms: Optional[np.ndarray] = None
+        self._indexes = {columns: ColumnIndex(columns, interned) for columns in INDEXED_COLUMNS}
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[Dict], dim: int = EMBEDDING_DIM) -> "ProductTable":
+        """Build a table from product dicts (ORM load path)"""
+        rows = sorted(rows, key=lambda r: r[ID_COLUMN])
+        n = len(rows)
+
+        embeddings = np.zeros((n, dim), dtype=np.float32)
+        has_embedding = np.zeros(n, dtype=np.bool_)
+        expert_vectors = []
+        expert_slot = np.full(n, -1, dtype=np.int32)
+        for i, row in enumerate(rows):
+            vector = row.get(EMBEDDING_COLUMN)
+            if vector is not None:
+                embeddings[i] = np.asarray(vector, dtype=np.float32)
+                has_embedding[i] = True
+            expert_vector = row.get(EXPERT_EMBEDDING_COLUMN)
+            if expert_vector is not None:
+                expert_slot[i] = len(expert_vectors)
+                expert_vectors.append(np.asarray(expert_vector, dtype=np.float32))
+        expert_embeddings = np.array(expert_vectors, dtype=np.float32).reshape(len(expert_vectors), dim)
+
+        return cls(
+            ids=np.fromiter((r[ID_COLUMN] for r in rows), dtype=np.int64, count=n),
+            floats={
+                name: np.array([np.nan if r.get(name) is None else r[name] for r in rows], dtype=np.float64)
+                for name in FLOAT_COLUMNS
+            },
+            interned={name: InternedColumn.from_values(r.get(name) for r in rows) for name in INTERNED_COLUMNS},
+            texts={name: [r.get(name) for r in rows] for name in TEXT_COLUMNS},
+            key_params=[r.get(KEY_PARAMS_COLUMN) or {} for r in rows],
+            embeddings=embeddings,
+            has_embedding=has_embedding,
+            expert_embeddings=expert_embeddings,
+            expert_slot=expert_slot,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    # ------------------------------------------------------------------
+    # Row lookup
+    # ------------------------------------------------------------------
+
+    def row_of(self, product_id: int) -> Optional[int]:
+        """Row index of a product id, None if absent"""
+        row = int(np.searchsorted(self.ids, product_id))
+        if row < len(self.ids) and self.ids[row] == product_id:
+            return row
+        return None
+
+    def rows_of(self, product_ids) -> np.ndarray:
+        """Row indices for an array of ids (-1 where absent)"""
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if len(self.ids) == 0:
+            return np.full(len(product_ids), -1, dtype=np.int64)
+        rows = np.minimum(np.searchsorted(self.ids, product_ids), len(self.ids) - 1)
+        return np.where(self.ids[rows] == product_ids, rows, -1)
+
+    def rows_where(self, **values) -> np.ndarray:
+        """
+        Rows (ascending) whose interned columns equal the given values.
+        
+        Uses the precomputed index for that column combination:
+            table.rows_where(product_role='сопутка', type='Монтаж')
+        """
+        columns = tuple(sorted(values))
+        index = self._indexes.get(columns)
+        if index is None:
+            raise KeyError(f"No index on {columns}")
+
+        codes = []
+        for column in columns:
+            code = self.interned[column].code_of(values[column])
+            if code is None:
+                return np.empty(0, dtype=np.int64)
+            codes.append(code)
+        return index.rows(tuple(codes))
+
+    # ------------------------------------------------------------------
+    # Column access
+    # ------------------------------------------------------------------
+
+    def value(self, row: int, column: str):
+        """Value of one cell, in the same form the ORM returns it"""
+        if column == ID_COLUMN:
+            return int(self.ids[row])
+        if column in self.interned:
+            return self.interned[column][row]
+        if column in self.texts:
+            return self.texts[column][row]
+        if column in self.floats:
+            value = self.floats[column][row]
+            return None if np.isnan(value) else float(value)
+        if column == KEY_PARAMS_COLUMN:
+            return self.key_params[row]
+        if column == EMBEDDING_COLUMN:
+            return self.embeddings[row] if self.has_embedding[row] else None
+        raise KeyError(column)
+
+    def record(self, row: int) -> "ProductRecord":
+        return ProductRecord(self, row)
+
+    def records(self, rows: Iterable[int]) -> List["ProductRecord"]:
+        return [ProductRecord(self, int(row)) for row in rows]
+
+    @property
+    def norms(self) -> np.ndarray:
+        """L2 norm of every embedding row (0 for missing), computed once"""
+        if self._norms is None:
+            self._norms = np.linalg.norm(self.embeddings, axis=1).astype(np.float32)
+        return self._norms
+
+    def stacked_vectors(self, row: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Unit [embedding, expert_embedding] of one product as a (2, dim) matrix.
+
+        Returns: (vectors, present) - missing or zero vectors are zero rows
+        with present False
+        """
+        vectors = np.zeros((2, self.embeddings.shape[1]), dtype=np.float32)
+        if self.has_embedding[row]:
+            vectors[0] = self.embeddings[row]
+        slot = self.expert_slot[row]
+        if slot >= 0:
+            vectors[1] = self.expert_embeddings[slot]
+        norms = np.linalg.norm(vectors, axis=1)
+        present = norms > 0
+        vectors[present] /= norms[present, None]
+        return vectors, present
+
+
+class ProductRecord:
+    """
+    Immutable view of one product row.
+
+    Supports the read side of the dict protocol (p['name'], p.get('price'))
+    so callers written against the old per-product dicts keep working.
+    """
+
+    __slots__ = ("_table", "_row")
+
+    def __init__(self, table: ProductTable, row: int):
+        object.__setattr__(self, "_table", table)
+        object.__setattr__(self, "_row", row)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ProductRecord is immutable")
+
+    @property
+    def row(self) -> int:
+        return self._row
+
+    @property
+    def id(self) -> int:
+        return int(self._table.ids[self._row])
+
+    def __getitem__(self, key: str):
+        return self._table.value(self._row, key)
+
+    def get(self, key: str, default=None):
+        if key not in _COLUMN_SET:
+            return default
+        return self._table.value(self._row, key)
+
+    def __contains__(self, key) -> bool:
+        return key in _COLUMN_SET
+
+    def keys(self) -> List[str]:
+        return list(COLUMNS)
+
+    def to_dict(self) -> Dict:
+        return {column: self._table.value(self._row, column) for column in COLUMNS}
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, ProductRecord) and other._table is self._table and other._row == self._row
+
+    def __hash__(self) -> int:
+        return hash((id(self._table), self._row))
+
+    def __repr__(self) -> str:
+        return f"ProductRecord(id={self.id}, name={self['name']!r})"
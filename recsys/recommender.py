@@ -3,20 +3,41 @@ Recommendation Engine - Algorithm logic
 
 """
 import logging
+import threading
+import time
 import numpy as np
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
+from dataclasses import replace
 from functools import lru_cache
-from typing import List, Dict, Tuple
+from typing import List, Dict, Optional, Tuple
 
 from sqlalchemy import text
 from sqlalchemy.orm import Session
 
 from .db_repository import get_repository, ProductRepository
+from .product_table import ProductRecord
+from .candidate_batch import CandidateBatch
+from .singleflight import FlightTimeout, SingleFlight
+from .deadline import Deadline
+from .candidate_sources import (
+    CandidateSource, SourceResult, SOURCE_TYPES, SOURCE_TIMEOUT,
+    VectorSource, DualVectorSource, LLMRecommendationSource, LexicalSource, FeedbackCooccurrenceSource,
+    parse_source_names, reciprocal_rank_fusion,
+)
 from app.config.config import settings
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Degradations reported by RecommendationEngine.rank() (X-Ranking-Degraded header),
+# besides those of the candidate sources
+COALESCED_TIMEOUT = "coalesced_timeout"          # shared recall still running at the deadline
+LEXICAL_RECALL = "lexical_recall"                # BM25 text matches (lexical index)
+ACCESSORY_RECALL = "accessory_recall"            # all accessories (no similarity)
+MMR_SKIPPED = "mmr_skipped"                      # score-sorted top-N instead of MMR
+
 
 class ThompsonSampler: 
     """
@@ -34,6 +55,9 @@ class ThompsonSampler:
         # key: (product_id, recommended_product_id)
         # value: (alpha, beta) - Beta distribution parameters
         self.arm_params: Dict[tuple, Tuple[float, float]] = {}
+        # key: product_id, value: highest feedback count among its arms
+        # (upper bound for the TS weight used by top-K scoring)
+        self.max_feedback: Dict[int, int] = {}
         self.engine = engine
         self.demo_mode = settings.DEMO_MODE
         self.init_strength = settings.TS_INIT_STRENGTH
@@ -58,6 +82,7 @@ class ThompsonSampler:
                 for row in result:
                     key = (row.product_id, row.recommended_product_id)
                     self.arm_params[key] = (float(row.alpha), float(row.beta))
+                    self._track_feedback(key)
                     count += 1
                 if count > 0:
                     logger.info(f"Loaded {count} arm stats from database")
@@ -103,8 +128,24 @@ class ThompsonSampler:
             beta *= scale
         
         self.arm_params[key] = (alpha, beta)
+        self._track_feedback(key)
         return alpha, beta
     
+    def _track_feedback(self, key: tuple):
+        """Raise the per-product max feedback count if this arm exceeds it"""
+        count = self.get_feedback_count(key)
+        if count > self.max_feedback.get(key[0], 0):
+            self.max_feedback[key[0]] = count
+    
+    def get_max_feedback_count(self, product_id: int) -> int:
+        """
+        Upper bound on get_feedback_count() over all arms of a main product.
+        
+        Never decreases (the TS_MAX_TOTAL cap can lower an arm's count),
+        so it stays a valid bound.
+        """
+        return self.max_feedback.get(product_id, 0)
+    
     def get_expected_value(self, key: tuple) -> float:
         """Get expected value (mean of Beta distribution)"""
         alpha, beta = self.get_params(key)
@@ -140,6 +181,36 @@ class ThompsonSampler:
         feedback_total = max(0.0, alpha + beta - initial_total)
         return int(feedback_total / self.update_strength)
     
+    def get_params_batch(
+        self, 
+        product_id: int, 
+        recommended_ids: np.ndarray, 
+        similarities: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Beta parameters for many arms of one main product.
+        
+        New arms are initialized from their similarity, as in get_params().
+        Returns: (alpha, beta) arrays aligned with recommended_ids
+        """
+        alpha = np.empty(len(recommended_ids))
+        beta = np.empty(len(recommended_ids))
+        
+        for i, (rec_id, similarity) in enumerate(zip(recommended_ids.tolist(), similarities.tolist())):
+            key = (product_id, rec_id)
+            params = self.arm_params.get(key)
+            if params is None:
+                params = self.initialize_from_similarity(key, similarity)
+            alpha[i], beta[i] = params
+        
+        return alpha, beta
+    
+    def get_feedback_counts(self, alpha: np.ndarray, beta: np.ndarray) -> np.ndarray:
+        """Vectorized get_feedback_count() from known (alpha, beta) arrays"""
+        initial_total = 2.0 + self.init_strength
+        feedback_total = np.maximum(0.0, alpha + beta - initial_total)
+        return np.floor(feedback_total / self.update_strength)
+    
     def initialize_from_similarity(self, key: tuple, similarity: float = None) -> Tuple[float, float]:
         """
         Initialize arm parameters based on similarity score.
@@ -197,13 +268,55 @@ class RecommendationEngine:
         self.mmr_lambda = settings.MMR_LAMBDA
         self.mmr_min_score = settings.MMR_MIN_SCORE
         
+        # Branch-and-bound top-K scoring (from settings)
+        self.top_k_pruning = settings.TOP_K_PRUNING
+        self.top_k_block_size = settings.TOP_K_BLOCK_SIZE
+        
         # Scoring weight parameters
         self.demo_mode = settings.DEMO_MODE
         self.ts_base_weight_demo = settings.TS_BASE_WEIGHT_DEMO  # Fixed weight in DEMO mode
         self.ts_weight_halflife = settings.TS_WEIGHT_HALFLIFE    # Halflife for dynamic weight
         
+        # Concurrent requests for the same product share one candidate preparation
+        self._candidate_flight = SingleFlight()
+        
+        # Latency budget (from settings)
+        self.ranking_deadline_ms = settings.RANKING_DEADLINE_MS
+        # Running MMR cost per (candidate x pick), to predict whether MMR fits the budget
+        self._mmr_seconds_per_step: Optional[float] = None
+        
+        # Candidate sources (from settings), run in parallel and merged by RRF.
+        # Even a single source runs on the pool, so a hung query (pool checkout,
+        # connect) cannot hold the request past the deadline.
+        self.sources: List[CandidateSource] = [
+            self._build_source(name) for name in parse_source_names(settings.CANDIDATE_SOURCES)
+        ]
+        self.rrf_k = settings.RRF_K
+        self._source_pool = ThreadPoolExecutor(
+            max_workers=max(1, settings.CANDIDATE_SOURCE_WORKERS), thread_name_prefix="recall"
+        ) if self.sources else None
+        self._lock = threading.Lock()
+        self._degradation_counts = Counter()
+        
         logger.info(f"RecommendationEngine initialized: MMR={'ON' if self.mmr_enabled else 'OFF'}, "
-                   f"DEMO={'ON' if self.demo_mode else 'OFF'}")
+                   f"DEMO={'ON' if self.demo_mode else 'OFF'}, "
+                   f"sources={[source.name for source in self.sources]}")
+    
+    def _build_source(self, name: str) -> CandidateSource:
+        """Candidate source by name; every database source gets its own circuit breaker"""
+        if name == DualVectorSource.name:
+            return DualVectorSource(self.repo, weights=(settings.DUAL_EMBEDDING_WEIGHT,
+                                                        settings.DUAL_EXPERT_WEIGHT))
+        if name in (LLMRecommendationSource.name, LexicalSource.name, FeedbackCooccurrenceSource.name):
+            return SOURCE_TYPES[name](self.repo)
+        kwargs = dict(
+            budget_share=settings.RECALL_BUDGET_SHARE,
+            failure_threshold=settings.SOURCE_CIRCUIT_FAILURES,
+            reset_timeout=settings.SOURCE_CIRCUIT_RESET_S,
+        )
+        if name == VectorSource.name:
+            kwargs["cache_size"] = settings.RECALL_CACHE_SIZE
+        return SOURCE_TYPES[name](self.repo, **kwargs)
     
     def get_ranking(self, product_id: int, use_vector_search: bool = True) -> List[Dict]:
         """
@@ -217,151 +330,356 @@ class RecommendationEngine:
         Returns:
             List of recommendations
         """
-        # Clear pairwise similarity cache for this request
-        self._get_pairwise_similarity.cache_clear()
+        return self.rank(product_id, use_vector_search)[0]
+    
+    def rank(self, product_id: int, use_vector_search: bool = True) -> Tuple[List[Dict], List[str]]:
+        """
+        Get recommendation list within the RANKING_DEADLINE_MS budget.
+        
+        Candidates flow through the pipeline as one CandidateBatch (arrays);
+        products are turned into dicts only for the returned items.
+        
+        Concurrent calls for the same product wait for one in-flight
+        _prepare_candidates() (single flight) and then each applies its own
+        Thompson draw; coalesced calls are counted in get_metrics().
+        
+        Degradations when the budget runs short:
+        - pgvector slower than its share -> cached recall / in-memory search
+        - other candidate source too slow or failing -> merged without it
+        - coalesced call still waiting at its own deadline -> in-memory recall
+          without the sources (lexical index, then all accessories)
+        - MMR predicted (or found) to overrun -> score-sorted top-N
+        
+        Returns:
+            (recommendations, applied degradations - empty if none)
+        """
+        deadline = Deadline(self.ranking_deadline_ms)
+        
+        # Recall + base scoring, shared with concurrent requests for the same product.
+        # A request that joined a run in flight waits only for its own budget.
+        try:
+            batch, recall_degradations = self._candidate_flight.do(
+                (product_id, use_vector_search),
+                lambda: self._prepare_candidates(product_id, use_vector_search, deadline),
+                timeout=None if deadline.unlimited else max(0.0, deadline.remaining())
+            )
+        except FlightTimeout:
+            batch, recall_degradations = self._prepare_candidates(
+                product_id, use_vector_search, deadline, run_sources=False
+            )
+        degradations = list(recall_degradations)
+        if batch is None:
+            self._record_degradations(product_id, degradations)
+            return [], degradations
+        
+        # Thompson scoring is per request (own draw, current arm stats).
+        # The top-K scorer skips candidates that cannot reach the result.
+        n_candidates = len(batch)
+        if self.top_k_pruning:
+            batch = self._score_top_k(main_product_id=product_id, batch=batch)
+        else:
+            batch = self._calculate_scores(main_product_id=product_id, batch=batch)
+        
+        # Sort by score (descending, stable)
+        order = np.argsort(-batch.score, kind='stable')
+        
+        # Apply MMR for diversity (if it fits the remaining budget)
+        selected = None
+        if self.mmr_enabled and n_candidates > self.mmr_return_size:
+            if self._mmr_fits(len(order), deadline):
+                selected = self._mmr_rerank(batch, order, deadline)
+            if selected is None:
+                degradations.append(MMR_SKIPPED)
+            else:
+                logger.debug(f"MMR reranking: {len(order)} -> {len(selected)}")
+        if selected is None:
+            # Just take top N
+            selected = order[:self.mmr_return_size]
+        
+        # Build response
+        result = self._build_response(batch, selected)
+        self._record_degradations(product_id, degradations)
+        
+        logger.info(f"Product {product_id} ({batch.search_method}, scored {len(batch)}/{n_candidates}) "
+                   f"-> {len(result)} recommendations"
+                   f"{' [MMR]' if self.mmr_enabled and MMR_SKIPPED not in degradations else ''}")
+        return result, degradations
+    
+    def _record_degradations(self, product_id: int, degradations: List[str]):
+        if not degradations:
+            return
+        with self._lock:
+            self._degradation_counts.update(degradations)
+        logger.warning(f"Product {product_id}: degraded ranking ({', '.join(degradations)})")
+    
+    def _prepare_candidates(
+        self, 
+        product_id: int, 
+        use_vector_search: bool, 
+        deadline: Deadline, 
+        run_sources: bool = True
+    ) -> Tuple[Optional[CandidateBatch], List[str]]:
+        """
+        Deterministic part of the ranking: recall, fill and base scoring.
+        
+        The returned batch is shared by coalesced requests and must not be
+        modified. Candidates are ordered by base score (descending, stable),
+        which is the visiting order of the top-K scorer.
+        
+        Args:
+            run_sources: False for a coalesced request past its deadline:
+                in-memory recall only (reported as coalesced_timeout)
+        
+        Returns: (CandidateBatch or None if the product or candidates are
+            missing, recall degradations)
+        """
+        degradations = [] if run_sources else [COALESCED_TIMEOUT]
         
         # Get main product
         main_product = self.repo.get_product_by_id(product_id)
         
         if main_product is None:
             logger.warning(f"Product {product_id} not found!")
-            return []
+            return None, degradations
         
         # Get main product price for comparison
         main_price = main_product.get('price', 0) or 0
         
         # Get candidates (recall more for MMR)
-        candidates = []
-        search_method = "none"
         recall_size = self.mmr_recall_size if self.mmr_enabled else self.mmr_return_size
+        batch = self._recall(main_product, recall_size, use_vector_search, deadline, degradations,
+                             run_sources=run_sources)
         
-        if use_vector_search:
-            # vector similarity search
-            try:
-                similar_products = self.repo.get_similar_products_by_vector(
-                    product_id, limit=recall_size
-                )
-                if similar_products:
-                    candidates = similar_products
-                    search_method = "vector"
-                    logger.debug(f"Vector search returned {len(candidates)} candidates")
-            except Exception as e:
-                logger.error(f"Vector search failed: {e}")
-        
-        # Fallback: get all accessories if vector search failed
-        if not candidates:
-            candidates = self.repo.get_accessory_products()
-            candidates = [c for c in candidates if c['id'] != main_product['id']]
-            search_method = "fallback"
-        
-        if not candidates:
+        if len(batch) == 0:
             logger.warning(f"No candidates for product {main_product['name']}")
-            return []
+            return None, degradations
         
         # Fill candidates if less than minimum (stable, deterministic)
-        if len(candidates) < self.mmr_return_size:
-            candidates = self._fill_candidates(
+        if len(batch) < self.mmr_return_size:
+            batch = self._fill_candidates(
                 main_product_id=main_product['id'],
-                existing_candidates=candidates,
+                batch=batch,
                 target_count=self.mmr_return_size
             )
         
-        # Calculate scores with Thompson Sampling and price factor
-        scored_candidates = self._calculate_scores(
-            main_product_id=main_product['id'],
-            main_price=main_price,
-            candidates=candidates,
-            search_method=search_method
+        # Base score and price factor (penalize expensive accessories)
+        base_score, init_similarity = self._base_scores(batch)
+        candidate_price = np.nan_to_num(self.repo.table.floats['price'][batch.rows], nan=0.0)
+        batch = replace(
+            batch,
+            price=candidate_price,
+            base_score=base_score,
+            init_similarity=init_similarity,
+            price_factor=self._calculate_price_factor(main_price, candidate_price),
         )
+        return batch.take(np.argsort(-base_score, kind='stable')), degradations
+    
+    def get_metrics(self) -> Dict:
+        """Engine counters (request coalescing, degradations, source circuit states)"""
+        with self._lock:
+            degraded = dict(self._degradation_counts)
+        return {
+            "ranking_computations": self._candidate_flight.executed,
+            "ranking_coalesced": self._candidate_flight.coalesced,
+            "ranking_in_flight": self._candidate_flight.in_flight(),
+            "ranking_coalesced_timeouts": self._candidate_flight.timed_out,
+            "ranking_degradations": degraded,
+            "source_circuits": {source.name: source.breaker.metrics()
+                                for source in self.sources if source.breaker is not None},
+        }
+    
+    def _recall(
+        self, 
+        main_product: ProductRecord, 
+        recall_size: int, 
+        use_vector_search: bool, 
+        deadline: Deadline, 
+        degradations: List[str], 
+        run_sources: bool = True
+    ) -> CandidateBatch:
+        """
+        Candidate recall: configured candidate sources, or all accessories as fallback.
+        
+        Sources run concurrently under the request deadline; their ranked
+        lists are merged by reciprocal rank fusion, limited to accessories
+        other than the main product and cut to recall_size. Similarity comes
+        from the vector source where it returned the candidate, else from the
+        in-memory embeddings (NaN if missing).
+        
+        Source degradations (timeouts, errors, open circuits, fallbacks) are
+        appended to degradations. If the sources find nothing (e.g. the
+        product has no embedding), the lexical index is searched with the
+        product's text (lexical_recall), and only then are all accessories
+        used (accessory_recall). run_sources=False goes straight to these
+        in-memory fallbacks.
+        """
+        table = self.repo.table
         
-        # Sort by score (descending)
-        scored_candidates.sort(key=lambda x: x['score'], reverse=True)
+        if use_vector_search and self.sources:
+            if run_sources:
+                results = self._run_sources(main_product, recall_size, deadline)
+                for result in results:
+                    degradations.extend(result.degradations)
+                
+                rows, similarity = self._merge_sources(main_product, results, recall_size)
+                if len(rows):
+                    search_method = "+".join(source.name for source, result in zip(self.sources, results)
+                                             if len(result.rows))
+                    logger.debug(f"Candidate sources ({search_method}) returned {len(rows)} candidates")
+                    return CandidateBatch.from_rows(rows, table.ids[rows], similarity,
+                                                    search_method=search_method)
+            
+            # Fallback: text matches, relevance relative to the best match on the
+            # similarity scale (1 - (1 - relevance)/2) so the base score keeps their order
+            rows, scores = self.repo.search_lexical_rows(main_product['id'], limit=recall_size)
+            if len(rows):
+                if degradations:
+                    degradations.append(LEXICAL_RECALL)
+                similarity = 1.0 - (1.0 - scores / scores[0]) / 2.0
+                return CandidateBatch.from_rows(rows, table.ids[rows], similarity, search_method="lexical")
+            if degradations:
+                degradations.append(ACCESSORY_RECALL)
+        
+        # Fallback: get all accessories if the sources found nothing
+        rows = self.repo.get_accessory_rows()
+        rows = rows[rows != main_product.row]
+        return CandidateBatch.from_rows(rows, table.ids[rows], search_method="fallback")
+    
+    def _run_sources(self, main_product: ProductRecord, limit: int, deadline: Deadline) -> List[SourceResult]:
+        """
+        recall() of every source, in source order.
         
-        # Apply MMR for diversity
-        if self.mmr_enabled and len(scored_candidates) > self.mmr_return_size:
-            scored_candidates = self._mmr_rerank(scored_candidates)
-            logger.debug(f"MMR reranking: {len(candidates)} -> {len(scored_candidates)}")
-        else:
-            # Just take top N
-            scored_candidates = scored_candidates[:self.mmr_return_size]
+        Sources run on the shared pool; a source without a result when the
+        deadline passes is left running and reported as timed out. Only a
+        single source without a deadline runs inline.
+        """
+        if deadline.unlimited and len(self.sources) == 1:
+            return [self.sources[0].recall(main_product, limit, deadline)]
         
-        # Build response
-        result = self._build_response(scored_candidates)
+        futures = [self._source_pool.submit(source.recall, main_product, limit, deadline)
+                   for source in self.sources]
+        done, _ = wait(futures, timeout=None if deadline.unlimited else max(0.0, deadline.remaining()))
         
-        logger.info(f"Product {product_id} ({search_method}) -> {len(result)} recommendations"
-                   f"{' [MMR]' if self.mmr_enabled else ''}")
-        return result
+        results = []
+        for source, future in zip(self.sources, futures):
+            if future in done:
+                results.append(future.result())
+            else:
+                future.cancel()
+                logger.error(f"Candidate source {source.name} missed the deadline")
+                results.append(SourceResult.empty([f"{SOURCE_TIMEOUT}:{source.name}"]))
+        return results
+    
+    def _merge_sources(
+        self, 
+        main_product: ProductRecord, 
+        results: List[SourceResult], 
+        limit: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reciprocal rank fusion of the source results.
+        
+        Returns: (rows, similarity) in fused order, at most limit rows
+        """
+        rows, _ = reciprocal_rank_fusion([result.rows for result in results], k=self.rrf_k)
+        
+        # Sources may return main products (LLM matches, feedback) or the product itself
+        keep = self.repo.is_accessory(rows) & (rows != main_product.row)
+        rows = rows[keep][:limit]
+        
+        # Similarity reported by a source (vector), first source wins
+        similarity = np.full(len(rows), np.nan)
+        if len(rows):
+            order = np.argsort(rows)
+            for result in reversed(results):
+                if result.similarity is None or len(result.rows) == 0:
+                    continue
+                pos = np.minimum(np.searchsorted(rows, result.rows, sorter=order), len(rows) - 1)
+                found = rows[order[pos]] == result.rows
+                similarity[order[pos[found]]] = result.similarity[found]
+        
+        # Candidates only other sources found: similarity from the embeddings in memory
+        missing = np.isnan(similarity)
+        if missing.any():
+            similarity[missing] = self.repo.similarity_to(main_product['id'], rows[missing])
+        return rows, similarity
     
     def _fill_candidates(
         self, 
         main_product_id: int, 
-        existing_candidates: List[Dict], 
+        batch: CandidateBatch, 
         target_count: int
-    ) -> List[Dict]:
+    ) -> CandidateBatch:
         # Fill candidates if less than min_candidates
-        if len(existing_candidates) >= target_count:
-            return existing_candidates
+        if len(batch) >= target_count:
+            return batch
         
-        # Get IDs of existing candidates
-        existing_ids = {c['id'] for c in existing_candidates}
-        existing_ids.add(main_product_id)  # Exclude main product
+        # IDs that must not be filled (existing candidates + main product)
+        excluded_ids = np.append(batch.ids, main_product_id)
         
-        # Get all accessories not already in candidates
-        all_accessories = self.repo.get_accessory_products()
-        available = [p for p in all_accessories if p['id'] not in existing_ids]
+        # Deterministic fill order: ascending hash(main_product_id * 10000 + candidate_id).
+        # Python hashes ints to themselves (below 2**61 - 1), so for a given main
+        # product the key increases with candidate_id and the fill order is the
+        # id order of the accessories - which is exactly the precomputed
+        # accessory row index (rows are sorted by id). The first need_count
+        # non-excluded entries are found in a prefix of need_count + len(excluded)
+        # rows, without touching the rest of the catalogue.
+        need_count = target_count - len(batch)
+        accessory_rows = self.repo.get_accessory_rows()
+        table = self.repo.table
         
-        if not available:
-            return existing_candidates
+        window = accessory_rows[:need_count + len(excluded_ids)]
+        window = window[~np.isin(table.ids[window], excluded_ids)][:need_count]
         
-        # Sort by deterministic hash for stability
-        # hash(main_product_id * 10000 + candidate_id) ensures:
-        # Same main product always gets same order
-        # Different main products get different orders
-        available.sort(key=lambda p: hash(main_product_id * 10000 + p['id']))
+        if len(window) == 0:
+            return batch
         
-        # Calculate how many more we need
-        need_count = target_count - len(existing_candidates)
-        fill_candidates = available[:need_count]
+        # Mark filled candidates (lower base score since not from vector search).
+        # The flag lives in the per-request batch, never on the shared product.
+        fill = CandidateBatch.from_rows(window, table.ids[window], is_fill=True)
         
-        # Mark filled candidates (lower base score since not from vector search)
-        for c in fill_candidates:
-            c['_is_fill'] = True
+        logger.debug(f"Filled {len(fill)} candidates "
+                    f"({len(batch)} -> {len(batch) + len(fill)})")
         
-        logger.debug(f"Filled {len(fill_candidates)} candidates "
-                    f"({len(existing_candidates)} -> {len(existing_candidates) + len(fill_candidates)})")
-        
-        return existing_candidates + fill_candidates
+        return batch.append(fill)
     
     @lru_cache(maxsize=10000)
     def _get_pairwise_similarity(self, id_i: int, id_j: int) -> float:
         """
-        Cached pairwise cosine similarity between two products (for MMR).
+        Cached pairwise cosine similarity between two products.
         
         """
-        prod_i = self.repo.get_product_by_id(id_i)
-        prod_j = self.repo.get_product_by_id(id_j)
+        table = self.repo.table
+        row_i = table.row_of(id_i)
+        row_j = table.row_of(id_j)
         
-        if not prod_i or not prod_j:
+        if row_i is None or row_j is None:
             return 0.0
         
-        emb_i = prod_i.get('embedding')
-        emb_j = prod_j.get('embedding')
-        
-        if emb_i is None or emb_j is None:
+        if not table.has_embedding[row_i] or not table.has_embedding[row_j]:
             return 0.0
         
-        emb_i = np.array(emb_i)
-        emb_j = np.array(emb_j)
+        norm = table.norms[row_i] * table.norms[row_j]
         
-        norm_i = np.linalg.norm(emb_i)
-        norm_j = np.linalg.norm(emb_j)
-        
-        if norm_i == 0 or norm_j == 0:
+        if norm == 0:
             return 0.0
         
-        return float(np.dot(emb_i, emb_j) / (norm_i * norm_j))
+        return float(np.dot(table.embeddings[row_i], table.embeddings[row_j]) / norm)
+    
+    def _unit_embeddings(self, rows: np.ndarray) -> np.ndarray:
+        """L2-normalized embeddings for table rows (zero vector if missing)"""
+        table = self.repo.table
+        norms = table.norms[rows]
+        safe = np.where(norms > 0, norms, 1.0)
+        return table.embeddings[rows] / safe[:, None]
     
-    def _mmr_rerank(self, scored_candidates: List[Dict]) -> List[Dict]:
+    def _mmr_fits(self, n_candidates: int, deadline: Deadline) -> bool:
+        """Whether MMR over n_candidates is predicted to finish within the budget"""
+        if deadline.unlimited or self._mmr_seconds_per_step is None:
+            return not deadline.expired()
+        return self._mmr_seconds_per_step * n_candidates * self.mmr_return_size <= deadline.remaining()
+    
+    def _mmr_rerank(self, batch: CandidateBatch, order: np.ndarray, deadline: Deadline = None) -> Optional[np.ndarray]:
         """
         MMR (Maximal Marginal Relevance) reranking for diversity.
         
@@ -372,100 +690,207 @@ class RecommendationEngine:
         MMR score for position t:
         score_i = λ * rel_i - (1-λ) * max_{j in window} sim(i, j)
         
+        Similarities are computed one column per selected item (candidates x
+        selected), so the cost grows with the return size, not recall size².
+        
         Args:
-            scored_candidates: List of candidates sorted by relevance score (descending)
+            batch: Scored candidate batch
+            order: Batch positions sorted by relevance score (descending)
             
         Returns:
-            MMR-reranked list of candidates
+            MMR-reranked batch positions, None if the deadline passed first
         """
-        if len(scored_candidates) <= self.mmr_return_size:
-            return scored_candidates
-        
+        started = time.perf_counter()
+        rel = batch.score[order]
+        unit = self._unit_embeddings(batch.rows[order])
+        
+        # sim_to_selected[:, j] = similarity of every candidate to the j-th selected item
+        sim_to_selected = np.zeros((len(order), self.mmr_return_size), dtype=np.float32)
+        available = np.ones(len(order), dtype=np.bool_)
+        # Skip items below minimum relevance threshold
+        eligible = rel >= self.mmr_min_score
         selected = []
-        remaining = scored_candidates.copy()
+        
+        def select(pos: int):
+            sim_to_selected[:, len(selected)] = unit @ unit[pos]
+            selected.append(pos)
+            available[pos] = False
         
         # Phase 1: Take top K directly (preserve most relevant)
-        pure_top_k = min(self.mmr_pure_top_k, len(remaining), self.mmr_return_size)
-        for _ in range(pure_top_k):
-            if remaining:
-                selected.append(remaining.pop(0))
+        pure_top_k = min(self.mmr_pure_top_k, len(order), self.mmr_return_size)
+        for pos in range(pure_top_k):
+            select(pos)
         
         logger.debug(f"MMR Phase 1: Selected top {len(selected)} items directly")
         
         # Phase 2: MMR selection for remaining positions
-        while len(selected) < self.mmr_return_size and remaining:
-            # Get sliding window (last W items in selected)
+        while len(selected) < self.mmr_return_size:
+            if deadline is not None and deadline.expired():
+                logger.debug(f"MMR stopped by deadline after {len(selected)} picks")
+                return None
+            
+            # Sliding window (last W items in selected)
             window_start = max(0, len(selected) - self.mmr_window_size)
-            window = selected[window_start:]
+            if len(selected) > window_start:
+                max_sim = np.maximum(sim_to_selected[:, window_start:len(selected)].max(axis=1), 0.0)
+            else:
+                max_sim = np.zeros(len(order), dtype=np.float32)
             
-            best_mmr_score = float('-inf')
-            best_idx = 0
+            # MMR score: λ * relevance - (1-λ) * max_similarity
+            mmr_score = self.mmr_lambda * rel - (1 - self.mmr_lambda) * max_sim
+            mmr_score[~(available & eligible)] = -np.inf
             
-            for idx, cand in enumerate(remaining):
-                rel_score = cand['score']
-                
-                # Skip items below minimum relevance threshold
-                if rel_score < self.mmr_min_score:
-                    continue
-                
-                # Calculate max similarity with items in window
-                cand_id = cand['item']['id']
-                max_sim = 0.0
-                
-                for sel in window:
-                    sel_id = sel['item']['id']
-                    sim = self._get_pairwise_similarity(cand_id, sel_id)
-                    max_sim = max(max_sim, sim)
-                
-                # MMR score: λ * relevance - (1-λ) * max_similarity
-                mmr_score = self.mmr_lambda * rel_score - (1 - self.mmr_lambda) * max_sim
-                
-                if mmr_score > best_mmr_score:
-                    best_mmr_score = mmr_score
-                    best_idx = idx
-            
-            # Select the best candidate
-            if best_mmr_score > float('-inf'):
-                selected.append(remaining.pop(best_idx))
-            else:
+            best_pos = int(np.argmax(mmr_score))
+            if mmr_score[best_pos] == -np.inf:
                 # No valid candidates left (all below threshold)
                 break
+            select(best_pos)
         
         logger.debug(f"MMR Phase 2: Final selection has {len(selected)} items")
         
-        return selected
+        # Cost per candidate x pick (moving average) for _mmr_fits()
+        step = (time.perf_counter() - started) / (len(order) * self.mmr_return_size)
+        with self._lock:
+            previous = self._mmr_seconds_per_step
+            self._mmr_seconds_per_step = step if previous is None else 0.8 * previous + 0.2 * step
+        
+        return order[np.array(selected, dtype=np.int64)]
     
-    def _calculate_price_factor(self, main_price: float, candidate_price: float) -> float:
+    def _calculate_price_factor(self, main_price: float, candidate_prices: np.ndarray) -> np.ndarray:
         """
         If accessory is more than threshold times main product price,
         apply a penalty proportional to the price ratio.
         
-        Returns: factor between (1 - price_penalty_max) and 1.0
+        Returns: factors between (1 - price_penalty_max) and 1.0
         """
-        if main_price <= 0 or candidate_price <= 0:
-            return 1.0  # No penalty if prices are invalid
-        
-        price_ratio = candidate_price / main_price
+        if main_price <= 0:
+            return np.ones(len(candidate_prices))  # No penalty if prices are invalid
         
-        if price_ratio <= self.price_penalty_threshold:
-            return 1.0  # No penalty
+        price_ratio = candidate_prices / main_price
         
         # Calculate penalty: linearly increase from 0 to max_penalty
         # as price_ratio goes from threshold to 3x threshold
         excess_ratio = (price_ratio - self.price_penalty_threshold) / self.price_penalty_threshold
-        penalty = min(self.price_penalty_max, excess_ratio * self.price_penalty_max)
+        penalty = np.minimum(self.price_penalty_max, excess_ratio * self.price_penalty_max)
         
-        return 1.0 - penalty
+        # No penalty within threshold or for invalid (<= 0 / missing) prices
+        no_penalty = (price_ratio <= self.price_penalty_threshold) | (candidate_prices <= 0)
+        return np.where(no_penalty, 1.0, 1.0 - penalty)
     
-    def _calculate_scores(
-        self, 
-        main_product_id: int, 
-        main_price: float,
-        candidates: List[Dict], 
-        search_method: str = "none"
-    ) -> List[Dict]:
+    def _base_scores(self, batch: CandidateBatch) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Base score (from vector similarity or deterministic) per candidate.
+        
+        Returns: (base_score, similarity used for TS initialization)
+        """
+        # hash(id) % 1000 == id % 1000 for product ids
+        id_jitter = (batch.ids % 1000) / 5000.0
+        from_vector = ~np.isnan(batch.similarity)  # Similarity from recall (any candidate source)
+        from_fill = batch.is_fill & ~from_vector
+        
+        # Filled candidates get lower, deterministic score (0.3~0.5), others 0.1~0.3
+        base_score = np.where(from_fill, 0.3, 0.1) + id_jitter
+        base_score = np.where(from_vector, batch.similarity, base_score)
+        similarity_for_init = np.where(from_vector, batch.similarity, np.where(from_fill, 0.3, 0.1))
+        return base_score, similarity_for_init
+    
+    def _score_upper_bounds(self, main_product_id: int, base_score: np.ndarray) -> np.ndarray:
+        """
+        Highest final score each candidate can reach: thompson_weight = 1
+        and price_factor = 1 (price_factor <= 1), rounded like the score.
+        
+        DEMO_MODE: base_score * 0.8 + 1 * 0.2
+        Normal mode: (1 - gamma) * base_score + gamma * 1 with gamma at its
+            largest over the product's arms (max feedback count)
         """
-        Calculate final scores for candidates.
+        if self.demo_mode:
+            base_weight = self.ts_base_weight_demo
+            bound = base_score * base_weight + max(0.0, 1.0 - base_weight)
+        else:
+            n = self.sampler.get_max_feedback_count(main_product_id)
+            k = self.ts_weight_halflife
+            gamma_max = n / (n + k) if n + k > 0 else 0.0
+            bound = base_score + gamma_max * np.maximum(1.0 - base_score, 0.0)
+        
+        # Small margin against float rounding in the exact score computation
+        return np.round(np.clip(bound + 1e-9, 0.0, 1.0), 3)
+    
+    def _score_top_k(self, main_product_id: int, batch: CandidateBatch) -> CandidateBatch:
+        """
+        Branch-and-bound scoring: score only candidates that can still make the list.
+        
+        Candidates are visited in batch order, which is descending base score
+        (_prepare_candidates) and therefore descending upper bound - the bound
+        is non-decreasing in base_score. They are scored in growing blocks. Once the k-th best score
+        reaches the bound of the next candidate, that candidate and everything
+        after it are skipped (k = MMR_RETURN_SIZE).
+        
+        With MMR a lower-scored candidate can still be picked for diversity, so
+        the rest is only skipped when no candidate left can win a pick
+        (its MMR score is at most λ * bound, max similarity is in [0, 1]):
+            λ * kth_eligible_score - (1 - λ) >= λ * bound
+        or when every candidate left is below MMR_MIN_SCORE and the
+        score-sorted top k is already settled (the MMR_SKIPPED fallback).
+        
+        Thompson draws are taken in visiting order, so the result equals
+        scoring every candidate in that order with _calculate_scores().
+        
+        Returns: scored prefix of the batch (a new batch)
+        """
+        k = self.mmr_return_size
+        if len(batch) <= k:
+            return self._calculate_scores(main_product_id, batch)
+        
+        bound = self._score_upper_bounds(main_product_id, batch.base_score)
+        
+        blocks = []
+        scores = np.empty(0)
+        end = 0
+        while end < len(batch):
+            # First block holds at least k candidates; blocks then double,
+            # so an unprunable batch costs only a few extra bound checks
+            start, end = end, min(len(batch), end + max(self.top_k_block_size, k, end, 1))
+            block = self._calculate_scores(main_product_id, batch.take(slice(start, end)))
+            blocks.append(block)
+            scores = np.concatenate([scores, block.score])
+            
+            if end < len(batch) and self._can_skip_rest(scores, bound[end]):
+                break
+        
+        logger.debug(f"Top-K scoring: {end}/{len(batch)} candidates scored")
+        return CandidateBatch.concat(blocks)
+    
+    def _can_skip_rest(self, scores: np.ndarray, next_bound: float) -> bool:
+        """Whether no unscored candidate (bound <= next_bound) can change the result"""
+        k = self.mmr_return_size
+        
+        def kth_best(values: np.ndarray, kth: int) -> float:
+            return float(np.partition(values, len(values) - kth)[len(values) - kth])
+        
+        if not self.mmr_enabled:
+            # Later candidates lose ties (stable sort), so >= is enough
+            return len(scores) >= k and kth_best(scores, k) >= next_bound
+        
+        # MMR Phase 1 takes the top PURE_TOP_K by score regardless of MMR_MIN_SCORE
+        pure_top_k = min(self.mmr_pure_top_k, k)
+        if pure_top_k > 0 and kth_best(scores, pure_top_k) < next_bound:
+            return False
+        if next_bound < self.mmr_min_score:
+            # MMR cannot pick the rest, but MMR_SKIPPED takes the score-sorted top k
+            return len(scores) >= k and kth_best(scores, k) >= next_bound
+        
+        eligible = scores[scores >= self.mmr_min_score]
+        if len(eligible) < k:
+            return False
+        return (self.mmr_lambda * kth_best(eligible, k) - (1 - self.mmr_lambda)
+                >= self.mmr_lambda * next_bound + 1e-6)
+    
+    def _calculate_scores(self, main_product_id: int, batch: CandidateBatch) -> CandidateBatch:
+        """
+        Calculate final scores for candidates (vectorized over the batch).
+        
+        Uses the base score and price factor from _prepare_candidates and
+        returns a new batch, so the shared input batch is never modified.
         
         DEMO_MODE: Fixed weights for visible learning effects
             combined = base_score * 0.8 + thompson_weight * 0.2
@@ -476,68 +901,47 @@ class RecommendationEngine:
             
         Final: final_score = combined * price_factor
         """
-        scored = []
-        
-        for item in candidates:
-            # Base score (from vector similarity or deterministic)
-            if search_method == "vector" and 'similarity' in item:
-                base_score = item['similarity']
-                similarity_for_init = item['similarity']  # Use for TS initialization
-            elif item.get('_is_fill'):
-                # Filled candidates get lower, deterministic score
-                base_score = 0.3 + (hash(item['id']) % 1000) / 5000.0  # 0.3~0.5
-                similarity_for_init = 0.3  # Low similarity for filled items
-            else:
-                base_score = 0.1 + (hash(item['id']) % 1000) / 5000.0 
-                similarity_for_init = 0.1  
-            
-            # Thompson Sampling weight (exploration-exploitation)
-            # Pass similarity to initialize informed prior for new arms
-            arm_key = (main_product_id, item['id'])
-            thompson_weight = self.sampler.sample(arm_key, similarity=similarity_for_init)
-            
-            # Price factor (penalize expensive accessories)
-            candidate_price = item.get('price', 0) or 0
-            price_factor = self._calculate_price_factor(main_price, candidate_price)
-            
-            # Combine scores with mode-specific weighting
-            if self.demo_mode:
-                # DEMO mode: Fixed weights for visible learning effects
-                base_weight = self.ts_base_weight_demo  # 0.8
-                ts_weight = 1.0 - base_weight  # 0.2
-                combined_score = base_score * base_weight + thompson_weight * ts_weight
-            else:
-                # Normal mode: Dynamic weights based on feedback count
-                # gamma increases from 0 to 1 as feedback accumulates
-                n = self.sampler.get_feedback_count(arm_key)
-                k = self.ts_weight_halflife  # Feedback count for gamma=0.5
-                gamma = n / (n + k) if (n + k) > 0 else 0.0
-                
-                # Cold start: rely on base_score; with feedback: rely on TS
-                combined_score = (1.0 - gamma) * base_score + gamma * thompson_weight
-            
-            # Apply price penalty
-            final_score = combined_score * price_factor
-            
-            # Clip to [0, 1] range
-            final_score = max(0.0, min(1.0, final_score))
-            
-            scored.append({
-                'item': item,
-                'score': round(final_score, 3),
-                'base_score': round(base_score, 3),
-                'thompson_weight': round(thompson_weight, 3),
-                'price_factor': round(price_factor, 3),
-            })
+        base_score = batch.base_score
+        
+        # Thompson Sampling weight (exploration-exploitation)
+        # Pass similarity to initialize informed prior for new arms
+        alpha, beta = self.sampler.get_params_batch(main_product_id, batch.ids, batch.init_similarity)
+        thompson_weight = np.random.beta(alpha, beta) if len(batch) else np.empty(0)
         
-        return scored
+        # Combine scores with mode-specific weighting
+        if self.demo_mode:
+            # DEMO mode: Fixed weights for visible learning effects
+            base_weight = self.ts_base_weight_demo  # 0.8
+            ts_weight = 1.0 - base_weight  # 0.2
+            combined_score = base_score * base_weight + thompson_weight * ts_weight
+        else:
+            # Normal mode: Dynamic weights based on feedback count
+            # gamma increases from 0 to 1 as feedback accumulates
+            n = self.sampler.get_feedback_counts(alpha, beta)
+            k = self.ts_weight_halflife  # Feedback count for gamma=0.5
+            gamma = np.divide(n, n + k, out=np.zeros(len(n)), where=(n + k) > 0)
+            
+            # Cold start: rely on base_score; with feedback: rely on TS
+            combined_score = (1.0 - gamma) * base_score + gamma * thompson_weight
+        
+        # Apply price penalty, clip to [0, 1] range
+        final_score = np.clip(combined_score * batch.price_factor, 0.0, 1.0)
+        
+        return replace(
+            batch,
+            alpha=alpha,
+            beta=beta,
+            thompson_weight=thompson_weight,
+            score=np.round(final_score, 3),
+        )
     
-    def _build_response(self, scored_candidates: List[Dict]) -> List[Dict]:
+    def _build_response(self, batch: CandidateBatch, selected: np.ndarray) -> List[Dict]:
         result = []
+        table = self.repo.table
+        created_at = datetime.now().isoformat()
         
-        for idx, scored_item in enumerate(scored_candidates):
-            item = scored_item['item']
-            score = scored_item['score']
+        for idx, pos in enumerate(selected.tolist()):
+            item = table.record(int(batch.rows[pos]))
             
             # Build recommended product object
             rec_product = {
@@ -557,8 +961,8 @@ class RecommendationEngine:
             # Build recommendation object
             recommendation_obj = {
                 "id": idx + 1000,  # Recommendation record ID
-                "similarity_score": score,
-                "created_at": datetime.now().isoformat(),
+                "similarity_score": float(batch.score[pos]),
+                "created_at": created_at,
                 "recommended_product": rec_product
             }
             result.append(recommendation_obj)
@@ -584,6 +988,10 @@ class RecommendationEngine:
         # Update Thompson Sampling parameters
         alpha, beta = self.sampler.update(arm_key, is_relevant)
         
+        # Positive feedback is an edge of the co-occurrence graph (feedback source)
+        if is_relevant:
+            self.repo.add_feedback(product_id, recommended_product_id)
+        
         # Get expected value after update
         expected = self.sampler.get_expected_value(arm_key)
         
@@ -601,6 +1009,9 @@ class RecommendationEngine:
     def reload_data(self):
         """Reload data from database"""
         self.repo.reload()
+        self._get_pairwise_similarity.cache_clear()
+        for source in self.sources:
+            source.reset()
     
     def reload_arm_stats(self):
         """Reload arm_stats from database"""
@@ -0,0 +1,82 @@
+"""
+Single Flight - Coalesce concurrent calls for the same key
+
+While a computation for a key is running, other callers with the same key
+wait for it and receive its result instead of starting their own. Nothing
+is cached: the next call after completion computes again. A waiting caller
+can bound its wait (FlightTimeout) without affecting the running call.
+"""
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class FlightTimeout(TimeoutError):
+    """Raised to a waiting caller whose timeout passed before the call in flight finished"""
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlight:
+    """Thread-safe per-key call coalescing with call counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, _Call] = {}
+        self.executed = 0   # Computations actually run
+        self.coalesced = 0  # Calls served by another caller's computation
+        self.timed_out = 0  # Coalesced calls that stopped waiting (FlightTimeout)
+
+    def do(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None) -> Any:
+        """
+        Run fn() for key, or wait for the run already in flight.
+
+        Every waiter gets the same result object (treat it as read-only);
+        an exception raised by fn() is re-raised in all of them.
+
+        Args:
+            timeout: seconds a waiting caller waits (None = until done); the
+                caller that runs fn() is not limited
+
+        Raises:
+            FlightTimeout: the run in flight did not finish within timeout
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not call.done.wait(timeout):
+                with self._lock:
+                    self.timed_out += 1
+                raise FlightTimeout(f"Call for {key!r} still in flight after {timeout:.3f}s")
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
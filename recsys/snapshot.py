@@ -0,0 +1,184 @@
+"""
+Product Snapshot - Versioned binary catalogue dump for fast cold start
+
+Layout (little-endian):
+    MAGIC (8 bytes) | format version (uint32) | header length (uint64)
+    header (UTF-8 JSON) | zero padding to 64 bytes | array sections
+
+The file mirrors ProductTable: numeric columns, interned-column codes and
+the embedding matrices are array sections (memory-mapped on load); free
+text, key_params and interned vocabularies live in the JSON header.
+"""
+import json
+import logging
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .product_table import (
+    ProductTable, InternedColumn,
+    FLOAT_COLUMNS, INTERNED_COLUMNS, TEXT_COLUMNS,
+)
+
+logger = logging.getLogger(__name__)
+
+# ============================================================================
+# Configuration
+# ============================================================================
+
+TEMP_DIR = Path(__file__).parent / "temp"
+SNAPSHOT_FILE = TEMP_DIR / "products.snapshot"
+
+MAGIC = b"RECSNAP\x00"
+FORMAT_VERSION = 3
+ALIGNMENT = 64
+
+_PREAMBLE = struct.Struct("<8sIQ")
+
+# One-row table bumped by a statement-level trigger on products (migration
+# 7d5456cde187): any insert, update, delete or truncate, embeddings included,
+# commits a new random version with it. Reading it is a primary key lookup.
+CATALOGUE_VERSION_SQL = text("SELECT version FROM catalogue_version WHERE id = 1")
+
+
+class SnapshotVersionMismatch(Exception):
+    """Raised when a snapshot was built from a different catalogue version"""
+
+
+# ============================================================================
+# Catalogue Version
+# ============================================================================
+
+def get_catalogue_version(engine) -> str:
+    """Current version of the products table (catalogue_version row)"""
+    with Session(engine) as session:
+        return session.execute(CATALOGUE_VERSION_SQL).scalar()
+
+
+# ============================================================================
+# Write
+# ============================================================================
+
+def _align(offset: int) -> int:
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def write_snapshot(path: Path, table: ProductTable, catalogue_version: str) -> Path:
+    """
+    Write a product table to a snapshot file.
+
+    The file is written next to the target and renamed into place, so a
+    crashed export never leaves a half-written snapshot behind.
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    arrays = {
+        "id": table.ids,
+        "embedding": table.embeddings,
+        "has_embedding": table.has_embedding,
+        "expert_embedding": table.expert_embeddings,
+        "expert_slot": table.expert_slot,
+    }
+    for name in FLOAT_COLUMNS:
+        arrays[name] = table.floats[name]
+    for name in INTERNED_COLUMNS:
+        arrays[f"{name}.codes"] = table.interned[name].codes
+
+    # Offsets are relative to the start of the data section
+    sections = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _align(offset)
+        sections[name] = {
+            "offset": offset,
+            "dtype": array.dtype.str,
+            "shape": list(array.shape),
+        }
+        offset += array.nbytes
+
+    header = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "catalogue_version": catalogue_version,
+        "created_at": datetime.now().isoformat(),
+        "count": len(table),
+        "texts": table.texts,
+        "key_params": table.key_params,
+        "vocab": {name: table.interned[name].values for name in INTERNED_COLUMNS},
+        "arrays": sections,
+    }, ensure_ascii=False).encode("utf-8")
+
+    data_start = _align(_PREAMBLE.size + len(header))
+
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, array in arrays.items():
+            f.seek(data_start + sections[name]["offset"])
+            f.write(np.ascontiguousarray(array).tobytes())
+    tmp_path.replace(path)
+
+    logger.info(f"Snapshot written: {path} ({len(table)} products, version {catalogue_version})")
+    return path
+
+
+# ============================================================================
+# Read
+# ============================================================================
+
+def read_snapshot(path: Path, expected_version: Optional[str] = None) -> ProductTable:
+    """
+    Read a snapshot file.
+
+    Returns: ProductTable whose array columns are memory-mapped read-only.
+
+    Raises:
+        SnapshotVersionMismatch: expected_version given and does not match
+        ValueError: file is not a snapshot or has an unsupported format
+    """
+    path = Path(path)
+    with open(path, "rb") as f:
+        magic, format_version, header_len = _PREAMBLE.unpack(f.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a product snapshot")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format {format_version} (expected {FORMAT_VERSION})")
+        header = json.loads(f.read(header_len).decode("utf-8"))
+
+    if expected_version is not None and header["catalogue_version"] != expected_version:
+        raise SnapshotVersionMismatch(
+            f"Snapshot version {header['catalogue_version']} != catalogue version {expected_version}"
+        )
+
+    data_start = _align(_PREAMBLE.size + header_len)
+    arrays = {}
+    for name, section in header["arrays"].items():
+        shape = tuple(section["shape"])
+        if 0 in shape:
+            arrays[name] = np.zeros(shape, dtype=np.dtype(section["dtype"]))
+            continue
+        arrays[name] = np.memmap(
+            path, mode="r", dtype=np.dtype(section["dtype"]),
+            offset=data_start + section["offset"], shape=shape,
+        )
+
+    return ProductTable(
+        ids=arrays["id"],
+        floats={name: arrays[name] for name in FLOAT_COLUMNS},
+        interned={
+            name: InternedColumn(arrays[f"{name}.codes"], header["vocab"][name])
+            for name in INTERNED_COLUMNS
+        },
+        texts={name: header["texts"][name] for name in TEXT_COLUMNS},
+        key_params=[params or {} for params in header["key_params"]],
+        embeddings=arrays["embedding"],
+        has_embedding=arrays["has_embedding"],
+        expert_embeddings=arrays["expert_embedding"],
+        expert_slot=arrays["expert_slot"],
+    )
@@ -0,0 +1,23 @@
+"""
+Sparse Ops - numpy helpers shared by the CSR indexes
+
+sum_by_node adds up weights per node id, as the feedback graph does for
+gathered neighbors and the lexical index for gathered postings.
+"""
+from typing import Tuple
+
+import numpy as np
+
+DENSE_SUM_RATIO = 16     # Sum over a dense array when nodes > n_nodes / DENSE_SUM_RATIO
+
+
+def sum_by_node(nodes: np.ndarray, weights: np.ndarray, n_nodes: int,
+                dense_ratio: float = DENSE_SUM_RATIO) -> Tuple[np.ndarray, np.ndarray]:
+    """(distinct nodes ascending, summed weights): sort-based when short, dense bincount when long"""
+    if len(nodes) * dense_ratio < n_nodes:
+        nodes, inverse = np.unique(nodes, return_inverse=True)
+        return nodes, np.bincount(inverse, weights=weights, minlength=len(nodes))
+    sums = np.bincount(nodes, weights=weights, minlength=n_nodes)
+    nodes = np.sort(nodes)
+    nodes = nodes[np.r_[True, nodes[1:] != nodes[:-1]]]
+    return nodes, sums[nodes]
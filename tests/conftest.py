@@ -0,0 +1,19 @@
+"""
+Unit tests: no database, Ollama or LLM server needed.
+
+(recsys/test_local.py is the manual end-to-end script against a running
+database and is not collected.)
+"""
+import os
+import sys
+
+# Settings require these (before importing app / recsys modules!)
+os.environ.setdefault("DB_HOST", "localhost")
+os.environ.setdefault("DB_PORT", "5433")
+os.environ.setdefault("DB_USER", "postgres")
+os.environ.setdefault("DB_PASSWORD", "postgres")
+os.environ.setdefault("DB_DB", "recsys")
+os.environ.setdefault("OLLAMA_HOST", "localhost")
+os.environ.setdefault("OLLAMA_PORT", "11434")
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
@@ -0,0 +1,104 @@
+"""CircuitBreaker state machine on a fake clock"""
+import threading
+
+import pytest
+
+from recsys.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def ok():
+    return "ok"
+
+
+def boom():
+    raise RuntimeError("boom")
+
+
+def fail(breaker, times):
+    for _ in range(times):
+        with pytest.raises(RuntimeError):
+            breaker.call(boom)
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def breaker(clock):
+    return CircuitBreaker("test", failure_threshold=3, reset_timeout=10.0, clock=clock)
+
+
+def test_opens_after_consecutive_failures(breaker):
+    fail(breaker, 2)
+    assert breaker.call(ok) == "ok"  # A success resets the count
+    fail(breaker, 2)
+    assert breaker.state == CLOSED
+
+    fail(breaker, 1)
+    assert breaker.state == OPEN
+    assert breaker.metrics() == {"state": OPEN, "consecutive_failures": 3, "times_opened": 1, "rejected": 0}
+
+
+def test_open_rejects_until_reset_timeout(breaker, clock):
+    fail(breaker, 3)
+    calls = []
+    clock.now += 9.999
+    with pytest.raises(CircuitOpenError):
+        breaker.call(lambda: calls.append(1))
+    assert calls == [] and breaker.rejected == 1
+
+    clock.now += 0.001
+    assert breaker.call(ok) == "ok"
+    assert breaker.state == CLOSED
+    assert breaker.metrics()["consecutive_failures"] == 0
+
+
+def test_half_open_failure_reopens_for_a_full_timeout(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10.0
+    fail(breaker, 1)  # The probe fails
+    assert breaker.state == OPEN
+    assert breaker.times_opened == 2
+
+    clock.now += 5.0
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+    clock.now += 5.0
+    assert breaker.call(ok) == "ok"
+    assert breaker.state == CLOSED
+
+
+def test_half_open_lets_one_probe_through(breaker, clock):
+    fail(breaker, 3)
+    clock.now += 10.0
+    probe_started, release = threading.Event(), threading.Event()
+
+    def slow_probe():
+        probe_started.set()
+        release.wait(5)
+        return "probe"
+
+    results = []
+    probe = threading.Thread(target=lambda: results.append(breaker.call(slow_probe)))
+    probe.start()
+    assert probe_started.wait(5)
+    assert breaker.state == HALF_OPEN
+    # Other calls are rejected while the probe is in flight
+    with pytest.raises(CircuitOpenError):
+        breaker.call(ok)
+
+    release.set()
+    probe.join(5)
+    assert results == ["probe"]
+    assert breaker.state == CLOSED
+    assert breaker.call(ok) == "ok"
@@ -0,0 +1,71 @@
+"""Binary COPY payload: decoded field by field with struct, independently of numpy"""
+import hashlib
+import struct
+
+import numpy as np
+
+from recsys.embedding_generation import PROMPT_HASH_LENGTH, pack_copy_binary
+
+SIGNATURE = b"PGCOPY\n\xff\r\n\x00"
+
+
+def decode(payload: bytes):
+    """(id, dim, unused, values, hash) per tuple of a (bigint, vector, text) COPY stream"""
+    assert payload[:len(SIGNATURE)] == SIGNATURE
+    offset = len(SIGNATURE)
+    flags, extension_length = struct.unpack_from(">ii", payload, offset)
+    assert (flags, extension_length) == (0, 0)
+    offset += 8
+
+    rows = []
+    while True:
+        (fields,) = struct.unpack_from(">h", payload, offset)
+        offset += 2
+        if fields == -1:
+            break
+        assert fields == 3
+
+        id_length, product_id = struct.unpack_from(">iq", payload, offset)
+        assert id_length == 8
+        offset += 12
+
+        vector_length, dim, unused = struct.unpack_from(">iHH", payload, offset)
+        assert vector_length == 4 + 4 * dim
+        offset += 8
+        values = struct.unpack_from(f">{dim}f", payload, offset)
+        offset += 4 * dim
+
+        (hash_length,) = struct.unpack_from(">i", payload, offset)
+        offset += 4
+        prompt_hash = payload[offset:offset + hash_length].decode("ascii")
+        offset += hash_length
+        rows.append((product_id, dim, unused, values, prompt_hash))
+
+    assert offset == len(payload)
+    return rows
+
+
+def test_round_trip():
+    vectors = np.array([[0.5, -1.25, 3.0], [1e-3, 0.0, -7.5]], dtype=np.float32)
+    hashes = [hashlib.sha256(b"a").hexdigest(), hashlib.sha256(b"b").hexdigest()]
+
+    rows = decode(pack_copy_binary(np.array([7, 2**40 + 1]), vectors, hashes))
+
+    assert [row[0] for row in rows] == [7, 2**40 + 1]
+    assert [(row[1], row[2]) for row in rows] == [(3, 0), (3, 0)]
+    assert [row[3] for row in rows] == [tuple(v) for v in vectors.tolist()]
+    assert [row[4] for row in rows] == hashes
+
+
+def test_record_size():
+    dim = 2
+    payload = pack_copy_binary(np.arange(5), np.ones((5, dim), dtype=np.float32), ["0" * PROMPT_HASH_LENGTH] * 5)
+    # field count + id + vector (dim, unused, values) + hash
+    record = 2 + (4 + 8) + (4 + 4 + 4 * dim) + (4 + PROMPT_HASH_LENGTH)
+    assert len(payload) == len(SIGNATURE) + 8 + 5 * record + 2
+    assert payload[-2:] == b"\xff\xff"
+
+
+def test_empty_batch():
+    payload = pack_copy_binary(np.empty(0, dtype=np.int64), np.empty((0, 4), dtype=np.float32), [])
+    assert decode(payload) == []
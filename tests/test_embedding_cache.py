@@ -0,0 +1,75 @@
+"""Embedding cache: round trip, reopen, and recovery from interrupted writes"""
+import hashlib
+
+import numpy as np
+import pytest
+
+from recsys.embedding_cache import KEY_SIZE, EmbeddingCache
+
+
+def key(i: int) -> str:
+    return hashlib.sha256(str(i).encode()).hexdigest()
+
+
+def vectors(*rows):
+    return np.array(rows, dtype=np.float32)
+
+
+def test_round_trip_and_reopen(tmp_path):
+    cache = EmbeddingCache("model/v1", tmp_path)
+    assert cache.put_many([key(1), key(2)], vectors([1, 2], [3, 4])) == 2
+    # Already cached keys and duplicates are not appended again
+    assert cache.put_many([key(2), key(3), key(3)], vectors([0, 0], [5, 6], [7, 8])) == 1
+
+    reopened = EmbeddingCache("model/v1", tmp_path)
+    found, stored = reopened.get_many([key(3), key(9), key(1)])
+    assert found.tolist() == [True, False, True]
+    np.testing.assert_array_equal(stored, vectors([5, 6], [1, 2]))
+    assert len(reopened) == 3
+
+
+def test_other_dimension_is_not_cached(tmp_path):
+    cache = EmbeddingCache("m", tmp_path)
+    cache.put_many([key(1)], vectors([1, 2]))
+    assert cache.put_many([key(2)], vectors([1, 2, 3])) == 0
+    assert cache.get_many([key(2)])[0].tolist() == [False]
+
+
+def test_torn_vector_write_is_cut_off(tmp_path):
+    cache = EmbeddingCache("m", tmp_path)
+    cache.put_many([key(1), key(2)], vectors([1, 2], [3, 4]))
+    with open(cache.data_path, "ab") as f:
+        f.write(b"\x00" * 6)   # interrupted in the middle of the next vector
+
+    cache = EmbeddingCache("m", tmp_path)
+    cache.put_many([key(3)], vectors([9, 10]))
+    cache = EmbeddingCache("m", tmp_path)
+
+    found, stored = cache.get_many([key(1), key(2), key(3)])
+    assert found.all()
+    np.testing.assert_array_equal(stored, vectors([1, 2], [3, 4], [9, 10]))
+
+
+@pytest.mark.parametrize("extra_key_bytes", [KEY_SIZE, 5])
+def test_keys_without_vectors_are_cut_off(tmp_path, extra_key_bytes):
+    cache = EmbeddingCache("m", tmp_path)
+    cache.put_many([key(1)], vectors([1, 2]))
+    with open(cache.index_path, "ab") as f:
+        f.write(bytes.fromhex(key(2))[:extra_key_bytes])
+
+    cache = EmbeddingCache("m", tmp_path)
+    assert len(cache) == 1 and cache.get_many([key(2)])[0].tolist() == [False]
+    cache.put_many([key(2)], vectors([3, 4]))
+    found, stored = EmbeddingCache("m", tmp_path).get_many([key(1), key(2)])
+    assert found.all()
+    np.testing.assert_array_equal(stored, vectors([1, 2], [3, 4]))
+
+
+def test_torn_header_starts_empty(tmp_path):
+    cache = EmbeddingCache("m", tmp_path)
+    cache.data_path.write_bytes(b"EMBC")
+
+    cache = EmbeddingCache("m", tmp_path)
+    assert len(cache) == 0 and cache.dim is None
+    cache.put_many([key(1)], vectors([1, 2]))
+    np.testing.assert_array_equal(EmbeddingCache("m", tmp_path).get_many([key(1)])[1], vectors([1, 2]))
@@ -0,0 +1,46 @@
+"""Feature build on the process pool: same frames, same order as in-process"""
+import pytest
+
+from recsys import feature_engineering as fe
+from recsys.benchmark_features import make_catalogue
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    df = make_catalogue(700, seed=3)
+    whitelist, _ = fe.generate_whitelist_from_data(df)
+    return df, whitelist
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_ordered_build_matches_serial(catalogue, workers):
+    df, whitelist = catalogue
+    frames = [df.iloc[start:start + 50] for start in range(0, len(df), 50)]
+
+    built = list(fe.build_features_ordered(iter(frames), whitelist, workers))
+
+    assert len(built) == len(frames)
+    for frame, features in zip(frames, built):
+        assert features.to_csv() == fe.build_features(frame, whitelist).to_csv()
+
+
+def test_parallel_build_matches_serial(catalogue):
+    df, whitelist = catalogue
+    expected = fe.build_features(df, whitelist)
+    actual = fe.build_features_parallel(df, whitelist, workers=2, chunk_size=120)
+    assert actual.to_csv() == expected.to_csv()
+
+
+def test_ordered_build_reads_bounded_ahead(catalogue):
+    df, whitelist = catalogue
+    read = []
+
+    def frames():
+        for start in range(0, len(df), 10):
+            read.append(start)
+            yield df.iloc[start:start + 10]
+
+    built = fe.build_features_ordered(frames(), whitelist, 2)
+    next(built)
+    built.close()
+    assert len(read) <= 2 * fe.PARALLEL_CHUNKS_PER_WORKER
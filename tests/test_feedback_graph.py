@@ -0,0 +1,103 @@
+"""FeedbackGraph: incremental adds agree with a bulk rebuild, across compactions"""
+import random
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine, insert
+
+from app.models import Feedback
+from recsys.category_complements import CategoryComplements
+from recsys.db_repository import ProductRepository
+from recsys.feedback_graph import COMPACT_EVERY, FeedbackGraph, load_graph
+from recsys.product_table import ProductTable
+
+N_MAIN = 40
+N_ACCESSORY = 60
+
+
+def random_edges(n_edges, seed=0):
+    """(main row, accessory row) pairs with repeats, over disjoint main / accessory rows"""
+    rng = random.Random(seed)
+    return [(rng.randrange(N_MAIN), N_MAIN + rng.randrange(N_ACCESSORY)) for _ in range(n_edges)]
+
+
+def bulk(edges, n_nodes=N_MAIN + N_ACCESSORY):
+    mains, accessories = zip(*edges)
+    return FeedbackGraph(n_nodes, mains, accessories, np.ones(len(edges)))
+
+
+def assert_same_recall(graph, expected, limit=10):
+    for main_row in range(N_MAIN):
+        rows, scores = graph.recall(main_row, limit=limit)
+        expected_rows, expected_scores = expected.recall(main_row, limit=limit)
+        assert rows.tolist() == expected_rows.tolist(), main_row
+        np.testing.assert_allclose(scores, expected_scores)
+        assert graph.liked(main_row).tolist() == expected.liked(main_row).tolist()
+
+
+def test_recall_same_before_and_after_compaction():
+    edges = random_edges(COMPACT_EVERY + 100)
+    graph = FeedbackGraph(N_MAIN + N_ACCESSORY, compact_every=COMPACT_EVERY)
+
+    for main_row, accessory_row in edges[:COMPACT_EVERY - 1]:
+        graph.add(main_row, accessory_row)
+    # Everything still in the delta
+    assert graph._delta_edges == COMPACT_EVERY - 1
+    assert_same_recall(graph, bulk(edges[:COMPACT_EVERY - 1]))
+
+    graph.add(*edges[COMPACT_EVERY - 1])
+    # The COMPACT_EVERY-th edge merged the delta into the CSR arrays
+    assert graph._delta_edges == 0
+    assert graph.edge_count == len(set(edges[:COMPACT_EVERY]))
+    assert_same_recall(graph, bulk(edges[:COMPACT_EVERY]))
+
+    # CSR plus a fresh delta
+    for main_row, accessory_row in edges[COMPACT_EVERY:]:
+        graph.add(main_row, accessory_row)
+    assert_same_recall(graph, bulk(edges))
+
+
+@pytest.mark.parametrize("compact_every", [1, 7, 10**9])
+def test_incremental_matches_bulk(compact_every):
+    edges = random_edges(300, seed=compact_every)
+    # Bulk-built graph, then feedback arriving one edge at a time
+    mains, accessories = zip(*edges[:50])
+    graph = FeedbackGraph(N_MAIN + N_ACCESSORY, mains, accessories, np.ones(50), compact_every=compact_every)
+    for main_row, accessory_row in edges[50:]:
+        graph.add(main_row, accessory_row)
+    assert_same_recall(graph, bulk(edges))
+
+
+@pytest.fixture
+def catalogue():
+    """Product table + sqlite feedback (positive, negative, and for an unknown product)"""
+    engine = create_engine("sqlite://")
+    Feedback.__table__.create(engine)
+
+    rows = [{"id": 100 + row, "name": f"Товар {row}", "category_id": str(row % 5),
+             "product_role": "основной товар" if row < N_MAIN else "сопутка"}
+            for row in range(N_MAIN + N_ACCESSORY)]
+    rng = random.Random(3)
+    feedback = [{"product_id": 100 + main_row, "recommended_product_id": 100 + accessory_row,
+                 "is_relevant": rng.random() < 0.8}
+                for main_row, accessory_row in random_edges(400, seed=3)]
+    feedback += [{"product_id": 100, "recommended_product_id": 10**6, "is_relevant": True}]
+    with engine.begin() as connection:
+        connection.execute(insert(Feedback.__table__), feedback)
+    return engine, ProductTable.from_rows(rows, dim=4), feedback
+
+
+@pytest.mark.parametrize("compact_every", [7, COMPACT_EVERY])
+def test_add_feedback_matches_load_graph(catalogue, compact_every):
+    engine, table, feedback = catalogue
+    repository = SimpleNamespace(
+        _table=table,
+        _feedback_graph=FeedbackGraph(len(table), compact_every=compact_every),
+        _complements=CategoryComplements(table),
+    )
+    for row in feedback:
+        if row["is_relevant"]:
+            ProductRepository.add_feedback(repository, row["product_id"], row["recommended_product_id"])
+
+    assert_same_recall(repository._feedback_graph, load_graph(engine, table))
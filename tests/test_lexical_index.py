@@ -0,0 +1,162 @@
+"""LexicalIndex search against a brute-force BM25 over the same documents"""
+import math
+import random
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from recsys.lexical_index import (
+    BM25_B, BM25_K1, MAX_DF_RATIO, TRIGRAM_WEIGHT, LexicalIndex, analyze, product_text,
+)
+from recsys.product_table import ProductTable
+
+WORDS = ["саморез", "саморезы", "шуруп", "профиль", "потолочный", "дюбель", "гвоздь",
+         "60х27", "мм", "оцинкованный", "knauf", "гипсокартон", "лента", "серпянка",
+         "металлу", "шайба", "гайка", "болт", "анкер", "уголок", "подвес", "прямой",
+         "шпаклёвка", "грунтовка", "кисть", "валик", "скотч", "малярный", "клей", "плиточный"]
+COMMON = "товар"  # In every document: a stop term
+
+
+def make_table(n=120, seed=0):
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n):
+        # Zipf-like word choice, so document frequencies differ
+        words = rng.choices(WORDS, weights=[1 / math.sqrt(k + 1) for k in range(len(WORDS))],
+                            k=rng.randint(1, 4))
+        rows.append({
+            "id": 1000 + i,
+            "name": " ".join([COMMON] + words),
+            "category_name": rng.choice(["Крепёж", "Профили", None]),
+            "key_params": rng.choices([None, {"Материал": "сталь"}, {"Артикул": "QZX-777", "Длина": 3000}],
+                                      weights=[6, 3, 1])[0],
+        })
+    return ProductTable.from_rows(rows, dim=4)
+
+
+class BruteForce:
+    """Textbook BM25 per term kind (tokens, trigrams), stop terms by document frequency"""
+
+    def __init__(self, table, doc_rows):
+        self.doc_rows = list(doc_rows)
+        self.kinds = {}
+        for kind, boost in (("tokens", 1.0), ("grams", TRIGRAM_WEIGHT)):
+            docs = [Counter(analyze(product_text(table, row))[kind == "grams"]) for row in self.doc_rows]
+            n = len(docs)
+            avg_length = sum(sum(doc.values()) for doc in docs) / n
+            df = Counter(term for doc in docs for term in doc)
+            indexed = {term: math.log(1 + (n - count + 0.5) / (count + 0.5))
+                       for term, count in df.items() if count <= max(1, MAX_DF_RATIO * n)}
+            self.kinds[kind] = (docs, avg_length, indexed, df, boost)
+
+    def terms(self, text):
+        """(idf, df, kind, term) of the distinct indexed query terms"""
+        tokens, grams = analyze(text)
+        found = []
+        for kind, query in (("tokens", tokens), ("grams", grams)):
+            _, _, indexed, df, _ = self.kinds[kind]
+            found += [(indexed[term], df[term], kind, term) for term in set(query) if term in indexed]
+        return sorted(found, key=lambda term: -term[0])
+
+    def scores(self, terms):
+        """table row -> summed BM25 weight over the given (kind, term) pairs"""
+        scores = {}
+        for kind, term in terms:
+            docs, avg_length, indexed, _, boost = self.kinds[kind]
+            for row, doc in zip(self.doc_rows, docs):
+                tf = doc.get(term, 0)
+                if tf:
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * sum(doc.values()) / avg_length)
+                    scores[row] = scores.get(row, 0.0) + boost * indexed[term] * tf * (BM25_K1 + 1) / (tf + norm)
+        return scores
+
+
+def assert_matches(rows, scores, expected, limit):
+    assert np.all(np.diff(scores) <= 1e-9)
+    ranked = sorted(expected.items(), key=lambda item: (-item[1], item[0]))
+    assert len(rows) == min(limit, len(ranked))
+    # float32 postings: scores within a tolerance; rows by their own score,
+    # so either side of a tie at the cut is accepted
+    np.testing.assert_allclose(scores, [score for _, score in ranked[:len(rows)]], rtol=1e-5)
+    for row, score in zip(rows.tolist(), scores.tolist()):
+        assert math.isclose(expected[row], score, rel_tol=1e-5)
+
+
+@pytest.fixture(scope="module")
+def catalogue():
+    table = make_table()
+    doc_rows = np.arange(0, len(table), 2)  # Every other product is indexed
+    return table, LexicalIndex.build(table, doc_rows), BruteForce(table, doc_rows.tolist())
+
+
+QUERIES = ["саморезы по металлу", "Профиль потолочный ПП 60х27 мм", "шурупы", "серпянка лента knauf",
+           "гипсокартон Крепёж сталь", "Клей плиточный 25 кг"]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_scores_match_brute_force(catalogue, query):
+    table, index, brute = catalogue
+    expected = brute.scores((kind, term) for _, _, kind, term in brute.terms(query))
+    assert expected
+    for limit in (1, 5, len(table)):
+        rows, scores = index.search(query, limit=limit, max_postings=10**9)
+        assert_matches(rows, scores, expected, limit)
+
+
+def test_exclude_row(catalogue):
+    table, index, _ = catalogue
+    rows, _ = index.search(QUERIES[0], limit=len(table), max_postings=10**9)
+    excluded, _ = index.search(QUERIES[0], limit=len(table), max_postings=10**9, exclude_row=int(rows[0]))
+    assert excluded.tolist() == [row for row in rows.tolist() if row != rows[0]]
+
+
+@pytest.mark.parametrize("query", QUERIES)
+def test_postings_budget_takes_rarest_terms(catalogue, query):
+    table, index, brute = catalogue
+    terms = brute.terms(query)
+    # Budgets at idf boundaries: every term at least as rare as the cut is read
+    for cut in range(1, len(terms) + 1):
+        if cut < len(terms) and terms[cut][0] == terms[cut - 1][0]:
+            continue
+        budget = sum(df for _, df, _, _ in terms[:cut])
+        expected = brute.scores((kind, term) for _, _, kind, term in terms[:cut])
+        rows, scores = index.search(query, limit=len(table), max_postings=budget)
+        assert_matches(rows, scores, expected, len(table))
+
+        rows, scores = index.search(query, limit=len(table), max_terms=cut, max_postings=10**9)
+        assert_matches(rows, scores, expected, len(table))
+
+
+def test_budget_below_one_term_still_reads_the_rarest(catalogue):
+    table, index, brute = catalogue
+    terms = brute.terms(QUERIES[1])
+    rows, _ = index.search(QUERIES[1], limit=len(table), max_postings=0)
+    rarest = [(kind, term) for idf, _, kind, term in terms if idf == terms[0][0]]
+    assert any(set(brute.scores([term])) == set(rows.tolist()) for term in rarest)
+
+
+def test_stop_terms_and_blacklisted_keys_not_indexed(catalogue):
+    _, index, _ = catalogue
+    # In every document: above MAX_DF_RATIO, for the token and all its trigrams
+    assert COMMON not in index.tokens.spans
+    assert index.search(COMMON)[0].size == 0
+    # key_params values of blacklisted keys ("Артикул") are not document text
+    assert index.search("QZX-777")[0].size == 0
+    assert "3000" in index.tokens.spans
+
+
+def test_stop_term_boundary():
+    # 8 documents: a term in 2 (= MAX_DF_RATIO * 8) is indexed, a term in 3 is not
+    names = ["ровно"] * 2 + ["больше"] * 3 + ["другое", "иное", "прочее"]
+    table = ProductTable.from_rows([{"id": i, "name": name} for i, name in enumerate(names)], dim=4)
+    index = LexicalIndex.build(table, np.arange(len(names)))
+    assert MAX_DF_RATIO * len(names) == 2
+    assert index.search("ровно")[0].tolist() == [0, 1]
+    assert "больше" not in index.tokens.spans
+    assert index.search("больше")[0].size == 0
+
+
+def test_empty_index():
+    rows, scores = LexicalIndex.empty().search("саморез")
+    assert rows.size == 0 and scores.size == 0
@@ -0,0 +1,112 @@
+"""LLM generation against a local OpenAI-compatible stub server"""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from recsys import llm_generation
+from recsys.product_table import ProductTable
+
+
+class StubLLM(BaseHTTPRequestHandler):
+    """POST /v1/chat/completions: a JSON array of accessory names; first request of product 2 fails"""
+    requests = []
+    fail_once = set()
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        StubLLM.requests.append((self.path, payload, self.headers.get("Authorization")))
+        user = payload["messages"][-1]["content"]
+        if user in StubLLM.fail_once:
+            StubLLM.fail_once.discard(user)
+            self.send_response(500)
+            self.end_headers()
+            return
+        body = json.dumps({
+            "choices": [{"message": {"content": '```json\n["Саморез", "Дюбель"]\n```'}}],
+            "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+        }).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub_url():
+    StubLLM.requests = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubLLM)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1/"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def ingested(monkeypatch):
+    """ingest_recommendations without a database: records the ingested results"""
+    calls = []
+    monkeypatch.setattr(llm_generation, "ingest_recommendations",
+                        lambda engine, results, replace: calls.extend(results))
+    return calls
+
+
+def products():
+    table = ProductTable.from_rows(
+        ({"id": i, "name": f"Гипсокартон {i}", "category_name": "Листовые", "parent_name": "Стройматериалы",
+          "product_role": "основной товар"} for i in (1, 2, 3)),
+        dim=4,
+    )
+    return [table.record(row) for row in range(len(table))]
+
+
+def run(stub_url, tmp_path, **kwargs):
+    return asyncio.run(llm_generation.generate(
+        products(), engine=None, api_url=stub_url, model="stub-model", api_key="secret",
+        mode="full", cache_path=tmp_path / "cache.jsonl", checkpoint_path=tmp_path / "checkpoint.jsonl",
+        output_path=tmp_path / "output.json", **kwargs,
+    ))
+
+
+def test_generate_against_stub_server(stub_url, tmp_path, ingested):
+    StubLLM.fail_once = {llm_generation.build_messages(products()[1])[-1]["content"]}
+
+    stats = run(stub_url, tmp_path)
+
+    assert stats["success"] == 3 and stats["failed"] == 0
+    assert stats["requests"] == 3 and stats["cache_hits"] == 0
+    assert stats["token_usage"]["total_tokens"] == 45
+    # 3 products + 1 retry of the 500
+    assert len(StubLLM.requests) == 4
+    path, payload, auth = StubLLM.requests[0]
+    assert path == "/v1/chat/completions" and payload["model"] == "stub-model" and auth == "Bearer secret"
+    assert sorted(r["product_id"] for r in ingested) == [1, 2, 3]
+    assert all(r["recommendations"] == ["Саморез", "Дюбель"] for r in ingested)
+
+    output = json.loads((tmp_path / "output.json").read_text(encoding="utf-8"))
+    assert output["success_count"] == 3 and output["token_usage"]["total_tokens"] == 45
+    assert not (tmp_path / "checkpoint.jsonl").exists()
+
+
+def test_repeated_run_is_served_from_cache(stub_url, tmp_path, ingested):
+    StubLLM.fail_once = set()
+    run(stub_url, tmp_path)
+    StubLLM.requests = []
+
+    stats = run(stub_url, tmp_path)
+
+    assert StubLLM.requests == []
+    assert stats["success"] == 3 and stats["cache_hits"] == 3 and stats["tokens_saved"] == 45
+
+
+def test_missing_api_url_fails_fast(tmp_path, ingested):
+    with pytest.raises(ValueError, match="LLM_API_URL"):
+        run("", tmp_path)
+    assert ingested == []
@@ -0,0 +1,123 @@
+"""ProductTable: indexed filters, id lookup and record views against plain dicts"""
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from recsys.product_table import COLUMNS, INDEXED_COLUMNS, ProductTable
+
+DIM = 4
+ROLES = ["сопутка", "основной товар", None]
+TYPES = ["Монтаж", "Крепёж", "", None]
+CATEGORIES = [("10", "Профили"), ("11", "Крепёж"), ("12", None), (None, None)]
+
+
+def make_rows(n, seed=0):
+    """Product dicts in the form of the former repository dicts, ids shuffled and sparse"""
+    rng = random.Random(seed)
+    ids = rng.sample(range(1, 10 * n + 1), n)
+    rows = []
+    for product_id in ids:
+        category_id, category_name = rng.choice(CATEGORIES)
+        rows.append({
+            "id": product_id,
+            "name": f"Товар {product_id}",
+            "price": rng.choice([None, 0.0, 12.5, 990.0]),
+            "product_role": rng.choice(ROLES),
+            "category_id": category_id,
+            "category_name": category_name,
+            "type": rng.choice(TYPES),
+            "parent_id": rng.choice(["1", None]),
+            "parent_name": rng.choice(["Стройматериалы", ""]),
+            "vendor": rng.choice(["Knauf", None]),
+            "picture_url": rng.choice([f"https://img/{product_id}.png", None]),
+            "url": f"https://shop/{product_id}",
+            "description": rng.choice(["", "Описание", None]),
+            "weight_kg": rng.choice([None, 1.5]),
+            "shipping_weight_kg": rng.choice([None, 2.0]),
+            "volume_l": rng.choice([None, 0.75]),
+            "length_mm": rng.choice([None, 3000.0]),
+            "key_params": rng.choice([None, {}, {"Материал": "сталь", "Длина": 3000}]),
+            "embedding": rng.choice([None, [float(product_id), 1.0, 0.0, -0.5]]),
+        })
+    return rows
+
+
+def brute_force(rows, **values):
+    return sorted(r["id"] for r in rows if all(r[column] == value for column, value in values.items()))
+
+
+@pytest.mark.parametrize("n", [0, 1, 60])
+def test_rows_where_matches_brute_force(n):
+    rows = make_rows(n)
+    table = ProductTable.from_rows(rows, dim=DIM)
+    options = {
+        "product_role": ROLES + ["нет такой роли"],
+        "type": TYPES + ["Нет такого типа"],
+        "category_id": [c for c, _ in CATEGORIES] + ["999"],
+        "category_name": [c for _, c in CATEGORIES] + ["Нет такой категории"],
+    }
+    for columns in INDEXED_COLUMNS:
+        for combination in itertools.product(*(options[column] for column in columns)):
+            values = dict(zip(columns, combination))
+            found = table.rows_where(**values)
+            assert np.all(np.diff(found) > 0), values
+            assert table.ids[found].tolist() == brute_force(rows, **values), values
+
+
+def test_rows_where_unindexed_combination():
+    table = ProductTable.from_rows(make_rows(5), dim=DIM)
+    with pytest.raises(KeyError):
+        table.rows_where(vendor="Knauf")
+
+
+def test_rows_of_missing_ids():
+    rows = make_rows(30, seed=1)
+    table = ProductTable.from_rows(rows, dim=DIM)
+    present = [r["id"] for r in rows]
+    missing = [0, -5, max(present) + 1, 10**12] + [i for i in range(1, 301) if i not in present][:5]
+
+    queried = present[::3] + missing + present[1::3]
+    found = table.rows_of(queried)
+
+    for product_id, row in zip(queried, found.tolist()):
+        if product_id in missing:
+            assert row == -1
+            assert table.row_of(product_id) is None
+        else:
+            assert table.ids[row] == product_id
+            assert table.row_of(product_id) == row
+    assert table.rows_of([]).tolist() == []
+
+
+def test_rows_of_empty_table():
+    table = ProductTable.from_rows([], dim=DIM)
+    assert table.rows_of([1, 2]).tolist() == [-1, -1]
+    assert table.row_of(1) is None
+
+
+def test_record_matches_dict():
+    rows = make_rows(40, seed=2)
+    table = ProductTable.from_rows(rows, dim=DIM)
+    for expected in rows:
+        record = table.record(table.row_of(expected["id"]))
+        expected = dict(expected, key_params=expected["key_params"] or {})
+        as_dict = record.to_dict()
+
+        assert list(as_dict) == COLUMNS == list(expected)
+        for column in COLUMNS:
+            if column == "embedding":
+                if expected[column] is None:
+                    assert as_dict[column] is None and record.get(column) is None
+                else:
+                    np.testing.assert_array_equal(as_dict[column], expected[column])
+                    np.testing.assert_array_equal(record.get(column), expected[column])
+                continue
+            assert as_dict[column] == expected[column], column
+            assert record[column] == expected[column], column
+            assert record.get(column, "default") == expected[column], column
+        assert record.get("no_such_column") is None
+        assert record.get("no_such_column", 7) == 7
+        with pytest.raises(KeyError):
+            record["no_such_column"]
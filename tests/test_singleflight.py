@@ -0,0 +1,118 @@
+"""SingleFlight: concurrent callers of one key share one execution"""
+import threading
+import time
+
+import pytest
+
+from recsys.singleflight import FlightTimeout, SingleFlight
+
+CALLERS = 8
+
+
+def run_concurrently(flight, key, fn, callers=CALLERS):
+    """Start callers on flight.do(key, fn); fn runs once every other caller is waiting"""
+    outcomes = [None] * callers
+    release = threading.Event()
+    runs = []
+
+    def leader_fn():
+        runs.append(threading.get_ident())
+        release.wait(5)
+        return fn()
+
+    def caller(i):
+        try:
+            outcomes[i] = ("result", flight.do(key, leader_fn))
+        except Exception as e:
+            outcomes[i] = ("error", e)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(callers)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while flight.coalesced < callers - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    return outcomes, runs
+
+
+def test_callers_share_one_execution():
+    flight = SingleFlight()
+    result = {"rows": [1, 2, 3]}
+
+    outcomes, runs = run_concurrently(flight, "key", lambda: result)
+
+    assert len(runs) == 1
+    assert all(kind == "result" and value is result for kind, value in outcomes)
+    assert (flight.executed, flight.coalesced, flight.in_flight()) == (1, CALLERS - 1, 0)
+
+
+def test_callers_all_see_the_leaders_exception():
+    flight = SingleFlight()
+    error = RuntimeError("recall failed")
+
+    def fail():
+        raise error
+
+    outcomes, runs = run_concurrently(flight, "key", fail)
+
+    assert len(runs) == 1
+    assert all(kind == "error" and value is error for kind, value in outcomes)
+    assert flight.in_flight() == 0
+    # Nothing is cached: the next call runs again
+    assert flight.do("key", lambda: "again") == "again"
+    assert flight.executed == 2
+
+
+def test_different_keys_do_not_coalesce():
+    flight = SingleFlight()
+    barrier = threading.Barrier(2, timeout=5)
+
+    def both_running(key):
+        barrier.wait()  # Only passes if both keys run at the same time
+        return key
+
+    results = {}
+    threads = [threading.Thread(target=lambda k=k: results.setdefault(k, flight.do(k, lambda: both_running(k))))
+               for k in ("a", "b")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert results == {"a": "a", "b": "b"}
+    assert (flight.executed, flight.coalesced) == (2, 0)
+
+
+def test_leader_exception_propagates_to_leader():
+    flight = SingleFlight()
+    with pytest.raises(ValueError):
+        flight.do("key", lambda: int("x"))
+    assert flight.in_flight() == 0
+
+
+def test_waiting_caller_timeout_leaves_the_run_alone():
+    flight = SingleFlight()
+    started, release = threading.Event(), threading.Event()
+    results = []
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "done"
+
+    leader = threading.Thread(target=lambda: results.append(flight.do("key", slow)))
+    leader.start()
+    assert started.wait(5)
+
+    start = time.monotonic()
+    with pytest.raises(FlightTimeout):
+        flight.do("key", lambda: "not run", timeout=0.05)
+    assert time.monotonic() - start < 1.0
+    assert flight.timed_out == 1 and flight.in_flight() == 1
+
+    release.set()
+    leader.join(5)
+    assert results == ["done"]
+    assert (flight.executed, flight.coalesced, flight.in_flight()) == (1, 1, 0)
@@ -0,0 +1,96 @@
+"""A hung candidate source cannot hold a request past the ranking deadline"""
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from recsys.candidate_sources import SOURCE_TIMEOUT, SourceResult
+from recsys.category_complements import CategoryComplements
+from recsys.db_repository import ProductRepository
+from recsys.deadline import Deadline
+from recsys.feedback_graph import FeedbackGraph
+from recsys.lexical_index import LexicalIndex
+from recsys.llm_recommendations import LLMRecommendationIndex
+from recsys.product_table import ProductTable
+from recsys.recommender import COALESCED_TIMEOUT, LEXICAL_RECALL, RecommendationEngine
+
+
+class HungSource:
+    """Blocks in recall() like a query waiting on a dead connection"""
+    name = "vector"
+    breaker = None
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def recall(self, main_product, limit, deadline):
+        self.release.wait(10)
+        return SourceResult.empty()
+
+
+def test_single_hung_source_times_out_at_deadline():
+    table = ProductTable.from_rows(({"id": 1, "name": "p1", "product_role": "сопутка"},), dim=4)
+    engine = RecommendationEngine(repository=SimpleNamespace(engine=None, table=table))
+    source = HungSource()
+    engine.sources = [source]
+    try:
+        start = time.perf_counter()
+        results = engine._run_sources(table.record(0), limit=10, deadline=Deadline(100))
+        elapsed = time.perf_counter() - start
+    finally:
+        source.release.set()
+
+    assert elapsed < 1.0
+    assert results[0].degradations == [f"{SOURCE_TIMEOUT}:vector"]
+    assert len(results[0].rows) == 0 and isinstance(results[0].rows, np.ndarray)
+
+
+def in_memory_repository(rows) -> ProductRepository:
+    """ProductRepository over a ProductTable, without a database"""
+    table = ProductTable.from_rows(rows, dim=4)
+    repository = ProductRepository.__new__(ProductRepository)
+    repository.engine = None
+    repository._table = table
+    repository._llm_index = LLMRecommendationIndex.empty()
+    repository._lexical_index = LexicalIndex.build(table, repository.get_accessory_rows())
+    repository._feedback_graph = FeedbackGraph.empty(len(table))
+    repository._complements = CategoryComplements(table)
+    return repository
+
+
+def test_coalesced_request_stops_waiting_at_its_deadline():
+    rows = [{"id": 1, "name": "Профиль потолочный 60х27", "product_role": "основной товар", "price": 100.0}]
+    names = ["Подвес прямой", "Краб соединитель", "Саморез клоп", "Дюбель гвоздь", "Лента серпянка",
+             "Шпаклёвка финишная", "Грунтовка", "Удлинитель потолочного профиля", "Уголок"]
+    rows += [{"id": 2 + i, "name": name, "product_role": "сопутка", "price": 10.0}
+             for i, name in enumerate(names)]
+    engine = RecommendationEngine(repository=in_memory_repository(rows))
+    source = HungSource()
+    engine.sources = [source]
+    engine.ranking_deadline_ms = 100
+
+    # Another request's recall for the same product is still running
+    started, release = threading.Event(), threading.Event()
+
+    def slow_recall():
+        started.set()
+        release.wait(10)
+        return None, []
+
+    leader = threading.Thread(target=lambda: engine._candidate_flight.do((1, True), slow_recall))
+    leader.start()
+    try:
+        assert started.wait(5)
+        start = time.perf_counter()
+        result, degradations = engine.rank(1)
+        elapsed = time.perf_counter() - start
+    finally:
+        release.set()
+        source.release.set()
+        leader.join(5)
+
+    assert elapsed < 1.0
+    assert degradations[:2] == [COALESCED_TIMEOUT, LEXICAL_RECALL]
+    assert result and all(item["id"] != 1 for item in result)
+    assert engine.get_metrics()["ranking_coalesced_timeouts"] == 1
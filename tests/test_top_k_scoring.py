@@ -0,0 +1,88 @@
+"""Branch-and-bound top-K scoring gives the same ranking as scoring every candidate"""
+from dataclasses import replace
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from recsys.candidate_batch import CandidateBatch
+from recsys.deadline import Deadline
+from recsys.product_table import ProductTable
+from recsys.recommender import RecommendationEngine
+
+DIM = 8
+N_CANDIDATES = 300
+MAIN_ID = 1
+
+
+def make_engine(n: int = N_CANDIDATES + 1, seed: int = 0) -> RecommendationEngine:
+    rng = np.random.default_rng(seed)
+    table = ProductTable.from_rows(
+        ({"id": i + 1, "name": f"p{i + 1}", "product_role": "сопутка",
+          "embedding": rng.normal(size=DIM).astype(np.float32)} for i in range(n)),
+        dim=DIM,
+    )
+    return RecommendationEngine(repository=SimpleNamespace(engine=None, table=table))
+
+
+def make_batch(engine: RecommendationEngine, seed: int, cheap_head: bool = False) -> CandidateBatch:
+    """Scored-candidate input as _prepare_candidates builds it (descending base score)"""
+    rng = np.random.default_rng(seed)
+    rows = np.arange(1, N_CANDIDATES + 1)
+    batch = CandidateBatch.from_rows(rows, engine.repo.table.ids[rows], rng.uniform(0.3, 1.0, N_CANDIDATES))
+    base_score, init_similarity = engine._base_scores(batch)
+    price_factor = rng.choice([1.0, 0.85, 0.7], N_CANDIDATES)
+    batch = replace(batch, base_score=base_score, init_similarity=init_similarity,
+                    price_factor=price_factor, price=np.zeros(N_CANDIDATES))
+    batch = batch.take(np.argsort(-base_score, kind='stable'))
+    if cheap_head:
+        # Best-similarity candidates penalized: their scores fall below later bounds
+        factor = batch.price_factor.copy()
+        factor[:engine.top_k_block_size] = 0.7
+        batch = replace(batch, price_factor=factor)
+    return batch
+
+
+def ranking(engine: RecommendationEngine, batch: CandidateBatch, pruned: bool, seed: int):
+    """(ids of the score-sorted top N, ids of the MMR selection)"""
+    np.random.seed(seed)
+    if pruned:
+        scored = engine._score_top_k(MAIN_ID, batch)
+    else:
+        scored = engine._calculate_scores(MAIN_ID, batch)
+    order = np.argsort(-scored.score, kind='stable')
+    top_n = scored.ids[order[:engine.mmr_return_size]].tolist()
+    mmr = None
+    if engine.mmr_enabled:
+        mmr = scored.ids[engine._mmr_rerank(scored, order, Deadline(0))].tolist()
+    return top_n, mmr
+
+
+@pytest.mark.parametrize("demo_mode", [True, False])
+@pytest.mark.parametrize("mmr_enabled", [True, False])
+@pytest.mark.parametrize("mmr_min_score", [0.0, 0.5, 0.8, 1.0])
+@pytest.mark.parametrize("block_size", [20, 64])
+@pytest.mark.parametrize("cheap_head", [False, True])
+def test_pruned_ranking_matches_exhaustive(demo_mode, mmr_enabled, mmr_min_score, block_size, cheap_head):
+    engine = make_engine()
+    engine.demo_mode = demo_mode
+    engine.mmr_enabled = mmr_enabled
+    engine.mmr_min_score = mmr_min_score
+    engine.top_k_block_size = block_size
+    if not demo_mode:
+        # Feedback on one arm makes gamma_max > 0
+        engine.sampler.arm_params[(MAIN_ID, 10)] = (8.0, 4.0)
+        engine.sampler._track_feedback((MAIN_ID, 10))
+
+    for seed in range(10):
+        batch = make_batch(engine, seed, cheap_head)
+        assert ranking(engine, batch, pruned=True, seed=seed) == ranking(engine, batch, pruned=False, seed=seed)
+
+
+def test_pruning_skips_candidates():
+    engine = make_engine()
+    engine.mmr_enabled = False
+    engine.top_k_block_size = 20
+    batch = make_batch(engine, seed=0)
+    np.random.seed(0)
+    assert len(engine._score_top_k(MAIN_ID, batch)) < len(batch)